@@ -63,6 +63,10 @@ class Action(abc.ABC):
     # If an action can't be twice in a rule this must be set to true
     only_once = False
 
+    # If the action result depends on the GitHub mergeable state of the pull
+    # request (e.g. branch protection), this must be set to true
+    depends_on_mergeable_state = False
+
     @property
     @staticmethod
     @abc.abstractmethod
@@ -14,7 +14,9 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+from mergify_engine import ratelimit
 from mergify_engine.actions import copy
+from mergify_engine.worker import app
 
 
 class BackportAction(copy.CopyAction):
@@ -38,6 +40,24 @@ class BackportAction(copy.CopyAction):
     ):
         if not pull.g_pull.merged:
             return None, "Waiting for the pull request to get merged", ""
+
+        delay = ratelimit.defer_if_budget_low(
+            installation_id, "backport", pull_request=pull
+        )
+        if delay:
+            # NOTE(sileht): tasks can't be imported from actions, so we call
+            # the refresh task by its name
+            app.send_task(
+                "mergify_engine.tasks.mergify_events.job_refresh",
+                args=(
+                    pull.g_pull.base.repo.owner.login,
+                    pull.g_pull.base.repo.name,
+                    "pull",
+                    pull.g_pull.number,
+                ),
+                countdown=delay,
+            )
+            return None, "Waiting for the GitHub API rate limit to reset", ""
         return super().run(
             installation_id,
             installation_token,
@@ -24,15 +24,19 @@ import github
 import voluptuous
 
 from mergify_engine import actions
+from mergify_engine import config
 from mergify_engine import duplicate_pull
+from mergify_engine import hydration
+from mergify_engine import pull_index
+from mergify_engine import safe_regex
 
 LOG = daiquiri.getLogger(__name__)
 
 
 def Regex(value):
     try:
-        re.compile(value)
-    except re.error as e:
+        safe_regex.compile(value)
+    except (re.error, safe_regex.UnsafeRegex) as e:
         raise voluptuous.Invalid(str(e))
     return value
 
@@ -55,16 +59,24 @@ class CopyAction(actions.Action):
         pull,
         missing_conditions,
     ):
-        branches = self.config["branches"]
+        branches = list(self.config["branches"])
         if self.config["regexes"]:
-            regexes = list(map(re.compile, self.config["regexes"]))
-            branches.extend(
-                (
-                    branch.name
-                    for branch in pull.g_pull.base.repo.get_branches()
-                    if any(map(lambda regex: regex.match(branch.name), regexes))
+            regexes = list(map(safe_regex.compile, self.config["regexes"]))
+            try:
+                with safe_regex.cpu_budget(config.REGEX_CPU_BUDGET):
+                    branches.extend(
+                        (
+                            branch.name
+                            for branch in pull.g_pull.base.repo.get_branches()
+                            if any(map(lambda regex: regex.match(branch.name), regexes))
+                        )
+                    )
+            except safe_regex.RegexTimeout as e:
+                return (
+                    "failure",
+                    "The branches regexes took too long to evaluate",
+                    str(e),
                 )
-            )
 
         state = "success"
         detail = "The following pull requests have been created: "
@@ -116,7 +128,15 @@ class CopyAction(actions.Action):
     @classmethod
     def get_existing_duplicate_pull(cls, pull, branch):
         bp_branch = duplicate_pull.get_destination_branch_name(pull, branch, cls.KIND)
-        # NOTE(sileht): Github looks buggy here, head= doesn't work as expected
+        repo = pull.g_pull.base.repo
+        numbers = pull_index.get_open_pull_numbers(
+            repo, base_ref=branch.name, head_ref=bp_branch
+        )
+        if numbers:
+            return hydration.get_pull(repo, numbers[-1])
+
+        # NOTE(sileht): The duplicate may have been closed, so look at all of
+        # them. Github looks buggy here, head= doesn't work as expected
         pulls = list(
             p
             for p in pull.g_pull.base.repo.get_pulls(
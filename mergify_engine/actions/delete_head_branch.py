@@ -23,6 +23,7 @@ import github
 import voluptuous
 
 from mergify_engine import actions
+from mergify_engine import pull_index
 
 LOG = daiquiri.getLogger(__name__)
 
@@ -46,16 +47,23 @@ class DeleteHeadBranchAction(actions.Action):
             return
         if pull.g_pull.state == "closed":
             if self.config is None or not self.config["force"]:
-                pulls_using_this_branch = list(
-                    pull.g_pull.base.repo.get_pulls(base=pull.g_pull.head.ref)
+                pulls_using_this_branch = pull_index.get_open_pull_numbers(
+                    pull.g_pull.base.repo, base_ref=pull.g_pull.head.ref
                 )
+                if pulls_using_this_branch is None:
+                    pulls_using_this_branch = [
+                        p.number
+                        for p in pull.g_pull.base.repo.get_pulls(
+                            base=pull.g_pull.head.ref
+                        )
+                    ]
                 if pulls_using_this_branch:
                     return (
                         "success",
                         "Branch `{}` was not deleted "
                         "because it is used by {}".format(
                             pull.g_pull.head.ref,
-                            " ".join("#%d" % p.number for p in pulls_using_this_branch),
+                            " ".join("#%d" % n for n in pulls_using_this_branch),
                         ),
                         "",
                     )
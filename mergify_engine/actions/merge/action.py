@@ -21,6 +21,7 @@ import github
 import voluptuous
 
 from mergify_engine import actions
+from mergify_engine import hydration
 from mergify_engine.actions.merge import helpers
 from mergify_engine.actions.merge import queue
 
@@ -34,6 +35,7 @@ BRANCH_PROTECTION_FAQ_URL = (
 
 class MergeAction(actions.Action):
     only_once = True
+    depends_on_mergeable_state = True
 
     validator = {
         voluptuous.Required("method", default="merge"): voluptuous.Any(
@@ -195,6 +197,9 @@ class MergeAction(actions.Action):
                 LOG.info(
                     "Base branch was modified in the meantime, retrying", pull=pull
                 )
+                hydration.forget_branch_head_sha(
+                    pull.g_pull.base.repo, pull.g_pull.base.ref
+                )
                 pull.g_pull.update()
                 return self._sync_with_base_branch(pull, installation_id)
 
@@ -14,12 +14,11 @@
 
 import daiquiri
 
-import github
-
 from mergify_engine import check_api
-from mergify_engine import config
 from mergify_engine import exceptions
+from mergify_engine import github_app
 from mergify_engine import mergify_pull
+from mergify_engine import ratelimit
 from mergify_engine import utils
 from mergify_engine.actions.merge import helpers
 from mergify_engine.worker import app
@@ -77,21 +76,16 @@ def _move_pull_at_end(pull):  # pragma: no cover
 def _get_next_pull_request(queue):
     _, installation_id, owner, reponame, branch = queue.split("~")
 
-    integration = github.GithubIntegration(config.INTEGRATION_ID, config.PRIVATE_KEY)
-    try:
-        installation_token = integration.get_access_token(installation_id).token
-    except github.UnknownObjectException:  # pragma: no cover
-        LOG.error(
-            "token for install %d does not exists anymore (%s/%s)",
-            installation_id,
-            owner,
-            reponame,
-        )
+    installation_token = github_app.get_installation_token(installation_id)
+    if not installation_token:  # pragma: no cover
         return
 
     redis = utils.get_redis_for_cache()
     pull_numbers = redis.zrange(queue, 0, 0)
     if pull_numbers:
+        # NOTE(sileht): Don't defer the waits here, an unknown mergeable_state
+        # would move the head of the queue to the end, while it's likely
+        # just been rebased
         return mergify_pull.MergifyPull.from_number(
             installation_id, installation_token, owner, reponame, int(pull_numbers[0])
         )
@@ -161,6 +155,11 @@ def smart_strict_workflow_periodic_task():
     for queue in redis.keys("strict-merge-queues~*"):
         LOG.debug("handling queue: %s", queue)
 
+        _, installation_id, _, _, _ = queue.split("~")
+        if ratelimit.defer_if_budget_low(installation_id, "queue", queue=queue):
+            # NOTE(sileht): The next loop will retry
+            continue
+
         pull = None
         try:
             pull = _get_next_pull_request(queue)
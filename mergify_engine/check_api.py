@@ -21,6 +21,8 @@ from mergify_engine import utils
 
 LOG = daiquiri.getLogger(__name__)
 
+PAGE_SIZE = 100
+
 
 class Check(github.GithubObject.NonCompletableGithubObject):  # pragma no cover
     def __repr__(self):
@@ -89,6 +91,11 @@ class Check(github.GithubObject.NonCompletableGithubObject):  # pragma no cover
 
 
 def get_checks_for_ref(repo, sha, parameters=None, mergify_only=False):
+    parameters = dict(parameters or {})
+    if config.LATEST_STATUSES_AND_CHECKS:
+        # NOTE(sileht): Only the last check run of each name matters
+        parameters.update({"filter": "latest", "per_page": PAGE_SIZE})
+
     checks = github.PaginatedList.PaginatedList(
         Check,
         repo._requester,
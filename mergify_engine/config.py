@@ -76,6 +76,34 @@ Schema = voluptuous.Schema(
         voluptuous.Required(
             "CELERY_BROKER_URL", default="redis://localhost:6379/9"
         ): str,
+        voluptuous.Required("HTTP_POOL_MAXSIZE", default=10): voluptuous.Coerce(int),
+        voluptuous.Required("HTTP_CACHE_DIR", default=None): voluptuous.Any(None, str),
+        # NOTE(sileht): Below this number of remaining GitHub API calls,
+        # refreshes, merge queue updates and backports are postponed
+        voluptuous.Required("RATELIMIT_LOW_BUDGET", default=500): voluptuous.Coerce(
+            int
+        ),
+        voluptuous.Required("PULL_REQUEST_INDEX", default=True): CoercedBool,
+        voluptuous.Required("SKIP_IRRELEVANT_EVENTS", default=True): CoercedBool,
+        voluptuous.Required("LAZY_PULL_ATTRIBUTES", default=True): CoercedBool,
+        voluptuous.Required("GRAPHQL_PULL_ATTRIBUTES", default=True): CoercedBool,
+        voluptuous.Required("LATEST_STATUSES_AND_CHECKS", default=True): CoercedBool,
+        # NOTE(sileht): Retry tasks later instead of sleeping when GitHub is
+        # still computing the mergeable state or the new head of a pull request
+        voluptuous.Required("DEFER_GITHUB_WAITS", default=True): CoercedBool,
+        voluptuous.Required("COMPARE_IS_BEHIND", default=True): CoercedBool,
+        # NOTE(sileht): Only show the failing base conditions of the not
+        # applicable rules in the Summary, so their reviews, checks and files
+        # are not retrieved
+        voluptuous.Required("SUMMARY_BASE_CONDITIONS", default=True): CoercedBool,
+        # NOTE(sileht): CPU seconds the regexes of a rule can use for a pull
+        # request before its evaluation is cancelled
+        voluptuous.Required("REGEX_CPU_BUDGET", default=1.0): voluptuous.Coerce(float),
+        # NOTE(sileht): Number of groups of pull request attributes fetched at
+        # the same time
+        voluptuous.Required("PULL_FETCH_CONCURRENCY", default=4): voluptuous.Coerce(
+            int
+        ),
         voluptuous.Required("CONTEXT", default="mergify"): str,
         voluptuous.Required("GIT_EMAIL", default="noreply@mergify.io"): str,
         # For test suite only (eg: tox -erecord)
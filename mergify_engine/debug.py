@@ -17,14 +17,15 @@ import pprint
 
 import github
 
-import requests
-
 from mergify_engine import check_api
 from mergify_engine import config
+from mergify_engine import github_app
+from mergify_engine import http_pool
 from mergify_engine import mergify_pull
 from mergify_engine import rules
 from mergify_engine import sub_utils
 from mergify_engine import utils
+from mergify_engine.rules import batch
 from mergify_engine.tasks.engine import actions_runner
 
 
@@ -35,7 +36,7 @@ def get_repositories_setuped(token, install_id):  # pragma: no cover
         install_id,
     )
     token = "token {}".format(token)
-    session = requests.Session()
+    session = http_pool.get_session()
     while True:
         response = session.get(
             url,
@@ -64,17 +65,43 @@ def get_repositories_setuped(token, install_id):  # pragma: no cover
 
 
 def create_jwt():
-    integration = github.GithubIntegration(config.INTEGRATION_ID, config.PRIVATE_KEY)
-    return integration.create_jwt()
+    return github_app.get_integration().create_jwt()
+
+
+def report_pulls(g, r, install_id, pull_request_rules):
+    pulls = [mergify_pull.MergifyPull(g, p, install_id) for p in r.get_pulls()]
+    print("* OPEN PULL REQUESTS: %d" % len(pulls))
+    if not pulls:
+        return
+
+    # NOTE(sileht): The teams are the ones of the repository, whatever the pull
+    # request used to resolve them
+    expanders = dict(
+        (attrib, pulls[0].resolve_teams)
+        for attrib in pull_request_rules.PullRequestRuleForPR.TEAM_ATTRIBUTES
+    )
+    columns = batch.get_columns(
+        [p.to_dict() for p in pulls], pull_request_rules.read_attributes
+    )
+    matches = batch.get_pull_requests_rules(
+        pull_request_rules, columns, len(pulls), expanders
+    )
+
+    print("* MERGIFY LIVE MATCHES:")
+    for pull, match in zip(pulls, matches):
+        summary_title, summary = actions_runner.gen_summary("refresh", {}, pull, match)
+        print("> #%d %s: %s" % (pull.g_pull.number, pull.g_pull.title, summary_title))
+        print(summary)
 
 
 def report(url):
     redis = utils.get_redis_for_cache()
-    path = url.replace("https://github.com/", "")
-    owner, repo, _, pull_number = path.split("/")
+    path = url.replace("https://github.com/", "").split("/")
+    owner, repo = path[:2]
+    # NOTE(sileht): A repository url reports all its open pull requests
+    pull_number = path[3] if len(path) > 3 else None
 
-    integration = github.GithubIntegration(config.INTEGRATION_ID, config.PRIVATE_KEY)
-    install_id = utils.get_installation_id(integration, owner, repo=repo)
+    install_id = github_app.get_installation_id(owner, repo=repo)
 
     print("* INSTALLATION ID: %s" % install_id)
 
@@ -109,7 +136,7 @@ def report(url):
     except github.UnknownObjectException:
         print("* MERGIFY SEEMS NOT INSTALLED")
 
-    installation_token = integration.get_access_token(install_id).token
+    installation_token = github_app.get_installation_token(install_id)
 
     g = github.Github(
         installation_token, base_url="https://api.%s" % config.GITHUB_DOMAIN
@@ -134,6 +161,10 @@ def report(url):
         pull_request_rules_raw["rules"].extend(actions_runner.MERGIFY_RULE["rules"])
         pull_request_rules = rules.PullRequestRules(**pull_request_rules_raw)
 
+    if pull_number is None:
+        report_pulls(g, r, install_id, pull_request_rules)
+        return g, None
+
     try:
         p = r.get_pull(int(pull_number))
     except github.UnknownObjectException:
@@ -142,9 +173,9 @@ def report(url):
 
     mp = mergify_pull.MergifyPull(g, p, install_id)
     print("* PULL REQUEST:")
-    pprint.pprint(mp.to_dict(), width=160)
+    pprint.pprint(dict(mp.to_dict()), width=160)
     try:
-        print("is_behind: %s" % mp.is_behind())
+        print("is_behind: %s" % mp.is_behind(fresh=False))
     except github.GithubException as e:
         print("Unable to know if pull request branch is behind: %s" % e)
 
@@ -168,6 +199,6 @@ def report(url):
 
 def main():
     parser = argparse.ArgumentParser(description="Debugger for mergify")
-    parser.add_argument("url", help="Pull request url")
+    parser.add_argument("url", help="Pull request or repository url")
     args = parser.parse_args()
     report(args.url)
@@ -16,6 +16,8 @@ import github
 
 import requests
 
+from mergify_engine import config
+
 
 class MergeableStateUnknown(Exception):
     def __init__(self, pull):
@@ -23,10 +25,14 @@ class MergeableStateUnknown(Exception):
 
 
 BASE_RETRY_TIMEOUT = 60
+# NOTE(sileht): GitHub usually computes the mergeable state in a few seconds
+MERGEABLE_STATE_RETRY_TIMEOUT = 5
 
 
 def need_retry(exception):  # pragma: no cover
     if isinstance(exception, MergeableStateUnknown):
+        if config.DEFER_GITHUB_WAITS:
+            return MERGEABLE_STATE_RETRY_TIMEOUT
         return BASE_RETRY_TIMEOUT
     elif (
         (isinstance(exception, github.GithubException) and exception.status >= 500)
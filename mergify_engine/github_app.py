@@ -0,0 +1,267 @@
+# -*- encoding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import datetime
+import time
+
+import daiquiri
+
+from datadog import statsd
+
+import github
+import github.InstallationAuthorization
+
+import redis
+
+from mergify_engine import config
+from mergify_engine import http_pool
+from mergify_engine import sub_utils
+from mergify_engine import utils
+
+LOG = daiquiri.getLogger(__name__)
+
+# NOTE(sileht): GitHub accepts JWT that live up to 10 minutes, we keep them
+# in process and sign a new one a minute before the expiration
+JWT_EXPIRATION = 600
+JWT_RENEW_MARGIN = 60
+
+# NOTE(sileht): Installation tokens live one hour, we start minting a new one
+# 10 minutes before the expiration. Until 1 minute before the expiration, the
+# current one is still handed out while another worker is refreshing it.
+TOKEN_REFRESH_MARGIN = datetime.timedelta(minutes=10)
+TOKEN_MIN_VALIDITY = datetime.timedelta(minutes=1)
+TOKEN_LOCK_TIMEOUT = 30
+
+TOKEN_CACHE_KEY = "installation-token~%s"
+TOKEN_LOCK_KEY = "installation-token-lock~%s"
+
+# NOTE(sileht): installation and installation_repositories events keep this
+# mapping up to date, the TTL only protects us against lost events
+INSTALLATION_ID_CACHE_KEY = "installation-id~%s"
+INSTALLATION_ID_CACHE_TTL = 7 * 24 * 3600
+
+
+class CachedJWTGithubIntegration(github.GithubIntegration):
+    """GithubIntegration that reuses its signed JWT until it expires."""
+
+    def __init__(self, *args, **kwargs):
+        super(CachedJWTGithubIntegration, self).__init__(*args, **kwargs)
+        self._jwt = None
+        self._jwt_expires_at = 0
+
+    def create_jwt(self, expiration=JWT_EXPIRATION):
+        now = time.time()
+        if self._jwt is None or now >= self._jwt_expires_at - JWT_RENEW_MARGIN:
+            self._jwt = super(CachedJWTGithubIntegration, self).create_jwt(expiration)
+            self._jwt_expires_at = now + expiration
+        return self._jwt
+
+    def get_access_token(self, installation_id, user_id=None):
+        # NOTE(sileht): Same as PyGithub but with our keep-alive session
+        response = http_pool.get_session().post(
+            "%s/app/installations/%s/access_tokens" % (self.base_url, installation_id),
+            headers={
+                "Authorization": "Bearer {}".format(self.create_jwt()),
+                "Accept": "application/vnd.github.machine-man-preview+json",
+                "User-Agent": "PyGithub/Python",
+            },
+            json={"user_id": user_id} if user_id else {},
+        )
+        if response.status_code == 201:
+            return github.InstallationAuthorization.InstallationAuthorization(
+                requester=None, headers={}, attributes=response.json(), completed=True
+            )
+        elif response.status_code == 403:
+            raise github.BadCredentialsException(
+                status=response.status_code, data=response.text
+            )
+        elif response.status_code == 404:
+            raise github.UnknownObjectException(
+                status=response.status_code, data=response.text
+            )
+        raise github.GithubException(status=response.status_code, data=response.text)
+
+
+global INTEGRATION
+INTEGRATION = None
+
+
+def get_integration():
+    global INTEGRATION
+    if INTEGRATION is None:
+        INTEGRATION = CachedJWTGithubIntegration(
+            config.INTEGRATION_ID, config.PRIVATE_KEY
+        )
+    return INTEGRATION
+
+
+def _get_token_from_cache(r, installation_id):
+    encrypted = r.get(TOKEN_CACHE_KEY % installation_id)
+    if encrypted:
+        cached = sub_utils._decrypt(encrypted)
+        if cached:
+            return (
+                cached["token"],
+                datetime.datetime.fromisoformat(cached["expires_at"]),
+            )
+    return None, None
+
+
+def _mint_token(r, installation_id):
+    auth = get_integration().get_access_token(installation_id)
+    # NOTE(sileht): PyGithub returns a naive datetime in UTC
+    expires_at = auth.expires_at.replace(tzinfo=datetime.timezone.utc)
+    ttl = int((expires_at - utils.utcnow() - TOKEN_MIN_VALIDITY).total_seconds())
+    if ttl > 0:
+        r.set(
+            TOKEN_CACHE_KEY % installation_id,
+            sub_utils._encrypt(
+                {"token": auth.token, "expires_at": expires_at.isoformat()}
+            ),
+            ex=ttl,
+        )
+    statsd.increment("engine.installation_tokens.minted")
+    return auth.token
+
+
+def _get_installation_token(installation_id):
+    r = utils.get_redis_for_cache()
+
+    token, expires_at = _get_token_from_cache(r, installation_id)
+    now = utils.utcnow()
+    if token and expires_at - now > TOKEN_REFRESH_MARGIN:
+        statsd.increment("engine.installation_tokens.cache_hit")
+        return token
+
+    lock = r.lock(
+        TOKEN_LOCK_KEY % installation_id,
+        timeout=TOKEN_LOCK_TIMEOUT,
+        blocking_timeout=TOKEN_LOCK_TIMEOUT,
+    )
+
+    if token and expires_at - now > TOKEN_MIN_VALIDITY:
+        # NOTE(sileht): The token is going to expire soon but is still usable,
+        # refresh it only if nobody else is already doing it
+        if not lock.acquire(blocking=False):
+            statsd.increment("engine.installation_tokens.cache_hit")
+            return token
+        try:
+            statsd.increment("engine.installation_tokens.cache_miss")
+            return _mint_token(r, installation_id)
+        finally:
+            lock.release()
+
+    statsd.increment("engine.installation_tokens.cache_miss")
+    acquired = lock.acquire()
+    try:
+        # NOTE(sileht): Another worker may have minted it while we waited
+        token, expires_at = _get_token_from_cache(r, installation_id)
+        if token and expires_at - utils.utcnow() > TOKEN_REFRESH_MARGIN:
+            return token
+        return _mint_token(r, installation_id)
+    finally:
+        if acquired:
+            try:
+                lock.release()
+            except redis.exceptions.LockError:  # pragma: no cover
+                # NOTE(sileht): Minting took longer than the lock timeout
+                pass
+
+
+def get_installation_token(installation_id):
+    try:
+        token = _get_installation_token(installation_id)
+    except github.UnknownObjectException:  # pragma: no cover
+        LOG.error("token for install %d does not exists anymore", installation_id)
+        return
+    http_pool.register_installation_token(token, installation_id)
+    return token
+
+
+def invalidate_installation_token(installation_id):
+    utils.get_redis_for_cache().delete(TOKEN_CACHE_KEY % installation_id)
+
+
+def _installation_id_cache_key(owner, repo=None):
+    if repo is None:
+        return INSTALLATION_ID_CACHE_KEY % owner.lower()
+    return INSTALLATION_ID_CACHE_KEY % ("%s/%s" % (owner, repo)).lower()
+
+
+def get_installation_id(owner, repo=None, account_type=None):
+    r = utils.get_redis_for_cache()
+    key = _installation_id_cache_key(owner, repo)
+    installation_id = r.get(key)
+    if installation_id is not None:
+        statsd.increment("engine.installation_ids.cache_hit")
+        return int(installation_id)
+
+    statsd.increment("engine.installation_ids.cache_miss")
+    installation_id = utils.get_installation_id(
+        get_integration(), owner, repo=repo, account_type=account_type
+    )
+    r.set(key, installation_id, ex=INSTALLATION_ID_CACHE_TTL)
+    return installation_id
+
+
+def _set_installation_id(pipe, installation_id, full_names):
+    for full_name in full_names:
+        pipe.set(
+            _installation_id_cache_key(*full_name.split("/", 1)),
+            installation_id,
+            ex=INSTALLATION_ID_CACHE_TTL,
+        )
+
+
+def _delete_installation_id(pipe, full_names):
+    for full_name in full_names:
+        pipe.delete(_installation_id_cache_key(*full_name.split("/", 1)))
+
+
+def update_caches_from_event(event_type, data):
+    if event_type not in ["installation", "installation_repositories"]:
+        return
+
+    installation_id = data["installation"]["id"]
+    owner = data["installation"]["account"]["login"]
+
+    pipe = utils.get_redis_for_cache().pipeline()
+    if event_type == "installation":
+        full_names = [repo["full_name"] for repo in data.get("repositories") or []]
+        if data["action"] in ["created", "unsuspend", "new_permissions_accepted"]:
+            _set_installation_id(pipe, installation_id, [owner])
+            _set_installation_id(pipe, installation_id, full_names)
+        elif data["action"] in ["deleted", "suspend"]:
+            _delete_installation_id(pipe, [owner])
+            _delete_installation_id(pipe, full_names)
+    elif data["action"] == "added":
+        _set_installation_id(pipe, installation_id, [owner])
+        _set_installation_id(
+            pipe,
+            installation_id,
+            [repo["full_name"] for repo in data["repositories_added"]],
+        )
+    elif data["action"] == "removed":
+        _delete_installation_id(
+            pipe, [repo["full_name"] for repo in data["repositories_removed"]]
+        )
+    pipe.execute()
+
+    # NOTE(sileht): Tokens created before don't have the new permissions
+    if event_type == "installation" and data["action"] in [
+        "deleted",
+        "suspend",
+        "new_permissions_accepted",
+    ]:
+        invalidate_installation_token(installation_id)
@@ -0,0 +1,236 @@
+# -*- encoding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import daiquiri
+
+from datadog import statsd
+
+import github
+
+LOG = daiquiri.getLogger(__name__)
+
+PAGE_SIZE = 100
+
+PULL_REQUEST_QUERY = """
+query($owner: String!, $name: String!, $number: Int!) {
+  repository(owner: $owner, name: $name) {
+    pullRequest(number: $number) {
+      %s
+    }
+  }
+}
+"""
+
+CONNECTION_QUERY = """
+query($owner: String!, $name: String!, $number: Int!, $after: String) {
+  repository(owner: $owner, name: $name) {
+    pullRequest(number: $number) {
+      %s
+    }
+  }
+}
+"""
+
+CHECKS_QUERY = """
+commits(last: 1) {
+  nodes {
+    commit {
+      oid
+      status {
+        contexts { context state }
+      }
+      checkSuites(first: %(page_size)d) {
+        pageInfo { hasNextPage }
+        nodes {
+          checkRuns(first: %(page_size)d) {
+            pageInfo { hasNextPage }
+            nodes { name status conclusion }
+          }
+        }
+      }
+    }
+  }
+}
+"""
+
+# NOTE(sileht): The connections of the pull request we paginate and the
+# fields we retrieve for each node
+CONNECTIONS = {
+    "reviews": (
+        "states: [APPROVED, CHANGES_REQUESTED, COMMENTED, DISMISSED]",
+        "databaseId state author { __typename login "
+        "... on User { databaseId } ... on Bot { databaseId } }",
+    ),
+    "reviewRequests": (
+        "",
+        "requestedReviewer { __typename ... on User { login } ... on Team { slug } }",
+    ),
+    "files": ("", "path"),
+}
+
+
+class GraphQLError(Exception):
+    pass
+
+
+def _get_connection_query(name):
+    arguments, fields = CONNECTIONS[name]
+    arguments = ", ".join(
+        a for a in ("first: %d" % PAGE_SIZE, "after: $after", arguments) if a
+    )
+    return "%s(%s) { pageInfo { hasNextPage endCursor } nodes { %s } }" % (
+        name,
+        arguments,
+        fields,
+    )
+
+
+def _get_variables(g_pull):
+    return {
+        "owner": g_pull.base.repo.owner.login,
+        "name": g_pull.base.repo.name,
+        "number": g_pull.number,
+    }
+
+
+def query(requester, document, variables):
+    statsd.increment("engine.graphql.queries")
+    try:
+        headers, data = requester.requestJsonAndCheck(
+            "POST", "/graphql", input={"query": document, "variables": variables}
+        )
+    except github.GithubException as e:
+        raise GraphQLError("GraphQL query failed: %s" % e)
+    if data.get("errors"):
+        raise GraphQLError(
+            "GraphQL query failed: %s"
+            % ", ".join(error.get("message", "") for error in data["errors"])
+        )
+    return data["data"]
+
+
+def _get_page(g_pull, name, after=None):
+    data = query(
+        g_pull._requester,
+        CONNECTION_QUERY % _get_connection_query(name),
+        dict(_get_variables(g_pull), after=after),
+    )
+    return data["repository"]["pullRequest"][name]
+
+
+def _iter_nodes(g_pull, name, connection):
+    yield from connection["nodes"]
+    while connection["pageInfo"]["hasNextPage"]:
+        statsd.increment("engine.graphql.overflow", tags=["connection:%s" % name])
+        connection = _get_page(g_pull, name, connection["pageInfo"]["endCursor"])
+        yield from connection["nodes"]
+
+
+def _get_nodes(g_pull, name):
+    """Return an iterator on the nodes of a connection of a pull request.
+
+    The first page is retrieved right away, the others while iterating.
+    """
+    return _iter_nodes(g_pull, name, _get_page(g_pull, name))
+
+
+def _get_review(g_pull, node):
+    login = node["author"]["login"]
+    if node["author"]["__typename"] == "Bot":
+        login += "[bot]"
+    return github.PullRequestReview.PullRequestReview(
+        g_pull._requester,
+        {},
+        {
+            "id": node["databaseId"],
+            "state": node["state"],
+            "user": {
+                "id": node["author"].get("databaseId"),
+                "login": login,
+                "type": node["author"]["__typename"],
+            },
+            "pull_request_url": g_pull.url,
+        },
+        completed=True,
+    )
+
+
+def _get_checks(commit):
+    # NOTE(sileht): Checks are nested twice, if one of them overflows we let the
+    # caller get them with the REST API.
+    if commit["checkSuites"]["pageInfo"]["hasNextPage"]:
+        return
+    checks = []
+    for check_suite in commit["checkSuites"]["nodes"]:
+        if check_suite["checkRuns"]["pageInfo"]["hasNextPage"]:
+            return
+        for check_run in check_suite["checkRuns"]["nodes"]:
+            if check_run["status"] == "COMPLETED" and check_run["conclusion"]:
+                conclusion = check_run["conclusion"].lower()
+            else:
+                conclusion = None
+            checks.append((check_run["name"], conclusion))
+    if commit["status"]:
+        for context in commit["status"]["contexts"]:
+            checks.append((context["context"], context["state"].lower()))
+    return checks
+
+
+def get_reviews(g_pull):
+    """Return the reviews of a pull request as a list of PullRequestReview."""
+    return [
+        _get_review(g_pull, node)
+        for node in _get_nodes(g_pull, "reviews")
+        # NOTE(sileht): Deleted users
+        if node["author"] is not None
+    ]
+
+
+def get_review_requests(g_pull):
+    """Return the requested users logins and teams slugs of a pull request."""
+    users = []
+    teams = []
+    for node in _get_nodes(g_pull, "reviewRequests"):
+        reviewer = node["requestedReviewer"]
+        if reviewer is None:  # pragma: no cover
+            continue
+        elif reviewer["__typename"] == "Team":
+            teams.append(reviewer["slug"])
+        elif reviewer["__typename"] == "User":
+            users.append(reviewer["login"])
+    return users, teams
+
+
+def get_files(g_pull):
+    """Return an iterator on the filenames of a pull request.
+
+    The pages after the first one are retrieved while iterating.
+    """
+    return (node["path"] for node in _get_nodes(g_pull, "files"))
+
+
+def get_checks(g_pull):
+    """Return the checks of the head of a pull request.
+
+    :return: a list of (context, state) or None when they can't be retrieved
+             with GraphQL
+    """
+    data = query(
+        g_pull._requester,
+        PULL_REQUEST_QUERY % (CHECKS_QUERY % {"page_size": PAGE_SIZE}),
+        _get_variables(g_pull),
+    )
+    commits = data["repository"]["pullRequest"]["commits"]["nodes"]
+    if commits and commits[0]["commit"]["oid"] == g_pull.head.sha:
+        return _get_checks(commits[0]["commit"])
@@ -0,0 +1,146 @@
+# -*- encoding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import hashlib
+import json
+import os
+import re
+import tempfile
+import time
+
+import daiquiri
+
+from datadog import statsd
+
+import requests.structures
+
+from mergify_engine import config
+from mergify_engine import utils
+
+LOG = daiquiri.getLogger(__name__)
+
+# NOTE(sileht): GitHub doesn't count 304 responses against the rate limit, so
+# we keep the ETag/Last-Modified and the body of GET responses and replay the
+# cached body when GitHub answers 304 to our conditional requests.
+CACHE_KEY = "http-cache~%s~%s"
+CACHE_TTL = 24 * 3600
+
+# NOTE(sileht): GitHub computes the mergeable_state of a pull request in the
+# background when it's retrieved, we always want the fresh version of it
+EXCLUDED_PATHS = re.compile(r"/repos/[^/]+/[^/]+/pulls/\d+$")
+
+
+class CachedResponse(object):
+    # mimic the httplib response object
+    def __init__(self, status, headers, text):
+        self.status = status
+        self.headers = headers
+        self.text = text
+
+    def getheaders(self):
+        return self.headers.items()
+
+    def read(self):
+        return self.text
+
+
+def is_cacheable(verb, url):
+    return verb == "GET" and not EXCLUDED_PATHS.search(url.split("?", 1)[0])
+
+
+def _get_key(scope, url, headers):
+    h = hashlib.sha256()
+    h.update(url.encode())
+    h.update(b"\0")
+    h.update(headers.get("Accept", "").encode())
+    return CACHE_KEY % (scope, h.hexdigest())
+
+
+def _get_disk_path(key):
+    return os.path.join(config.HTTP_CACHE_DIR, hashlib.sha256(key.encode()).hexdigest())
+
+
+def _load(key):
+    if config.HTTP_CACHE_DIR:
+        path = _get_disk_path(key)
+        try:
+            if os.stat(path).st_mtime + CACHE_TTL > time.time():
+                with open(path) as f:
+                    return json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    cached = utils.get_redis_for_cache().get(key)
+    if cached:
+        return json.loads(cached)
+
+
+def _save(key, entry):
+    value = json.dumps(entry)
+    utils.get_redis_for_cache().set(key, value, ex=CACHE_TTL)
+
+    if config.HTTP_CACHE_DIR:
+        try:
+            fd, tmp = tempfile.mkstemp(dir=config.HTTP_CACHE_DIR)
+            with os.fdopen(fd, "w") as f:
+                f.write(value)
+            os.replace(tmp, _get_disk_path(key))
+        except OSError:  # pragma: no cover
+            LOG.warning("fail to write http cache on disk", exc_info=True)
+
+
+def get(scope, installation_id, url, headers, do_request):
+    """Run a GET request through the conditional requests cache.
+
+    :param scope: the token scope of the request
+    :param installation_id: the installation id of the token, if known
+    :param url: the full url of the request
+    :param headers: the request headers
+    :param do_request: a callable doing the request with the passed headers
+    """
+    tags = ["installation:%s" % (installation_id or "unknown")]
+
+    key = _get_key(scope, url, headers)
+    cached = _load(key)
+    if cached:
+        headers = dict(headers)
+        if cached["etag"]:
+            headers["If-None-Match"] = cached["etag"]
+        if cached["last_modified"]:
+            headers["If-Modified-Since"] = cached["last_modified"]
+
+    r = do_request(headers)
+
+    if cached and r.status_code == 304:
+        statsd.increment("engine.http.cache.hit", tags=tags)
+        statsd.increment("engine.http.cache.ratelimit_saved", tags=tags)
+        response_headers = requests.structures.CaseInsensitiveDict(cached["headers"])
+        response_headers.update(r.headers)
+        return CachedResponse(200, response_headers, cached["body"])
+
+    statsd.increment("engine.http.cache.miss", tags=tags)
+    if r.status_code == 200:
+        etag = r.headers.get("ETag")
+        last_modified = r.headers.get("Last-Modified")
+        if etag or last_modified:
+            _save(
+                key,
+                {
+                    "etag": etag,
+                    "last_modified": last_modified,
+                    "headers": dict(r.headers),
+                    "body": r.text,
+                },
+            )
+    return CachedResponse(r.status_code, r.headers, r.text)
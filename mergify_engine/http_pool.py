@@ -0,0 +1,164 @@
+# -*- encoding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import hashlib
+import os
+
+from datadog import statsd
+
+import github
+
+import requests
+import requests.adapters
+
+from mergify_engine import config
+from mergify_engine import http_cache
+from mergify_engine import ratelimit
+
+
+global SESSION, SESSION_PID
+SESSION = None
+SESSION_PID = None
+
+# NOTE(sileht): installation tokens are rotated every hour, this allows to
+# attach a response to its installation whatever the token used
+TOKEN_INSTALLATIONS = {}
+TOKEN_INSTALLATIONS_MAXSIZE = 10000
+
+
+def register_installation_token(token, installation_id):
+    if len(TOKEN_INSTALLATIONS) >= TOKEN_INSTALLATIONS_MAXSIZE:
+        TOKEN_INSTALLATIONS.clear()
+    TOKEN_INSTALLATIONS[token] = installation_id
+
+
+def get_token_scope(headers):
+    """Return the scope and the installation id of the request headers."""
+    authorization = headers.get("Authorization")
+    if not authorization:
+        return "anonymous", None
+    installation_id = TOKEN_INSTALLATIONS.get(authorization.split(" ", 1)[-1])
+    if installation_id is not None:
+        return "installation-%s" % installation_id, installation_id
+    return hashlib.sha256(authorization.encode()).hexdigest(), None
+
+
+def _meter_response(response, *args, **kwargs):
+    pool = getattr(response.raw, "_pool", None)
+    if pool is None:  # pragma: no cover
+        return
+    created = pool.num_connections - getattr(pool, "_mergify_num_connections", 0)
+    pool._mergify_num_connections = pool.num_connections
+    statsd.increment(
+        "engine.http.requests",
+        tags=["connection:%s" % ("new" if created else "reused")],
+    )
+
+
+def get_session():
+    """Return the keep-alive HTTP session of the current process.
+
+    Connections can't be shared with the parent process, so a new session is
+    created after a fork.
+    """
+    global SESSION, SESSION_PID
+    pid = os.getpid()
+    if SESSION is None or SESSION_PID != pid:
+        SESSION = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=config.HTTP_POOL_MAXSIZE,
+            pool_maxsize=config.HTTP_POOL_MAXSIZE,
+        )
+        SESSION.mount("https://", adapter)
+        SESSION.mount("http://", adapter)
+        SESSION.hooks["response"].append(_meter_response)
+        SESSION_PID = pid
+    return SESSION
+
+
+def reset():
+    global SESSION, SESSION_PID
+    if SESSION is not None:
+        SESSION.close()
+    SESSION = None
+    SESSION_PID = None
+
+
+class PooledConnection(object):
+    """Mimic the httplib connection object used by PyGithub Requester."""
+
+    protocol = None
+    default_port = None
+
+    def __init__(
+        self, host, port=None, strict=False, timeout=None, retry=None, **kwargs
+    ):
+        self.host = host
+        self.port = port if port else self.default_port
+        self.timeout = timeout
+        self.verify = kwargs.get("verify", True)
+
+    def request(self, verb, url, input, headers):
+        self.verb = verb
+        self.url = url
+        self.input = input
+        self.headers = headers
+
+    def _request(self, url, headers):
+        return get_session().request(
+            self.verb,
+            url,
+            headers=headers,
+            data=self.input,
+            timeout=self.timeout,
+            verify=self.verify,
+            allow_redirects=False,
+        )
+
+    def getresponse(self):
+        url = "%s://%s:%s%s" % (self.protocol, self.host, self.port, self.url)
+        scope, installation_id = get_token_scope(self.headers)
+        if http_cache.is_cacheable(self.verb, self.url):
+            response = http_cache.get(
+                scope,
+                installation_id,
+                url,
+                self.headers,
+                lambda headers: self._request(url, headers),
+            )
+        else:
+            response = github.Requester.RequestsResponse(
+                self._request(url, self.headers)
+            )
+        if installation_id is not None:
+            ratelimit.record(installation_id, response.headers)
+        return response
+
+    def close(self):
+        return
+
+
+class PooledHTTPConnection(PooledConnection):
+    protocol = "http"
+    default_port = 80
+
+
+class PooledHTTPSConnection(PooledConnection):
+    protocol = "https"
+    default_port = 443
+
+
+github.Requester.Requester.injectConnectionClasses(
+    PooledHTTPConnection, PooledHTTPSConnection
+)
@@ -0,0 +1,209 @@
+# -*- encoding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import json
+from urllib import parse
+
+import daiquiri
+
+from datadog import statsd
+
+import github
+
+from mergify_engine import config
+from mergify_engine import pull_index
+from mergify_engine import utils
+
+LOG = daiquiri.getLogger(__name__)
+
+# NOTE(sileht): We keep the last known version of pull requests, so events that
+# don't carry the pull request (issue_comment, check_suite, ...) or carry it
+# with a mergeable_state not yet computed don't have to fetch it again.
+# A push on any branch of the repository may change the mergeable_state of
+# its pull requests without changing their updated_at, so it drops the cache
+# of the repository. Statuses, checks and reviews may also change it without
+# changing updated_at, so they drop the cached pull requests they are about,
+# found with the pull request index when the event only has the head sha.
+PULL_CACHE_KEY = "pull-cache~%s"
+PULL_CACHE_TTL = 3600
+
+UNUSABLE_MERGEABLE_STATES = ["unknown", None]
+
+# NOTE(sileht): Head sha of the branches of a repository, kept up to date by
+# push events, and the merge base of the pull requests head sha with them.
+# Push events can be late, so the cached head sha is only used for what
+# doesn't decide an action.
+BRANCH_HEAD_CACHE_KEY = "branch-heads~%s"
+MERGE_BASE_CACHE_KEY = "merge-bases~%s"
+BRANCH_CACHE_TTL = 3600
+
+
+def get_repository(g, repository_raw):
+    """Build a Repository from an event payload.
+
+    The attributes missing from the payload are lazily fetched by PyGithub.
+    """
+    return github.Repository.Repository(
+        g._Github__requester, {}, repository_raw, completed=False
+    )
+
+
+def _get_cached_pull_raw(repo_id, number):
+    cached = utils.get_redis_for_cache().hget(PULL_CACHE_KEY % repo_id, number)
+    if cached:
+        return json.loads(cached)
+
+
+def store_pull(pull_raw):
+    repo_id = pull_raw["base"]["repo"]["id"]
+    cached = _get_cached_pull_raw(repo_id, pull_raw["number"])
+    if cached and cached["updated_at"] > pull_raw["updated_at"]:
+        return
+
+    key = PULL_CACHE_KEY % repo_id
+    pipe = utils.get_redis_for_cache().pipeline()
+    pipe.hset(key, pull_raw["number"], json.dumps(pull_raw))
+    pipe.expire(key, PULL_CACHE_TTL)
+    pipe.execute()
+
+
+def get_pull(repo, number, updated_at=None, head_sha=None, mergeable_state=False):
+    """Return a pull request of a repository, from the cache if possible.
+
+    :param repo: The repository of the pull request.
+    :param number: The pull request number.
+    :param updated_at: The cached version must be at least that recent.
+    :param head_sha: The cached version must have this head sha.
+    :param mergeable_state: The cached version must have a mergeable_state.
+    """
+    cached = _get_cached_pull_raw(repo.id, number)
+    if (
+        cached
+        and (updated_at is None or cached["updated_at"] >= updated_at)
+        and (head_sha is None or cached["head"]["sha"] == head_sha)
+        and (
+            not mergeable_state
+            or cached["state"] == "closed"
+            or cached.get("mergeable_state") not in UNUSABLE_MERGEABLE_STATES
+        )
+    ):
+        statsd.increment("engine.pull_cache.hit")
+        return github.PullRequest.PullRequest(
+            repo._requester, {}, cached, completed=True
+        )
+
+    statsd.increment("engine.pull_cache.miss")
+    pull = repo.get_pull(number)
+    store_pull(pull.raw_data)
+    return pull
+
+
+def get_branch_head_sha(repo, branch, fresh=False):
+    """Return the head sha of a branch.
+
+    :param fresh: Retrieve it from GitHub. The cached one may be outdated if
+                  a push event is late, so it must only be used for what
+                  doesn't decide an action.
+    """
+    r = utils.get_redis_for_cache()
+    if not fresh:
+        sha = r.hget(BRANCH_HEAD_CACHE_KEY % repo.id, branch)
+        if sha is not None:
+            statsd.increment("engine.branch_cache.hit")
+            return sha
+        statsd.increment("engine.branch_cache.miss")
+
+    sha = repo.get_branch(parse.quote(branch, safe="")).commit.sha
+    if not fresh:
+        # NOTE(sileht): Don't replace what a push event may have just stored
+        key = BRANCH_HEAD_CACHE_KEY % repo.id
+        pipe = r.pipeline()
+        pipe.hsetnx(key, branch, sha)
+        pipe.expire(key, BRANCH_CACHE_TTL)
+        pipe.execute()
+    return sha
+
+
+def _set_branch_head_sha(r, repo_id, branch, sha):
+    key = BRANCH_HEAD_CACHE_KEY % repo_id
+    pipe = r.pipeline()
+    pipe.hset(key, branch, sha)
+    pipe.expire(key, BRANCH_CACHE_TTL)
+    pipe.execute()
+
+
+def forget_branch_head_sha(repo, branch):
+    utils.get_redis_for_cache().hdel(BRANCH_HEAD_CACHE_KEY % repo.id, branch)
+
+
+def get_merge_base(repo, head_sha):
+    return utils.get_redis_for_cache().hget(MERGE_BASE_CACHE_KEY % repo.id, head_sha)
+
+
+def store_merge_base(repo, head_sha, merge_base_sha):
+    key = MERGE_BASE_CACHE_KEY % repo.id
+    pipe = utils.get_redis_for_cache().pipeline()
+    pipe.hset(key, head_sha, merge_base_sha)
+    pipe.expire(key, BRANCH_CACHE_TTL)
+    pipe.execute()
+
+
+def _forget_pulls(r, repo_id, numbers=None, head_sha=None):
+    key = PULL_CACHE_KEY % repo_id
+    if numbers is None:
+        if not config.PULL_REQUEST_INDEX:
+            r.delete(key)
+            return
+        numbers = r.smembers(pull_index.HEAD_SHA_KEY % (repo_id, head_sha))
+    if numbers:
+        r.hdel(key, *numbers)
+
+
+def update_caches_from_event(event_type, data):
+    if event_type == "pull_request":
+        store_pull(data["pull_request"])
+    elif event_type == "pull_request_review":
+        _forget_pulls(
+            utils.get_redis_for_cache(),
+            data["repository"]["id"],
+            numbers=[data["pull_request"]["number"]],
+        )
+    elif event_type == "status":
+        _forget_pulls(
+            utils.get_redis_for_cache(), data["repository"]["id"], head_sha=data["sha"]
+        )
+    elif event_type in ["check_suite", "check_run"]:
+        if event_type == "check_run":
+            check_suite = data["check_run"]["check_suite"]
+            head_sha = data["check_run"]["head_sha"]
+        else:
+            check_suite = data["check_suite"]
+            head_sha = check_suite["head_sha"]
+        numbers = [p["number"] for p in check_suite["pull_requests"]] or None
+        _forget_pulls(
+            utils.get_redis_for_cache(),
+            data["repository"]["id"],
+            numbers=numbers,
+            head_sha=head_sha,
+        )
+    elif event_type == "push":
+        r = utils.get_redis_for_cache()
+        repo_id = data["repository"]["id"]
+        r.delete(PULL_CACHE_KEY % repo_id)
+        if data["ref"].startswith("refs/heads/"):
+            branch = data["ref"][len("refs/heads/") :]
+            if data.get("deleted"):
+                r.hdel(BRANCH_HEAD_CACHE_KEY % repo_id, branch)
+            else:
+                _set_branch_head_sha(r, repo_id, branch, data["after"])
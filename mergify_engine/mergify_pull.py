@@ -13,14 +13,20 @@
 # under the License.
 
 import collections
+import collections.abc
+import concurrent.futures
 import itertools
+import json
 import re
+import time
 from urllib import parse
 
 import attr
 
 import daiquiri
 
+from datadog import statsd
+
 import github
 
 import tenacity
@@ -28,6 +34,11 @@ import tenacity
 from mergify_engine import check_api
 from mergify_engine import config
 from mergify_engine import exceptions
+from mergify_engine import graphql
+from mergify_engine import hydration
+from mergify_engine import permissions
+from mergify_engine import teams
+from mergify_engine import utils
 
 LOG = daiquiri.getLogger(__name__)
 
@@ -53,50 +64,207 @@ MARKDOWN_COMMIT_MESSAGE_RE = re.compile(r"^#+ Commit Message ?:?\s*$", re.I)
 GenericCheck = collections.namedtuple("GenericCheck", ["context", "state"])
 
 
+class ConsolidatedData(collections.abc.Mapping):
+    """The attributes of a pull request, fetched on demand.
+
+    Attributes are loaded by groups, a group is loaded the first time one of
+    its attributes is read and kept for the lifetime of the mapping.
+    """
+
+    def __init__(self, groups):
+        self._loaders = {}
+        for group, (names, loader) in groups.items():
+            for name in names:
+                self._loaders[name] = (group, loader)
+        self._data = {}
+
+    def __getitem__(self, name):
+        if name not in self._data:
+            self.prefetch([name])
+        return self._data[name]
+
+    def load_all(self):
+        self.prefetch(self._loaders)
+
+    def prefetch(self, names):
+        """Load the groups of these attributes that are not yet loaded.
+
+        Up to PULL_FETCH_CONCURRENCY groups are loaded at the same time, each
+        one in its own thread, so paginated API calls of a group are done by
+        the same thread.
+        """
+        loaders = collections.OrderedDict()
+        for name in names:
+            if name in self._loaders and name not in self._data:
+                group, loader = self._loaders[name]
+                loaders.setdefault(loader, (group, name))
+        if not loaders:
+            return
+
+        for group, name in loaders.values():
+            statsd.increment(
+                "engine.pull_attributes.fetch",
+                tags=["group:%s" % group, "attribute:%s" % name],
+            )
+
+        def timed_load(loader):
+            started_at = time.monotonic()
+            data = loader()
+            return data, time.monotonic() - started_at
+
+        started_at = time.monotonic()
+        if config.PULL_FETCH_CONCURRENCY <= 1 or len(loaders) == 1:
+            mode = "serial"
+            results = [timed_load(loader) for loader in loaders]
+        else:
+            mode = "parallel"
+            with concurrent.futures.ThreadPoolExecutor(
+                max_workers=min(config.PULL_FETCH_CONCURRENCY, len(loaders))
+            ) as executor:
+                futures = [executor.submit(timed_load, loader) for loader in loaders]
+            results = [future.result() for future in futures]
+
+        # NOTE(sileht): serial_time is what the loading would have taken
+        # without concurrency
+        statsd.histogram(
+            "engine.pull_attributes.prefetch.wall_time",
+            time.monotonic() - started_at,
+            tags=["mode:%s" % mode],
+        )
+        statsd.histogram(
+            "engine.pull_attributes.prefetch.serial_time",
+            sum(duration for data, duration in results),
+            tags=["mode:%s" % mode],
+        )
+        for data, duration in results:
+            self._data.update(data)
+
+    def __contains__(self, name):
+        return name in self._loaders
+
+    def __iter__(self):
+        return iter(self._loaders)
+
+    def __len__(self):
+        return len(self._loaders)
+
+
+class LazyList(collections.abc.Sequence):
+    """A list whose items are read from an iterator when needed.
+
+    Items already read are kept, so the iterator is consumed only once
+    whatever the number of times the list is read.
+    """
+
+    def __init__(self, iterable):
+        self._iterator = iter(iterable)
+        self._items = []
+
+    def _read_until(self, index=None):
+        while self._iterator is not None and (
+            index is None or index >= len(self._items)
+        ):
+            try:
+                self._items.append(next(self._iterator))
+            except StopIteration:
+                self._iterator = None
+
+    def __iter__(self):
+        index = 0
+        while True:
+            self._read_until(index)
+            if index >= len(self._items):
+                return
+            yield self._items[index]
+            index += 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice) or index < 0:
+            self._read_until()
+        else:
+            self._read_until(index)
+        return self._items[index]
+
+    def __len__(self):
+        self._read_until()
+        return len(self._items)
+
+    def __eq__(self, other):
+        if isinstance(other, (list, tuple, LazyList)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __repr__(self):
+        return repr(list(self))
+
+
 @attr.s()
 class MergifyPull(object):
     # NOTE(sileht): Use from_cache/from_event not the constructor directly
     g = attr.ib()
     g_pull = attr.ib()
     installation_id = attr.ib()
+    # NOTE(sileht): Only Celery tasks can be retried later instead of waiting
+    # for GitHub, see DEFER_GITHUB_WAITS
+    defer_waits = attr.ib(default=False)
+    # NOTE(sileht): Set when GitHub doesn't know yet the new head of the pull
+    # request, checks posted on the current one would be lost
+    head_sha_outdated = attr.ib(init=False, default=False)
     _consolidated_data = attr.ib(init=False, default=None)
+    _resolved_teams = attr.ib(init=False, default=attr.Factory(dict))
 
     @classmethod
-    def from_raw(cls, installation_id, installation_token, pull_raw):
+    def from_raw(cls, installation_id, installation_token, pull_raw, defer_waits=False):
         g = github.Github(
             installation_token, base_url="https://api.%s" % config.GITHUB_DOMAIN
         )
         pull = github.PullRequest.PullRequest(
             g._Github__requester, {}, pull_raw, completed=True
         )
-        return cls(g, pull, installation_id)
+        return cls(g, pull, installation_id, defer_waits)
 
     @classmethod
     def from_number(
-        cls, installation_id, installation_token, owner, reponame, pull_number
+        cls,
+        installation_id,
+        installation_token,
+        owner,
+        reponame,
+        pull_number,
+        defer_waits=False,
     ):
         g = github.Github(
             installation_token, base_url="https://api.%s" % config.GITHUB_DOMAIN
         )
-        repo = g.get_repo(owner + "/" + reponame)
+        repo = g.get_repo(owner + "/" + reponame, lazy=True)
         pull = repo.get_pull(pull_number)
-        return cls(g, pull, installation_id)
+        return cls(g, pull, installation_id, defer_waits)
 
     def __attrs_post_init__(self):
+        # NOTE(sileht): A task that stopped waiting for GitHub runs again with
+        # a pull request whose mergeable_state is not yet computed, from its
+        # retry or from the synchronize event of the new head
+        waited = self.g_pull.mergeable_state in self.UNUSABLE_STATES
         self._ensure_mergable_state()
+        if waited and self._waits_deferred:
+            self._report_waits()
+
+    @property
+    def _waits_deferred(self):
+        return config.DEFER_GITHUB_WAITS and self.defer_waits
 
     def _valid_perm(self, user):
         if user.type == "Bot":
             return True
-        return self.g_pull.base.repo.get_collaborator_permission(user.login) in [
-            "admin",
-            "write",
-        ]
+        return permissions.get_collaborator_permission(
+            self.g_pull.base.repo, user.login
+        ) in ["admin", "write",]
 
-    def _get_reviews(self):
+    def _get_reviews(self, reviews=None):
         # Ignore reviews that are not from someone with admin/write permissions
         # And only keep the last review for each user.
-        reviews = list(self.g_pull.get_reviews())
+        if reviews is None:
+            reviews = list(self.g_pull.get_reviews())
         valid_users = list(
             map(
                 lambda u: u.login,
@@ -121,25 +289,78 @@ class MergifyPull(object):
         return self._consolidated_data
 
     def _get_consolidated_data(self):
-        comments, approvals = self._get_reviews()
-        statuses = self._get_checks()
-        # FIXME(jd) pygithub does 2 HTTP requests whereas 1 is enough!
-        (
-            review_requested_users,
-            review_requested_teams,
-        ) = self.g_pull.get_review_requests()
+        # NOTE(sileht): With GraphQL, each group that needs the API is
+        # retrieved with its own query
+        if config.GRAPHQL_PULL_ATTRIBUTES:
+            loaders = {
+                "reviews": self._get_graphql_reviews_attributes,
+                "checks": self._get_graphql_checks_attributes,
+                "review_requests": self._get_graphql_review_requests_attributes,
+                "files": self._get_graphql_files_attributes,
+            }
+        else:
+            loaders = {
+                "reviews": self._get_reviews_attributes,
+                "checks": self._get_checks_attributes,
+                "review_requests": self._get_review_requests_attributes,
+                "files": self._get_files_attributes,
+            }
+
+        # NOTE(sileht): The groups are listed in the order they are loaded when
+        # LAZY_PULL_ATTRIBUTES is disabled
+        data = ConsolidatedData(
+            {
+                "reviews": (
+                    (
+                        "_approvals",
+                        "approved-reviews-by",
+                        "dismissed-reviews-by",
+                        "changes-requested-reviews-by",
+                        "commented-reviews-by",
+                    ),
+                    loaders["reviews"],
+                ),
+                "checks": (
+                    ("status-success", "status-failure", "status-neutral"),
+                    loaders["checks"],
+                ),
+                "review_requests": (("review-requested",), loaders["review_requests"],),
+                "pull_request": (
+                    (
+                        "assignee",
+                        "label",
+                        "author",
+                        "merged-by",
+                        "merged",
+                        "closed",
+                        "milestone",
+                        "conflict",
+                        "base",
+                        "head",
+                        "locked",
+                        "title",
+                        "body",
+                        "commits",
+                        "additions",
+                        "deletions",
+                        "changed-files",
+                        "#files",
+                    ),
+                    self._get_pull_request_attributes,
+                ),
+                "files": (("files",), loaders["files"]),
+            }
+        )
+        if not config.LAZY_PULL_ATTRIBUTES:
+            data.load_all()
+        return data
+
+    def _get_pull_request_attributes(self):
         return {
-            # Only use internally attributes
-            "_approvals": approvals,
-            # Can be used by rules too
             "assignee": [a.login for a in self.g_pull.assignees],
             # NOTE(sileht): We put an empty label to allow people to match
             # no label set
             "label": [l.name for l in self.g_pull.labels],
-            "review-requested": (
-                [u.login for u in review_requested_users]
-                + ["@" + t.slug for t in review_requested_teams]
-            ),
             "author": self.g_pull.user.login,
             "merged-by": (self.g_pull.merged_by.login if self.g_pull.merged_by else ""),
             "merged": self.g_pull.merged,
@@ -151,7 +372,19 @@ class MergifyPull(object):
             "locked": self.g_pull._rawData["locked"],
             "title": self.g_pull.title,
             "body": self.g_pull.body,
-            "files": [f.filename for f in self.g_pull.get_files()],
+            "commits": self.g_pull.commits,
+            "additions": self.g_pull.additions,
+            "deletions": self.g_pull.deletions,
+            "changed-files": self.g_pull.changed_files,
+            # NOTE(sileht): Lengths known from the pull request payload
+            "#files": self.g_pull.changed_files,
+        }
+
+    def _get_reviews_attributes(self, reviews=None):
+        comments, approvals = self._get_reviews(reviews)
+        return {
+            # Only use internally attributes
+            "_approvals": approvals,
             "approved-reviews-by": [
                 r.user.login for r in approvals if r.state == "APPROVED"
             ],
@@ -164,6 +397,58 @@ class MergifyPull(object):
             "commented-reviews-by": [
                 r.user.login for r in comments if r.state == "COMMENTED"
             ],
+        }
+
+    def _get_review_requests_attributes(self, review_requests=None):
+        if review_requests is None:
+            # FIXME(jd) pygithub does 2 HTTP requests whereas 1 is enough!
+            users, teams = self.g_pull.get_review_requests()
+            review_requests = ([u.login for u in users], [t.slug for t in teams])
+        users, teams = review_requests
+        return {"review-requested": users + ["@" + slug for slug in teams]}
+
+    def _get_files_attributes(self, files=None):
+        if files is None:
+            # NOTE(sileht): Pages are fetched only when needed, a condition
+            # that matches the first files doesn't read the others
+            files = LazyList(f.filename for f in self.g_pull.get_files())
+        return {"files": files}
+
+    def _get_graphql_data(self, getter):
+        try:
+            return getter(self.g_pull)
+        except graphql.GraphQLError as e:
+            statsd.increment("engine.graphql.fallback")
+            LOG.warning(
+                "fail to get pull request data with GraphQL, using REST API",
+                error=str(e),
+                pull_request=self,
+            )
+
+    def _get_graphql_reviews_attributes(self):
+        return self._get_reviews_attributes(self._get_graphql_data(graphql.get_reviews))
+
+    def _get_graphql_checks_attributes(self):
+        checks = self._get_graphql_data(graphql.get_checks)
+        if checks is not None:
+            checks = set(GenericCheck(*check) for check in checks)
+        return self._get_checks_attributes(checks)
+
+    def _get_graphql_review_requests_attributes(self):
+        return self._get_review_requests_attributes(
+            self._get_graphql_data(graphql.get_review_requests)
+        )
+
+    def _get_graphql_files_attributes(self):
+        files = self._get_graphql_data(graphql.get_files)
+        if files is not None:
+            files = LazyList(files)
+        return self._get_files_attributes(files)
+
+    def _get_checks_attributes(self, statuses=None):
+        if statuses is None:
+            statuses = self._get_checks()
+        return {
             "status-success": [s.context for s in statuses if s.state == "success"],
             # NOTE(jd) The Check API set conclusion to None for pending.
             # NOTE(sileht): "pending" statuses are not really trackable, we
@@ -181,6 +466,21 @@ class MergifyPull(object):
         }
 
     def _get_statuses(self):
+        if config.LATEST_STATUSES_AND_CHECKS:
+            # NOTE(sileht): The combined status only has the last status of
+            # each context, while the statuses list has all of them, CIs
+            # reporting their progress can post hundreds of them.
+            return list(
+                github.PaginatedList.PaginatedList(
+                    github.CommitStatus.CommitStatus,
+                    self.g_pull._requester,
+                    "%s/commits/%s/status"
+                    % (self.g_pull.base.repo.url, self.g_pull.head.sha),
+                    {"per_page": check_api.PAGE_SIZE},
+                    list_item="statuses",
+                )
+            )
+
         already_seen = set()
         statuses = []
         for status in github.PaginatedList.PaginatedList(
@@ -197,12 +497,11 @@ class MergifyPull(object):
                 statuses.append(status)
         return statuses
 
-    def _get_checks(self):
-        generic_checks = set()
+    def _get_check_runs(self):
         try:
             # NOTE(sileht): conclusion can be one of success, failure, neutral,
             # cancelled, timed_out, or action_required, and  None for "pending"
-            generic_checks |= set(
+            return set(
                 [
                     GenericCheck(c.name, c.conclusion)
                     for c in check_api.get_checks(self.g_pull)
@@ -214,13 +513,21 @@ class MergifyPull(object):
                 or e.data["message"] != "Resource not accessible by integration"
             ):
                 raise
+            return set()
 
+    def _get_checks(self):
         # NOTE(sileht): state can be one of error, failure, pending,
         # or success.
-        generic_checks |= set(
-            [GenericCheck(s.context, s.state) for s in self._get_statuses()]
-        )
-        return generic_checks
+        def get_statuses():
+            return set([GenericCheck(s.context, s.state) for s in self._get_statuses()])
+
+        if config.PULL_FETCH_CONCURRENCY <= 1:
+            return self._get_check_runs() | get_statuses()
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+            check_runs = executor.submit(self._get_check_runs)
+            statuses = executor.submit(get_statuses)
+        return check_runs.result() | statuses.result()
 
     def _resolve_login(self, name):
         if not name:
@@ -240,11 +547,18 @@ class MergifyPull(object):
             organization = self.g_pull.base.repo.owner.login
             team_slug = name[1:]
 
+        # NOTE(sileht): The same team is usually used by many conditions
+        if name not in self._resolved_teams:
+            self._resolved_teams[name] = self._get_team_members(
+                name, organization, team_slug
+            )
+        return self._resolved_teams[name]
+
+    def _get_team_members(self, name, organization, team_slug):
         try:
-            g_organization = self.g.get_organization(organization)
-            for team in g_organization.get_teams():
-                if team.slug == team_slug:
-                    return [m.login for m in team.get_members()]
+            members = teams.get_team_members(self.g, organization, team_slug)
+            if members is not None:
+                return members
         except github.GithubException as e:
             if e.status >= 500:
                 raise
@@ -274,7 +588,23 @@ class MergifyPull(object):
         retry=tenacity.retry_if_exception_type(exceptions.MergeableStateUnknown),
         reraise=True,
     )
+    def _wait_for_mergeable_state(self, force=False):
+        self._refresh_mergeable_state(force)
+
     def _ensure_mergable_state(self, force=False):
+        if not self._waits_deferred:
+            self._wait_for_mergeable_state(force)
+            return
+
+        # NOTE(sileht): Instead of sleeping, the task is retried a bit later
+        # by worker.py
+        try:
+            self._refresh_mergeable_state(force)
+        except exceptions.MergeableStateUnknown:
+            self._start_waiting("mergeable_state")
+            raise
+
+    def _refresh_mergeable_state(self, force=False):
         if self.g_pull.state == "closed":
             return
         if not force and self.g_pull.mergeable_state not in self.UNUSABLE_STATES:
@@ -285,8 +615,18 @@ class MergifyPull(object):
 
         # NOTE(sileht): Well github doesn't always update etag/last_modified
         # when mergeable_state change, so we get a fresh pull request instead
-        # of using update()
-        self.g_pull = self.g_pull.base.repo.get_pull(self.g_pull.number)
+        # of using update(). A cached version is fine if it's not older than
+        # the one we have.
+        if force:
+            self.g_pull = self.g_pull.base.repo.get_pull(self.g_pull.number)
+            hydration.store_pull(self.g_pull.raw_data)
+        else:
+            self.g_pull = hydration.get_pull(
+                self.g_pull.base.repo,
+                self.g_pull.number,
+                updated_at=self.g_pull.raw_data["updated_at"],
+                mergeable_state=True,
+            )
         if (
             self.g_pull.state == "closed"
             or self.g_pull.mergeable_state not in self.UNUSABLE_STATES
@@ -301,8 +641,12 @@ class MergifyPull(object):
         retry=tenacity.retry_never,
     )
     def _wait_for_sha_change(self, old_sha):
+        if not self._refresh_head_sha(old_sha):
+            raise tenacity.TryAgain
+
+    def _refresh_head_sha(self, old_sha):
         if self.g_pull.state == "closed" or self.g_pull.head.sha != old_sha:
-            return
+            return True
 
         # Github is currently processing this PR, we wait the completion
         LOG.info("refreshing", pull_request=self)
@@ -311,22 +655,83 @@ class MergifyPull(object):
         # when mergeable_state change, so we get a fresh pull request instead
         # of using update()
         self.g_pull = self.g_pull.base.repo.get_pull(self.g_pull.number)
-        if self.g_pull.state == "closed" or self.g_pull.head.sha != old_sha:
-            return
-        raise tenacity.TryAgain
+        return self.g_pull.state == "closed" or self.g_pull.head.sha != old_sha
 
     def wait_for_sha_change(self):
         old_sha = self.g_pull.head.sha
-        self._wait_for_sha_change(old_sha)
+        if not self._waits_deferred:
+            self._wait_for_sha_change(old_sha)
+        elif not self._refresh_head_sha(old_sha):
+            # NOTE(sileht): GitHub sends a synchronize event once it knows the
+            # new head, the engine runs again for it then
+            self._start_waiting("head_sha", old_sha)
+            self.head_sha_outdated = True
+            return
         self._ensure_mergable_state()
 
+    # NOTE(sileht): When a task stops waiting for GitHub, we remember since
+    # when, so the run that finally get what was waited reports the time
+    # spent waiting.
+    WAIT_KEY = "github-wait~%s~%s"
+    WAIT_TTL = 3600
+
+    def _get_wait_key(self):
+        return self.WAIT_KEY % (self.g_pull.base.repo.id, self.g_pull.number)
+
+    def _start_waiting(self, reason, value=None):
+        key = self._get_wait_key()
+        pipe = utils.get_redis_for_cache().pipeline()
+        pipe.hsetnx(key, reason, json.dumps([time.time(), value]))
+        pipe.expire(key, self.WAIT_TTL)
+        pipe.execute()
+
+    def _report_waits(self):
+        key = self._get_wait_key()
+        r = utils.get_redis_for_cache()
+        for reason, wait in r.hgetall(key).items():
+            started_at, value = json.loads(wait)
+            if (
+                reason == "head_sha"
+                and self.g_pull.state != "closed"
+                and self.g_pull.head.sha == value
+            ):
+                continue
+            r.hdel(key, reason)
+            statsd.timing(
+                "engine.github_wait",
+                (time.time() - started_at) * 1000,
+                tags=["reason:%s" % reason],
+            )
+
     def base_is_modifiable(self):
         return (
             self.g_pull.raw_data["maintainer_can_modify"]
             or self.g_pull.head.repo.id == self.g_pull.base.repo.id
         )
 
-    def is_behind(self):
+    def is_behind(self, fresh=True):
+        """Return whether the base branch has commits the pull request doesn't.
+
+        :param fresh: Retrieve the head of the base branch from GitHub, must be
+                      set when the result decides an action.
+        """
+        if not config.COMPARE_IS_BEHIND:
+            return self._is_behind_from_commits()
+
+        repo = self.g_pull.base.repo
+        head_sha = self.g_pull.head.sha
+        base_sha = hydration.get_branch_head_sha(repo, self.g_pull.base.ref, fresh)
+        merge_base_sha = hydration.get_merge_base(repo, head_sha)
+        if merge_base_sha == base_sha:
+            statsd.increment("engine.is_behind", tags=["source:cache"])
+            return False
+
+        statsd.increment("engine.is_behind", tags=["source:compare"])
+        comparison = repo.compare(base_sha, head_sha)
+        hydration.store_merge_base(repo, head_sha, comparison.merge_base_commit.sha)
+        return comparison.behind_by > 0
+
+    def _is_behind_from_commits(self):
         branch = self.g_pull.base.repo.get_branch(
             parse.quote(self.g_pull.base.ref, safe="")
         )
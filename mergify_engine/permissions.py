@@ -0,0 +1,87 @@
+# -*- encoding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import json
+import time
+
+import daiquiri
+
+from datadog import statsd
+
+from mergify_engine import utils
+
+LOG = daiquiri.getLogger(__name__)
+
+# NOTE(sileht): Permissions of the collaborators of the repositories of an
+# owner, the hash fields are "<repo_id>~<login>". A permission can change
+# through the collaborators of the repository (member event), the teams of
+# the organization (membership and team events) or the organization itself
+# (organization event), these events invalidate the entries they may have
+# changed.
+PERMISSION_CACHE_KEY = "collaborator-permissions~%s"
+PERMISSION_CACHE_TTL = 3600
+PERMISSION_CACHE_KEY_TTL = 24 * 3600
+
+
+def _get_field(repo_id, login):
+    return "%s~%s" % (repo_id, login)
+
+
+def get_collaborator_permission(repo, login):
+    """Return the permission of a user on a repository, from the cache if possible.
+
+    :return: admin, write, read or none
+    """
+    key = PERMISSION_CACHE_KEY % repo.owner.id
+    field = _get_field(repo.id, login)
+
+    r = utils.get_redis_for_cache()
+    cached = r.hget(key, field)
+    if cached is not None:
+        cached = json.loads(cached)
+        if cached["cached_at"] + PERMISSION_CACHE_TTL > time.time():
+            statsd.increment("engine.permission_cache.hit")
+            return cached["permission"]
+
+    statsd.increment("engine.permission_cache.miss")
+    permission = repo.get_collaborator_permission(login)
+
+    pipe = r.pipeline()
+    pipe.hset(
+        key, field, json.dumps({"permission": permission, "cached_at": time.time()})
+    )
+    pipe.expire(key, PERMISSION_CACHE_KEY_TTL)
+    pipe.execute()
+    return permission
+
+
+def _delete_login(r, owner_id, login):
+    key = PERMISSION_CACHE_KEY % owner_id
+    fields = [field for field, _ in r.hscan_iter(key, match="*~%s" % login)]
+    if fields:
+        r.hdel(key, *fields)
+
+
+def update_caches_from_event(event_type, data):
+    r = utils.get_redis_for_cache()
+    if event_type == "member":
+        repo = data["repository"]
+        r.hdel(
+            PERMISSION_CACHE_KEY % repo["owner"]["id"],
+            _get_field(repo["id"], data["member"]["login"]),
+        )
+    elif event_type == "membership":
+        _delete_login(r, data["organization"]["id"], data["member"]["login"])
+    elif event_type in ["organization", "team"] and "organization" in data:
+        r.delete(PERMISSION_CACHE_KEY % data["organization"]["id"])
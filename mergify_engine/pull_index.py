@@ -0,0 +1,188 @@
+# -*- encoding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import json
+import time
+
+import daiquiri
+
+from datadog import statsd
+
+from mergify_engine import config
+from mergify_engine import hydration
+from mergify_engine import utils
+
+LOG = daiquiri.getLogger(__name__)
+
+# NOTE(sileht): Index of the open pull requests of a repository, maintained
+# from pull_request and push events. It's rebuilt from the API when it's
+# older than RECONCILE_INTERVAL, in case we missed some events. A lookup that
+# doesn't find anything means there is no such pull request: most statuses
+# are posted on commits that aren't the head of a pull request.
+INDEX_KEY = "open-pulls~%s"
+HEAD_SHA_KEY = "open-pulls-by-head-sha~%s~%s"
+BASE_REF_KEY = "open-pulls-by-base-ref~%s~%s"
+HEAD_REF_KEY = "open-pulls-by-head-ref~%s~%s"
+RECONCILED_AT_KEY = "open-pulls-reconciled-at~%s"
+
+INDEX_TTL = 7 * 24 * 3600
+RECONCILE_INTERVAL = 3600
+
+
+def _get_entry(pull_raw):
+    head_repo = pull_raw["head"]["repo"]
+    return {
+        "updated_at": pull_raw["updated_at"],
+        "head_sha": pull_raw["head"]["sha"],
+        "base_ref": pull_raw["base"]["ref"],
+        # NOTE(sileht): Only branches of the repository itself are indexed,
+        # refs of forks are not unique
+        "head_ref": (
+            pull_raw["head"]["ref"]
+            if head_repo and head_repo["id"] == pull_raw["base"]["repo"]["id"]
+            else None
+        ),
+    }
+
+
+def _get_entry_keys(repo_id, entry):
+    keys = [
+        HEAD_SHA_KEY % (repo_id, entry["head_sha"]),
+        BASE_REF_KEY % (repo_id, entry["base_ref"]),
+    ]
+    if entry["head_ref"] is not None:
+        keys.append(HEAD_REF_KEY % (repo_id, entry["head_ref"]))
+    return keys
+
+
+def _remove(pipe, repo_id, number, entry):
+    pipe.hdel(INDEX_KEY % repo_id, number)
+    for key in _get_entry_keys(repo_id, entry):
+        pipe.srem(key, number)
+
+
+def _add(pipe, repo_id, number, entry):
+    pipe.hset(INDEX_KEY % repo_id, number, json.dumps(entry))
+    pipe.expire(INDEX_KEY % repo_id, INDEX_TTL)
+    for key in _get_entry_keys(repo_id, entry):
+        pipe.sadd(key, number)
+        pipe.expire(key, INDEX_TTL)
+
+
+def _get_indexed_entries(r, repo_id):
+    return dict(
+        (int(number), json.loads(entry))
+        for number, entry in r.hgetall(INDEX_KEY % repo_id).items()
+    )
+
+
+def reconcile(repo):
+    r = utils.get_redis_for_cache()
+    pulls = list(repo.get_pulls())
+
+    pipe = r.pipeline()
+    for number, entry in _get_indexed_entries(r, repo.id).items():
+        _remove(pipe, repo.id, number, entry)
+    for pull in pulls:
+        _add(pipe, repo.id, pull.number, _get_entry(pull.raw_data))
+    pipe.set(RECONCILED_AT_KEY % repo.id, time.time(), ex=RECONCILE_INTERVAL)
+    pipe.execute()
+
+    for pull in pulls:
+        hydration.store_pull(pull.raw_data)
+
+    statsd.increment("engine.pull_index.reconcile")
+
+
+def get_open_pull_numbers(repo, head_sha=None, base_ref=None, head_ref=None):
+    """Return the numbers of the open pull requests matching all criteria.
+
+    :return: a sorted list of numbers or None if the index is disabled.
+    """
+    if not config.PULL_REQUEST_INDEX:
+        return
+    keys = []
+    if head_sha is not None:
+        keys.append(HEAD_SHA_KEY % (repo.id, head_sha))
+    if base_ref is not None:
+        keys.append(BASE_REF_KEY % (repo.id, base_ref))
+    if head_ref is not None:
+        keys.append(HEAD_REF_KEY % (repo.id, head_ref))
+    if not keys:
+        raise RuntimeError("head_sha, base_ref or head_ref must be passed")
+
+    r = utils.get_redis_for_cache()
+    if r.get(RECONCILED_AT_KEY % repo.id) is None:
+        reconcile(repo)
+
+    numbers = r.sinter(keys)
+    if not numbers:
+        statsd.increment("engine.pull_index.miss")
+
+    return sorted(map(int, numbers))
+
+
+def _update_pull(r, pull_raw):
+    repo_id = pull_raw["base"]["repo"]["id"]
+    number = pull_raw["number"]
+
+    old_entry = r.hget(INDEX_KEY % repo_id, number)
+    if old_entry is not None:
+        old_entry = json.loads(old_entry)
+        if old_entry["updated_at"] > pull_raw["updated_at"]:
+            return
+
+    pipe = r.pipeline()
+    if old_entry is not None:
+        _remove(pipe, repo_id, number, old_entry)
+    if pull_raw["state"] == "open":
+        _add(pipe, repo_id, number, _get_entry(pull_raw))
+    pipe.execute()
+
+
+def _update_head_sha(r, repo_id, ref, sha):
+    numbers = r.smembers(HEAD_REF_KEY % (repo_id, ref))
+    if not numbers:
+        return
+
+    pipe = r.pipeline()
+    for number in numbers:
+        entry = r.hget(INDEX_KEY % repo_id, number)
+        if entry is None:  # pragma: no cover
+            continue
+        entry = json.loads(entry)
+        _remove(pipe, repo_id, number, entry)
+        entry["head_sha"] = sha
+        _add(pipe, repo_id, number, entry)
+    pipe.execute()
+
+
+def update_caches_from_event(event_type, data):
+    if not config.PULL_REQUEST_INDEX:
+        return
+
+    r = utils.get_redis_for_cache()
+    if event_type == "pull_request":
+        _update_pull(r, data["pull_request"])
+    elif (
+        event_type == "push"
+        and data["ref"].startswith("refs/heads/")
+        and not data.get("deleted")
+    ):
+        _update_head_sha(
+            r,
+            data["repository"]["id"],
+            data["ref"][len("refs/heads/") :],
+            data["after"],
+        )
@@ -0,0 +1,86 @@
+# -*- encoding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import time
+
+import daiquiri
+
+from datadog import statsd
+
+from mergify_engine import config
+from mergify_engine import utils
+
+LOG = daiquiri.getLogger(__name__)
+
+RATELIMIT_KEY = "ratelimit~%s"
+
+
+def record(installation_id, headers):
+    """Record the rate limit of an installation from GitHub response headers."""
+    try:
+        remaining = int(headers["X-RateLimit-Remaining"])
+        limit = int(headers["X-RateLimit-Limit"])
+        reset = int(headers["X-RateLimit-Reset"])
+    except (KeyError, ValueError):
+        return
+
+    tags = ["installation:%s" % installation_id]
+    statsd.gauge("engine.github.ratelimit.remaining", remaining, tags=tags)
+    statsd.gauge("engine.github.ratelimit.limit", limit, tags=tags)
+
+    if reset <= time.time():
+        return
+
+    key = RATELIMIT_KEY % installation_id
+    pipe = utils.get_redis_for_cache().pipeline()
+    pipe.hmset(key, {"remaining": remaining, "limit": limit, "reset": reset})
+    pipe.expireat(key, reset)
+    pipe.execute()
+
+
+def get(installation_id):
+    """Return the last known rate limit of an installation.
+
+    :return: a dict with remaining, limit and reset or None if unknown.
+    """
+    rate = utils.get_redis_for_cache().hgetall(RATELIMIT_KEY % installation_id)
+    if rate and int(rate["reset"]) > time.time():
+        return dict((k, int(v)) for k, v in rate.items())
+
+
+def get_low_budget_delay(installation_id):
+    """Return how long low priority work of an installation should wait.
+
+    :return: the number of seconds before the rate limit reset when the
+             remaining budget is lower than RATELIMIT_LOW_BUDGET, else 0.
+    """
+    rate = get(installation_id)
+    if rate is None or rate["remaining"] >= config.RATELIMIT_LOW_BUDGET:
+        return 0
+    return max(1, int(rate["reset"] - time.time()))
+
+
+def defer_if_budget_low(installation_id, kind, **log_extras):
+    """Return the delay to apply to a low priority job and meter it."""
+    delay = get_low_budget_delay(installation_id)
+    if delay:
+        statsd.increment("engine.ratelimit.deferred", tags=["kind:%s" % kind])
+        LOG.info(
+            "rate limit budget low, %s deferred",
+            kind,
+            install_id=installation_id,
+            countdown=delay,
+            **log_extras,
+        )
+    return delay
@@ -15,13 +15,19 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import base64
+import functools
+import hashlib
 import itertools
+import json
 import operator
 
 import attr
 
 import daiquiri
 
+from datadog import statsd
+
 import github
 
 import voluptuous
@@ -29,6 +35,9 @@ import voluptuous
 import yaml
 
 from mergify_engine import actions
+from mergify_engine import config
+from mergify_engine import safe_regex
+from mergify_engine import utils
 from mergify_engine.rules import filter
 
 
@@ -80,10 +89,118 @@ def load_pull_request_rules_schema(rules):
     return rules
 
 
+@attr.s
+class ConditionsIndex:
+    """The conditions of a list of rules, indexed to evaluate them quickly.
+
+    Identical conditions are evaluated once per pull request. Equality
+    conditions on attributes that are strings are grouped by attribute, so
+    the attribute is read once for all their values.
+    """
+
+    INDEXED_ATTRIBUTES = ("head", "base", "author", "body", "title")
+
+    rules = attr.ib()
+    # id(condition) -> condition string
+    keys = attr.ib(init=False, factory=dict, repr=False)
+    # attribute -> value -> condition strings
+    equalities = attr.ib(init=False, factory=dict, repr=False)
+
+    def __attrs_post_init__(self):
+        for rule in self.rules:
+            for condition in rule["conditions"]:
+                key = str(condition)
+                self.keys[id(condition)] = key
+                op, nodes = list(condition.tree.items())[0]
+                if op not in ("=", "=="):
+                    continue
+                name, value = nodes
+                if (
+                    name in self.INDEXED_ATTRIBUTES
+                    and isinstance(value, str)
+                    # NOTE(sileht): Teams are expanded by the evaluation
+                    and not value.startswith("@")
+                ):
+                    self.equalities.setdefault(name, {}).setdefault(value, set()).add(
+                        key
+                    )
+
+    def get_evaluator(self, values, expanders):
+        """Return a function evaluating a condition of the rules for values."""
+        results = {}
+        for name, conditions in self.equalities.items():
+            try:
+                value = values[name]
+            except KeyError:
+                continue
+            if isinstance(value, str):
+                for expected, keys in conditions.items():
+                    for key in keys:
+                        results[key] = value == expected
+
+        def evaluate(condition):
+            key = self.keys.get(id(condition))
+            if key is None:
+                return condition.evaluate(values, expanders)
+            if key not in results:
+                try:
+                    results[key] = bool(condition.evaluate(values, expanders))
+                except safe_regex.RegexTimeout as e:
+                    # NOTE(sileht): The other rules with this condition fail too
+                    results[key] = e
+                    raise
+            result = results[key]
+            if isinstance(result, safe_regex.RegexTimeout):
+                raise result
+            return result
+
+        return evaluate
+
+
 @attr.s
 class PullRequestRules:
     rules = attr.ib(converter=load_pull_request_rules_schema)
 
+    # The attributes the conditions depend on
+    attributes = attr.ib(init=False)
+    # The attributes the conditions read, lengths may not need the attribute
+    read_attributes = attr.ib(init=False)
+    # The contexts the status conditions depend on, None if any can match
+    status_contexts = attr.ib(init=False)
+    # Whether an action depends on the GitHub mergeable state of the pull
+    # request, which changes with any status or review
+    depends_on_mergeable_state = attr.ib(init=False)
+
+    # The index of the conditions of the rules
+    conditions_index = attr.ib(init=False, repr=False)
+
+    STATUS_ATTRIBUTES = ("status-success", "status-failure", "status-neutral")
+
+    def __attrs_post_init__(self):
+        self.conditions_index = ConditionsIndex(self.rules)
+
+        dependencies = set()
+        self.read_attributes = set()
+        for rule in self.rules:
+            for condition in rule["conditions"]:
+                dependencies |= condition.get_dependencies()
+                self.read_attributes |= condition.get_read_attributes()
+
+        self.attributes = set(name for name, value in dependencies)
+        self.status_contexts = set()
+        for name, value in dependencies:
+            if name in self.STATUS_ATTRIBUTES:
+                if value is None:
+                    self.status_contexts = None
+                    break
+                self.status_contexts.add(value)
+
+        self.depends_on_mergeable_state = any(
+            action.depends_on_mergeable_state
+            for rule in self.rules
+            for action in rule["actions"].values()
+        )
+
     def as_dict(self):
         return {
             "rules": [
@@ -127,35 +244,130 @@ class PullRequestRules:
         rules = attr.ib()
         # The pull request to test.
         pull_request = attr.ib()
+        # The index of the conditions of the rules.
+        conditions_index = attr.ib(default=None)
 
         # The rules matching the pull request.
         matching_rules = attr.ib(init=False, default=attr.Factory(list))
 
-        # The rules not matching the pull request.
-        ignored_rules = attr.ib(init=False, default=attr.Factory(list))
+        # The rules whose evaluation took too long, with the timed out
+        # regex.
+        failed_rules = attr.ib(init=False, default=attr.Factory(list))
+
+        # The rules not matching the pull request because of a base
+        # attribute, their other conditions are evaluated when they are read.
+        _ignored_rules = attr.ib(init=False, default=attr.Factory(list))
+        _evaluated_ignored_rules = attr.ib(init=False, default=None)
+        _evaluate = attr.ib(init=False, default=None, repr=False)
 
         def __attrs_post_init__(self):
             d = self.pull_request.to_dict()
+            expanders = dict(
+                (attrib, self.pull_request.resolve_teams)
+                for attrib in self.TEAM_ATTRIBUTES
+            )
+            if self.conditions_index is None:
+                self.conditions_index = ConditionsIndex(self.rules)
+            self._evaluate = self.conditions_index.get_evaluator(d, expanders)
+
+            # NOTE(sileht): A failing condition on a base attribute is enough
+            # to ignore a rule, so they are evaluated first and only the
+            # attributes read by the remaining rules are retrieved
+            candidates = []
             for rule in self.rules:
-                ignore_rules = False
-                next_conditions_to_validate = []
-                for condition in rule["conditions"]:
-                    for attrib in self.TEAM_ATTRIBUTES:
-                        condition.set_value_expanders(
-                            attrib, self.pull_request.resolve_teams
+                try:
+                    with safe_regex.cpu_budget(config.REGEX_CPU_BUDGET):
+                        if all(
+                            self._evaluate(condition)
+                            for condition in rule["conditions"]
+                            if condition.attribute_name in self.BASE_ATTRIBUTES
+                        ):
+                            candidates.append(rule)
+                        else:
+                            self._ignored_rules.append(rule)
+                except safe_regex.RegexTimeout as e:
+                    self._add_failed_rule(rule, e)
+
+            # NOTE(sileht): Plain dicts already have all the attributes
+            if hasattr(d, "prefetch"):
+                d.prefetch(
+                    set().union(
+                        *(
+                            condition.get_read_attributes()
+                            for rule in candidates
+                            for condition in rule["conditions"]
                         )
-                    if not condition(**d):
-                        next_conditions_to_validate.append(condition)
-                        if condition.attribute_name in self.BASE_ATTRIBUTES:
-                            ignore_rules = True
-
-                if ignore_rules:
-                    self.ignored_rules.append((rule, next_conditions_to_validate))
+                    )
+                )
+
+            for rule in candidates:
+                try:
+                    with safe_regex.cpu_budget(config.REGEX_CPU_BUDGET):
+                        next_conditions_to_validate = [
+                            condition
+                            for condition in rule["conditions"]
+                            if not self._evaluate(condition)
+                        ]
+                except safe_regex.RegexTimeout as e:
+                    self._add_failed_rule(rule, e)
                 else:
                     self.matching_rules.append((rule, next_conditions_to_validate))
 
+        def _add_failed_rule(self, rule, e):
+            LOG.warning(
+                "rule evaluation took too long",
+                rule=rule["name"],
+                pattern=e.pattern,
+                pull_request=self.pull_request,
+            )
+            statsd.increment("engine.rules.regex_timeout")
+            self.failed_rules.append((rule, e.pattern))
+
+        def _is_validated(self, condition):
+            try:
+                return self._evaluate(condition)
+            except safe_regex.RegexTimeout:
+                return False
+
+        def _get_next_conditions_to_validate(self, rule, attributes=None):
+            # NOTE(sileht): These rules are ignored anyway, a condition that
+            # took too long is just not validated
+            with safe_regex.cpu_budget(config.REGEX_CPU_BUDGET):
+                return [
+                    condition
+                    for condition in rule["conditions"]
+                    if (attributes is None or condition.attribute_name in attributes)
+                    and not self._is_validated(condition)
+                ]
+
+        @property
+        def ignored_rules(self):
+            if self._evaluated_ignored_rules is None:
+                self._evaluated_ignored_rules = [
+                    (rule, self._get_next_conditions_to_validate(rule))
+                    for rule in self._ignored_rules
+                ]
+            return self._evaluated_ignored_rules
+
+        @property
+        def not_applicable_rules(self):
+            """The ignored rules with their failing base conditions.
+
+            Unlike `ignored_rules`, the attributes read by the other conditions
+            are not retrieved.
+            """
+            return [
+                (
+                    rule,
+                    self._get_next_conditions_to_validate(rule, self.BASE_ATTRIBUTES),
+                )
+                for rule in self._ignored_rules
+            ]
+
     def get_pull_request_rule(self, pull_request):
-        return self.PullRequestRuleForPR(self.rules, pull_request)
+        return self.PullRequestRuleForPR(
+            self.rules, pull_request, self.conditions_index
+        )
 
 
 class YamlInvalid(voluptuous.Invalid):
@@ -216,10 +428,32 @@ class InvalidRules(Exception):
 MERGIFY_CONFIG_FILENAMES = (".mergify.yml", ".mergify/config.yml")
 
 
-def get_mergify_config_content(repository, ref=github.GithubObject.NotSet):
-    for filename in MERGIFY_CONFIG_FILENAMES:
+# NOTE(sileht): The configuration of the default branch is cached until a push
+# on this branch touches one of MERGIFY_CONFIG_FILENAMES. The branch is part of
+# the key, so renaming the default branch doesn't serve the old configuration.
+# The content is stored base64-encoded as it may not be valid UTF-8. The filename found
+# is remembered longer, so looking up an updated configuration doesn't hit a
+# 404 first for .mergify.yml when .mergify/config.yml is used.
+CONFIG_CACHE_KEY = "config-cache~%s~%s"
+CONFIG_CACHE_TTL = 24 * 3600
+CONFIG_FILENAME_KEY = "config-filename~%s"
+CONFIG_FILENAME_TTL = 7 * 24 * 3600
+
+# NOTE(sileht): GitHub only lists the 20 first commits of a push
+PUSH_COMMITS_LIMIT = 20
+
+
+def _get_config_filenames(r, repository):
+    filename = r.get(CONFIG_FILENAME_KEY % repository.id)
+    if filename in MERGIFY_CONFIG_FILENAMES:
+        return (filename,) + tuple(f for f in MERGIFY_CONFIG_FILENAMES if f != filename)
+    return MERGIFY_CONFIG_FILENAMES
+
+
+def _fetch_mergify_config_content(repository, filenames, ref):
+    for filename in filenames:
         try:
-            return repository.get_contents(filename, ref=ref).decoded_content
+            contents = repository.get_contents(filename, ref=ref)
         except github.GithubException as e:  # pragma: no cover
             # NOTE(sileht): PyGithub is buggy here it should raise
             # UnknownObjectException. but depending of the error message
@@ -227,11 +461,114 @@ def get_mergify_config_content(repository, ref=github.GithubObject.NotSet):
             # so always catch the generic
             if e.status != 404:
                 raise
-    raise NoRules()
+        else:
+            return filename, contents.sha, contents.decoded_content
+    return None, None, None
 
 
-def get_mergify_config(repository, ref=github.GithubObject.NotSet):
+def get_mergify_config_content(repository, ref=github.GithubObject.NotSet):
+    if ref is not github.GithubObject.NotSet:
+        filename, sha, content = _fetch_mergify_config_content(
+            repository, MERGIFY_CONFIG_FILENAMES, ref
+        )
+        if filename is None:
+            raise NoRules()
+        return content
+
+    r = utils.get_redis_for_cache()
+    cache_key = CONFIG_CACHE_KEY % (repository.id, repository.default_branch)
+    cached = r.get(cache_key)
+    if cached is not None:
+        statsd.increment("engine.config_cache.hit")
+        cached = json.loads(cached)
+    else:
+        statsd.increment("engine.config_cache.miss")
+        filename, sha, content = _fetch_mergify_config_content(
+            repository, _get_config_filenames(r, repository), ref
+        )
+        cached = {
+            "filename": filename,
+            "sha": sha,
+            "content": None if content is None else base64.b64encode(content).decode(),
+        }
+        pipe = r.pipeline()
+        pipe.set(cache_key, json.dumps(cached), ex=CONFIG_CACHE_TTL)
+        if filename is not None:
+            pipe.set(
+                CONFIG_FILENAME_KEY % repository.id, filename, ex=CONFIG_FILENAME_TTL
+            )
+        pipe.execute()
+
+    if cached["filename"] is None:
+        raise NoRules()
+    return base64.b64decode(cached["content"])
+
+
+def _push_touches_config(data):
+    if (
+        data["forced"]
+        or data["created"]
+        or data["deleted"]
+        or len(data["commits"]) >= PUSH_COMMITS_LIMIT
+    ):
+        return True
+    for commit in data["commits"]:
+        for f in commit["added"] + commit["modified"] + commit["removed"]:
+            if f in MERGIFY_CONFIG_FILENAMES:
+                return True
+    return False
+
+
+def update_caches_from_event(event_type, data):
+    if (
+        event_type == "push"
+        and data["ref"] == "refs/heads/%s" % data["repository"]["default_branch"]
+        and _push_touches_config(data)
+    ):
+        utils.get_redis_for_cache().delete(
+            CONFIG_CACHE_KEY
+            % (data["repository"]["id"], data["repository"]["default_branch"])
+        )
+
+
+# NOTE(sileht): Compiling a configuration is costly (yaml, schemas, conditions
+# parsing, regexes, actions), so compiled configurations are shared by all the
+# tasks of a worker process. Tasks only get the hash of the configuration, its
+# content is stored in redis for the worker that doesn't know it yet.
+COMPILED_CONFIG_CACHE_SIZE = 512
+CONFIG_CONTENT_KEY = "config-content~%s"
+CONFIG_CONTENT_TTL = 24 * 3600
+
+
+@functools.lru_cache(maxsize=COMPILED_CONFIG_CACHE_SIZE)
+def _load_mergify_config(content):
+    statsd.increment("engine.compiled_config_cache.miss")
+    return UserConfigurationSchema(content)
+
+
+def load_mergify_config(content):
+    """Return the compiled configuration, the result must not be modified."""
     try:
-        return UserConfigurationSchema(get_mergify_config_content(repository, ref))
+        return _load_mergify_config(content)
     except voluptuous.Invalid as e:
         raise InvalidRules(e)
+
+
+def get_mergify_config(repository, ref=github.GithubObject.NotSet):
+    return load_mergify_config(get_mergify_config_content(repository, ref))
+
+
+def store_mergify_config_content(content):
+    """Store a configuration content and return its hash."""
+    config_hash = hashlib.sha256(content).hexdigest()
+    utils.get_redis_for_cache().set(
+        CONFIG_CONTENT_KEY % config_hash, content.decode(), ex=CONFIG_CONTENT_TTL
+    )
+    return config_hash
+
+
+def get_stored_mergify_config_content(config_hash):
+    content = utils.get_redis_for_cache().get(CONFIG_CONTENT_KEY % config_hash)
+    if content is None:
+        raise NoRules()
+    return content.encode()
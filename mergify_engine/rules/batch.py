@@ -0,0 +1,305 @@
+# -*- encoding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+# NOTE(sileht): Evaluation of the rules against many pull requests at once.
+# The attributes of the pull requests are given as columns, one list per
+# attribute with a value per pull request. Each condition is evaluated once
+# for all the pull requests and each distinct value is compared once: equality
+# is a set lookup, regexes search each distinct value once and lengths are
+# computed when the columns are built.
+#
+# A regex that takes too long for the whole batch is evaluated again pull
+# request by pull request, with the budget of a single evaluation, so the
+# failed rules are the same as PullRequestRules.get_pull_request_rule.
+
+import collections.abc
+import functools
+import operator
+
+import attr
+
+from mergify_engine import config
+from mergify_engine import rules
+from mergify_engine import safe_regex
+from mergify_engine.rules import filter
+
+
+@attr.s
+class PullRequestRulesMatch:
+    # The list of pull request rules matched against.
+    rules = attr.ib()
+
+    # The rules matching the pull request.
+    matching_rules = attr.ib(init=False, default=attr.Factory(list))
+
+    # The rules not matching the pull request.
+    ignored_rules = attr.ib(init=False, default=attr.Factory(list))
+
+    # The rules whose evaluation took too long, with the timed out regex.
+    failed_rules = attr.ib(init=False, default=attr.Factory(list))
+
+    # The rules whose evaluation took too long once the base conditions
+    # passed, they come last like in PullRequestRuleForPR.
+    _late_failed_rules = attr.ib(init=False, default=attr.Factory(list), repr=False)
+
+    @property
+    def not_applicable_rules(self):
+        base_attributes = rules.PullRequestRules.PullRequestRuleForPR.BASE_ATTRIBUTES
+        return [
+            (
+                rule,
+                [
+                    condition
+                    for condition in conditions
+                    if condition.attribute_name in base_attributes
+                ],
+            )
+            for rule, conditions in self.ignored_rules
+        ]
+
+
+def _get_attribute(values, name):
+    length = name.startswith(filter.Filter.LENGTH_OPERATOR)
+    # NOTE(sileht): The length may be known without the values
+    if length and name in values:
+        return values[name]
+    attribute_name = name[1:] if length else name
+    try:
+        for subname in attribute_name.split(filter.Filter.ATTR_SEPARATOR):
+            values = values[subname]
+    except KeyError:
+        raise filter.UnknownAttribute(attribute_name)
+    if length:
+        try:
+            return len(values)
+        except TypeError:
+            raise filter.InvalidOperator(name)
+    return values
+
+
+def get_columns(pull_requests_values, attributes):
+    """Build the columns of the attributes of pull requests.
+
+    :param pull_requests_values: A list of mappings of attributes, like
+                                 MergifyPull.to_dict().
+    :param attributes: The names of the attributes to read, like
+                       PullRequestRules.read_attributes.
+    :return: A dict of attribute name -> list of values, in the order of
+             the pull requests.
+    """
+    for values in pull_requests_values:
+        # NOTE(sileht): Plain dicts already have all the attributes
+        if hasattr(values, "prefetch"):
+            values.prefetch(attributes)
+    return dict(
+        (name, [_get_attribute(values, name) for values in pull_requests_values])
+        for name in attributes
+    )
+
+
+def _get_matcher(op, candidates):
+    compare = functools.partial(filter.match_any, op, candidates=candidates)
+    if op is operator.eq:
+        try:
+            compare = frozenset(candidates).__contains__
+        except TypeError:  # pragma: no cover
+            pass
+
+    results = {}
+
+    def match(item):
+        try:
+            return results[item]
+        except KeyError:
+            result = results[item] = bool(compare(item))
+            return result
+        except TypeError:  # pragma: no cover
+            # NOTE(sileht): Unhashable values are compared each time
+            return bool(filter.match_any(op, item, candidates))
+
+    return match
+
+
+def _evaluate(tree, columns, expanders):
+    op_name, nodes = list(tree.items())[0]
+    if op_name in filter.Filter.unary_operators:
+        op = filter.Filter.unary_operators[op_name]
+        return [op(result) for result in _evaluate(nodes, columns, expanders)]
+
+    op, iterable_op, compile_fn = filter.Filter.binary_operators[op_name]
+    name, value = nodes
+    value = compile_fn(value)
+    length = name.startswith(filter.Filter.LENGTH_OPERATOR)
+    attribute_name = name[1:] if length else name
+    try:
+        column = columns[name]
+    except KeyError:
+        raise filter.UnknownAttribute(attribute_name)
+
+    if length or attribute_name not in expanders:
+        candidates = (value,)
+    else:
+        candidates = expanders[attribute_name](value)
+    match = _get_matcher(op, candidates)
+
+    results = []
+    for attribute in column:
+        if isinstance(attribute, collections.abc.Sequence) and not isinstance(
+            attribute, str
+        ):
+            results.append(iterable_op(match(item) for item in attribute))
+        else:
+            results.append(match(attribute))
+    return results
+
+
+class _PullRequestEvaluator:
+    """Evaluate the conditions of a single pull request of the batch."""
+
+    def __init__(self, columns, index, expanders, keys, results):
+        self.columns = dict(
+            (name, column[index : index + 1]) for name, column in columns.items()
+        )
+        self.index = index
+        self.expanders = expanders
+        self.keys = keys
+        self.results = results
+        self.timed_out_results = {}
+
+    def __call__(self, condition):
+        key = self.keys[id(condition)]
+        result = self.results[key]
+        if result is not None:
+            return result[self.index]
+
+        if key not in self.timed_out_results:
+            try:
+                self.timed_out_results[key] = _evaluate(
+                    condition.tree, self.columns, self.expanders
+                )[0]
+            except safe_regex.RegexTimeout as e:
+                self.timed_out_results[key] = e
+        result = self.timed_out_results[key]
+        if isinstance(result, safe_regex.RegexTimeout):
+            raise result
+        return result
+
+    def is_validated(self, condition):
+        try:
+            return self(condition)
+        except safe_regex.RegexTimeout:
+            return False
+
+
+def _match_pull_request(match, rule, evaluate, base_attributes):
+    # NOTE(sileht): Same steps as PullRequestRuleForPR, base conditions first
+    try:
+        with safe_regex.cpu_budget(config.REGEX_CPU_BUDGET):
+            candidate = all(
+                evaluate(condition)
+                for condition in rule["conditions"]
+                if condition.attribute_name in base_attributes
+            )
+    except safe_regex.RegexTimeout as e:
+        match.failed_rules.append((rule, e.pattern))
+        return
+
+    if not candidate:
+        with safe_regex.cpu_budget(config.REGEX_CPU_BUDGET):
+            match.ignored_rules.append(
+                (
+                    rule,
+                    [
+                        condition
+                        for condition in rule["conditions"]
+                        if not evaluate.is_validated(condition)
+                    ],
+                )
+            )
+        return
+
+    try:
+        with safe_regex.cpu_budget(config.REGEX_CPU_BUDGET):
+            next_conditions_to_validate = [
+                condition for condition in rule["conditions"] if not evaluate(condition)
+            ]
+    except safe_regex.RegexTimeout as e:
+        match._late_failed_rules.append((rule, e.pattern))
+    else:
+        match.matching_rules.append((rule, next_conditions_to_validate))
+
+
+def get_pull_requests_rules(pull_request_rules, columns, size, expanders=None):
+    """Match rules against pull requests given as columns.
+
+    :param pull_request_rules: The PullRequestRules to match.
+    :param columns: The attributes of the pull requests, see get_columns.
+    :param size: The number of pull requests.
+    :param expanders: A dict of attribute name -> function returning the
+                      values the attribute is compared to. They are called
+                      once for all the pull requests, so they must not
+                      depend on a pull request, like the teams of the
+                      repository.
+    :return: A list of PullRequestRulesMatch, one per pull request, with the
+             same matching_rules, failed_rules and ignored_rules as
+             PullRequestRules.get_pull_request_rule.
+    """
+    if expanders is None:
+        expanders = {}
+    keys = pull_request_rules.conditions_index.keys
+    base_attributes = pull_request_rules.PullRequestRuleForPR.BASE_ATTRIBUTES
+
+    # NOTE(sileht): None is for the conditions that took too long
+    results = {}
+    for rule in pull_request_rules.rules:
+        for condition in rule["conditions"]:
+            key = keys[id(condition)]
+            if key not in results:
+                try:
+                    with safe_regex.cpu_budget(config.REGEX_CPU_BUDGET * size):
+                        results[key] = _evaluate(condition.tree, columns, expanders)
+                except safe_regex.RegexTimeout:
+                    results[key] = None
+
+    matches = [PullRequestRulesMatch(pull_request_rules.rules) for _ in range(size)]
+    evaluators = {}
+    for rule in pull_request_rules.rules:
+        conditions = [
+            (condition, results[keys[id(condition)]])
+            for condition in rule["conditions"]
+        ]
+        if any(result is None for condition, result in conditions):
+            for i, match in enumerate(matches):
+                if i not in evaluators:
+                    evaluators[i] = _PullRequestEvaluator(
+                        columns, i, expanders, keys, results
+                    )
+                _match_pull_request(match, rule, evaluators[i], base_attributes)
+            continue
+
+        for i, match in enumerate(matches):
+            next_conditions_to_validate = [
+                condition for condition, result in conditions if not result[i]
+            ]
+            if any(
+                condition.attribute_name in base_attributes
+                for condition in next_conditions_to_validate
+            ):
+                match.ignored_rules.append((rule, next_conditions_to_validate))
+            else:
+                match.matching_rules.append((rule, next_conditions_to_validate))
+
+    for match in matches:
+        match.failed_rules.extend(match._late_failed_rules)
+    return matches
@@ -13,11 +13,12 @@
 # WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
 # License for the specific language governing permissions and limitations
 # under the License.
+import collections.abc
 import operator
-import re
 
 import attr
 
+from mergify_engine import safe_regex
 from mergify_engine.rules import parser
 
 
@@ -59,6 +60,13 @@ def _identity(value):
     return value
 
 
+def match_any(op, value, candidates):
+    for candidate in candidates:
+        if op(value, candidate):
+            return True
+    return False
+
+
 @attr.s(str=False, repr=False)
 class Filter:
     unary_operators = {"-": operator.not_, "¬": operator.not_}
@@ -74,11 +82,11 @@ class Filter:
         "≥": (operator.ge, any, _identity),
         "!=": (operator.ne, all, _identity),
         "≠": (operator.ne, all, _identity),
-        "~=": (lambda a, b: a is not None and b.search(a), any, re.compile),
+        "~=": (lambda a, b: a is not None and b.search(a), any, safe_regex.compile),
     }
 
     tree = attr.ib()
-    # The name of the attribute that is going to be evaluated by this filter.
+    # The name of the attribute that is evaluated by this filter.
     attribute_name = attr.ib(init=False)
 
     # A method to resolve name externaly
@@ -89,7 +97,7 @@ class Filter:
 
     @classmethod
     def parse(cls, string):
-        return cls(parser.search.parseString(string, parseAll=True)[0])
+        return cls(parser.parse(string))
 
     def __str__(self):
         return self._tree_to_str(self.tree)
@@ -111,41 +119,69 @@ class Filter:
     def __repr__(self):  # pragma: no cover
         return "%s(%s)" % (self.__class__.__name__, str(self))
 
+    def get_dependencies(self):
+        """Return the (attribute, value) couples this filter depends on.
+
+        The value is None when any value of the attribute can change the
+        result of the filter.
+        """
+        return set(
+            (name.lstrip(self.LENGTH_OPERATOR), value)
+            for name, value in self._get_dependencies(self.tree)
+        )
+
+    def get_read_attributes(self):
+        """Return the names of the attributes read by this filter.
+
+        Unlike get_dependencies, lengths are returned as-is, as the values may
+        provide them without the whole attribute.
+        """
+        return set(name for name, value in self._get_dependencies(self.tree))
+
+    def _get_dependencies(self, tree):
+        op, nodes = list(tree.items())[0]
+        if op in self.unary_operators:
+            return self._get_dependencies(nodes)
+        name, value = nodes
+        if name.startswith(self.LENGTH_OPERATOR):
+            return {(name, None)}
+        elif self.binary_operators[op][0] in (operator.eq, operator.ne) and (
+            isinstance(value, str)
+        ):
+            return {(name, value)}
+        else:
+            return {(name, None)}
+
     def set_value_expanders(self, name, resolver):
         self._value_expanders[name] = resolver
 
     def __call__(self, **kwargs):
-        return self._eval(kwargs)
+        return self._eval(kwargs, self._value_expanders)
 
-    LENGTH_OPERATOR = "#"
-    ATTR_SEPARATOR = "."
+    def evaluate(self, values, expanders=None):
+        """Evaluate the filter against a mapping of attributes.
 
-    def _get_value_comparator(self, op, name, values):
-        if op != len and name in self._value_expanders:
-            return lambda x: any(
-                map(lambda y: op(x, y), self._value_expanders[name](values))
-            )
-        else:
-            return lambda x: op(x, values)
+        Unlike __call__, only the attributes used by the filter are read.
 
-    def _resolve_name(self, values, name):
-        if name.startswith(self.LENGTH_OPERATOR):
-            self.attribute_name = name[1:]
-            op = len
-        else:
-            self.attribute_name = name
-            op = _identity
-        try:
-            for subname in self.attribute_name.split(self.ATTR_SEPARATOR):
-                values = values[subname]
-            try:
-                return op(values)
-            except TypeError:
-                raise InvalidOperator(name)
-        except KeyError:
-            raise UnknownAttribute(self.attribute_name)
+        :param values: The attributes.
+        :param expanders: A dict of attribute name -> function returning the
+                          values the attribute is compared to, instead of the
+                          filter value. Defaults to the ones set with
+                          set_value_expanders.
+        """
+        if expanders is None:
+            expanders = self._value_expanders
+        return self._eval(values, expanders)
+
+    LENGTH_OPERATOR = "#"
+    ATTR_SEPARATOR = "."
 
     def build_evaluator(self, tree):
+        """Compile a tree to a function(values, expanders).
+
+        Attributes path and operators are resolved here once, the returned
+        function doesn't modify the filter, so it can be shared.
+        """
         items = list(tree.items())
         if len(items) != 1:
             raise ParseError(tree)
@@ -164,18 +200,58 @@ class Filter:
                 raise InvalidArguments(nodes)
 
             try:
-                nodes = (nodes[0], compile_fn(nodes[1]))
+                name, value = nodes[0], compile_fn(nodes[1])
             except Exception as e:
                 raise InvalidArguments(str(e))
 
-            def _op(values):
-                values = self._resolve_name(values, nodes[0])
-                cmp = self._get_value_comparator(op, nodes[0], nodes[1])
-
-                if isinstance(values, (list, tuple)) and op != len:
-                    return iterable_op(map(cmp, values))
-                return cmp(values)
-
-            return _op
+            return self._build_comparator(name, op, iterable_op, value)
         element = self.build_evaluator(nodes)
-        return lambda values: op(element(values))
+        return lambda values, expanders: op(element(values, expanders))
+
+    def _build_comparator(self, name, op, iterable_op, value):
+        length = name.startswith(self.LENGTH_OPERATOR)
+        attribute_name = name[1:] if length else name
+        path = tuple(attribute_name.split(self.ATTR_SEPARATOR))
+        references = (value,)
+        self.attribute_name = attribute_name
+
+        def get_attribute(values):
+            # NOTE(sileht): The length may be known without the values
+            if length and name in values:
+                return values[name]
+            try:
+                for subname in path:
+                    values = values[subname]
+            except KeyError:
+                raise UnknownAttribute(attribute_name)
+            if length:
+                try:
+                    return len(values)
+                except TypeError:
+                    raise InvalidOperator(name)
+            return values
+
+        def compare(values, expanders):
+            attribute = get_attribute(values)
+            if length or attribute_name not in expanders:
+                candidates = references
+            else:
+                candidates = expanders[attribute_name](value)
+
+            # NOTE(sileht): any and all stop at the first match or
+            # counter-example, so lazy sequences aren't read further
+            if isinstance(attribute, collections.abc.Sequence) and not isinstance(
+                attribute, str
+            ):
+                if iterable_op is any:
+                    for item in attribute:
+                        if match_any(op, item, candidates):
+                            return True
+                    return False
+                for item in attribute:
+                    if not match_any(op, item, candidates):
+                        return False
+                return True
+            return match_any(op, attribute, candidates)
+
+        return compare
@@ -13,6 +13,8 @@
 # WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
 # License for the specific language governing permissions and limitations
 # under the License.
+import functools
+
 import pyparsing
 
 
@@ -26,6 +28,7 @@ text = (
     pyparsing.QuotedString('"') | pyparsing.QuotedString("'") | pyparsing.CharsNotIn("")
 )
 milestone = pyparsing.CharsNotIn(" ")
+number = pyparsing.Word(pyparsing.nums).setParseAction(lambda toks: int(toks[0]))
 
 regex_operators = pyparsing.Literal("~=")
 
@@ -93,6 +96,10 @@ review_commented_by = "commented-reviews-by" + _match_login_or_teams
 status_success = "status-success" + _match_with_operator(text)
 status_failure = "status-failure" + _match_with_operator(text)
 status_neutral = "status-neutral" + _match_with_operator(text)
+commits = "commits" + simple_operators + number
+additions = "additions" + simple_operators + number
+deletions = "deletions" + simple_operators + number
+changed_files = "changed-files" + simple_operators + number
 
 search = (
     pyparsing.Optional(
@@ -127,5 +134,165 @@ search = (
         | status_success
         | status_neutral
         | status_failure
+        | commits
+        | additions
+        | deletions
+        | changed_files
     )
 ).setParseAction(_token_to_dict)
+
+
+# NOTE(sileht): A hand-written parser for the usual conditions, it returns the
+# same trees as search. Anything it doesn't recognize, like quoted strings or
+# spaces around the operators, is left to pyparsing, so errors are reported by
+# pyparsing too.
+
+PARSE_CACHE_SIZE = 4096
+
+_NOT_PREFIXES = {"-": True, "¬": True, "+": False}
+_SIMPLE_OPERATORS = (":", "=", "==", "!=", "≠", ">=", "≥", "<=", "≤", "<", ">")
+_DIGITS = frozenset("0123456789")
+
+
+def _chars_not_in(chars):
+    chars = frozenset(chars)
+
+    def parse(value):
+        if value and chars.isdisjoint(value):
+            return value
+
+    return parse
+
+
+_parse_git_branch = _chars_not_in("~^: []\\")
+_parse_github_login = _chars_not_in(" /@")
+_parse_milestone = _chars_not_in(" ")
+
+
+def _parse_regexp(value):
+    if value:
+        return value
+
+
+def _parse_text(value):
+    # NOTE(sileht): pyparsing skips the whitespaces before a quoted string
+    if value and value.lstrip()[:1] not in ('"', "'"):
+        return value
+
+
+def _parse_number(value):
+    if value and _DIGITS.issuperset(value):
+        return int(value)
+
+
+def _parse_login_or_team(value):
+    if _parse_github_login(value) is not None:
+        return value
+    if value.startswith("@"):
+        organization, slash, team = value[1:].partition("/")
+        if _parse_github_login(organization) is not None and (
+            not slash or _parse_github_login(team) is not None
+        ):
+            return value
+
+
+# NOTE(sileht): In the order of search, with the value parser for simple
+# operators, if regexes are allowed, None is for booleans
+_ATTRIBUTES = (
+    ("head", _parse_git_branch, True),
+    ("base", _parse_git_branch, True),
+    ("author", _parse_login_or_team, True),
+    ("merged-by", _parse_login_or_team, True),
+    ("body", _parse_text, True),
+    ("assignee", _parse_login_or_team, True),
+    ("label", _parse_text, True),
+    ("locked", None, False),
+    ("closed", None, False),
+    ("conflict", None, False),
+    ("merged", None, False),
+    ("title", _parse_text, True),
+    ("files", _parse_text, True),
+    ("milestone", _parse_milestone, True),
+    ("review-requested", _parse_login_or_team, True),
+    ("approved-reviews-by", _parse_login_or_team, True),
+    ("dismissed-reviews-by", _parse_login_or_team, True),
+    ("changes-requested-reviews-by", _parse_login_or_team, True),
+    ("commented-reviews-by", _parse_login_or_team, True),
+    ("status-success", _parse_text, True),
+    ("status-neutral", _parse_text, True),
+    ("status-failure", _parse_text, True),
+    ("commits", _parse_number, False),
+    ("additions", _parse_number, False),
+    ("deletions", _parse_number, False),
+    ("changed-files", _parse_number, False),
+)
+
+
+def _parse_operator(string, value_parser, regex):
+    if regex and string.startswith("~="):
+        return "~=", _parse_regexp(string[2:])
+    for op in _SIMPLE_OPERATORS:
+        if string.startswith(op):
+            return "=" if op == ":" else op, value_parser(string[len(op) :])
+    return None, None
+
+
+def _fast_parse(string):
+    # NOTE(sileht): pyparsing skips whitespaces between tokens and expands
+    # tabs, leave that to it
+    if not string or "\t" in string or "\n" in string or "\r" in string:
+        return
+    if string[0] == " " or string[-1] == " ":
+        return
+
+    not_ = _NOT_PREFIXES.get(string[0])
+    if not_ is None:
+        not_ = False
+    else:
+        string = string[1:]
+    key_op = ""
+    if string.startswith("#"):
+        key_op = "#"
+        string = string[1:]
+
+    for name, value_parser, regex in _ATTRIBUTES:
+        if not string.startswith(name):
+            continue
+        rest = string[len(name) :]
+        if value_parser is None:
+            if rest:
+                return
+            op, value = "=", True
+        else:
+            op, value = _parse_operator(rest, value_parser, regex)
+            if op is None:
+                continue
+            if value is None:
+                return
+        break
+    else:
+        return
+
+    if key_op == "#":
+        if isinstance(value, str):
+            if not _DIGITS.issuperset(value):
+                return
+        value = int(value)
+    d = {op: (key_op + name, value)}
+    if not_:
+        return {"-": d}
+    return d
+
+
+@functools.lru_cache(maxsize=PARSE_CACHE_SIZE)
+def parse(string):
+    """Parse a condition to its tree.
+
+    The trees are cached and shared, they must not be modified.
+
+    :raise pyparsing.ParseException: if the condition is invalid.
+    """
+    tree = _fast_parse(string)
+    if tree is None:
+        tree = search.parseString(string, parseAll=True)[0]
+    return tree
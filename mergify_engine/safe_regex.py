@@ -0,0 +1,315 @@
+# -*- encoding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+# NOTE(sileht): Users put regexes in their configuration. A regex where a
+# repeat can match the same characters than what follows it inside another
+# repeat, like (a+)+ or (a|aa)+, backtracks exponentially when it doesn't
+# match. Unbounded repeats of a character that follow each other and match
+# the same characters, like \s*\s*\s*x, backtrack polynomially. These
+# regexes are rejected when they are compiled.
+#
+# The others can still be slow on large inputs, so their searches run with a
+# CPU budget. The re module checks for signals while searching, so a search
+# of the main thread is interrupted by a CPU timer when the budget is
+# exhausted. Other threads can't receive signals, they refuse to search
+# texts longer than MAX_UNINTERRUPTIBLE_LENGTH instead.
+
+import contextlib
+import functools
+import re
+import signal
+import sre_parse
+import threading
+import time
+
+import attr
+
+
+class UnsafeRegex(ValueError):
+    def __init__(self, pattern, reason):
+        super().__init__(
+            "Regex `%s` may take too long to evaluate: %s" % (pattern, reason)
+        )
+        self.pattern = pattern
+        self.reason = reason
+
+
+class RegexTimeout(Exception):
+    def __init__(self, pattern):
+        super().__init__("Regex `%s` took too long to evaluate" % pattern)
+        self.pattern = pattern
+
+
+# NOTE(sileht): Characters sets are approximated by the characters of this
+# alphabet they contain
+_ALPHABET = frozenset(chr(i) for i in range(256))
+
+_CATEGORIES = {
+    sre_parse.CATEGORY_DIGIT: str.isdecimal,
+    sre_parse.CATEGORY_NOT_DIGIT: lambda c: not c.isdecimal(),
+    sre_parse.CATEGORY_SPACE: str.isspace,
+    sre_parse.CATEGORY_NOT_SPACE: lambda c: not c.isspace(),
+    sre_parse.CATEGORY_WORD: lambda c: c.isalnum() or c == "_",
+    sre_parse.CATEGORY_NOT_WORD: lambda c: not (c.isalnum() or c == "_"),
+}
+
+MAX_UNINTERRUPTIBLE_LENGTH = 4096
+
+_REPEATS = (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT)
+# NOTE(sileht): These never backtrack into their content (Python >= 3.11)
+_POSSESSIVE_REPEAT = getattr(sre_parse, "POSSESSIVE_REPEAT", None)
+_ATOMIC_GROUP = getattr(sre_parse, "ATOMIC_GROUP", None)
+
+
+def _get_set(items):
+    chars = set()
+    negate = False
+    for op, av in items:
+        if op == sre_parse.NEGATE:
+            negate = True
+        elif op == sre_parse.LITERAL:
+            chars.add(chr(av))
+        elif op == sre_parse.RANGE:
+            low, high = av
+            chars.add(chr(low))
+            chars.update(chr(i) for i in range(low, min(high, 255) + 1))
+        elif op == sre_parse.CATEGORY and av in _CATEGORIES:
+            chars.update(filter(_CATEGORIES[av], _ALPHABET))
+        else:
+            return _ALPHABET
+    if negate:
+        return _ALPHABET - chars
+    return chars
+
+
+def _get_first(items):
+    """Return the characters that can start a match of items and if items
+    can match the empty string."""
+    first = set()
+    for op, av in items:
+        if op == sre_parse.LITERAL:
+            return first | {chr(av)}, False
+        elif op == sre_parse.NOT_LITERAL:
+            return first | (_ALPHABET - {chr(av)}), False
+        elif op == sre_parse.ANY:
+            return first | _ALPHABET, False
+        elif op == sre_parse.IN:
+            return first | _get_set(av), False
+        elif op == sre_parse.AT or op in (sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+            continue
+        elif op == sre_parse.SUBPATTERN:
+            chars, nullable = _get_first(av[-1])
+        elif op == sre_parse.BRANCH:
+            chars, nullable = set(), False
+            for branch in av[1]:
+                branch_chars, branch_nullable = _get_first(branch)
+                chars |= branch_chars
+                nullable = nullable or branch_nullable
+        elif op in _REPEATS or op == _POSSESSIVE_REPEAT:
+            chars, nullable = _get_first(av[2])
+            nullable = nullable or av[0] == 0
+        elif op == _ATOMIC_GROUP:
+            chars, nullable = _get_first(av)
+        else:
+            # NOTE(sileht): Group references, conditionals...
+            chars, nullable = _ALPHABET, True
+        first |= chars
+        if not nullable:
+            return first, False
+    return first, True
+
+
+def _check_repeated(pattern, items, follow):
+    """Check items repeated by an outer repeat.
+
+    :param follow: the characters that can follow items.
+    """
+    for i, (op, av) in enumerate(items):
+        item_follow, nullable = _get_first(items[i + 1 :])
+        if nullable:
+            item_follow |= follow
+
+        # NOTE(sileht): Optional items can also be skipped or not
+        if op in _REPEATS and av[0] != av[1]:
+            chars, _ = _get_first(av[2])
+            if chars & item_follow:
+                raise UnsafeRegex(
+                    pattern, "a repeat inside another one can match what follows it",
+                )
+            _check_repeated(pattern, av[2], chars | item_follow)
+        elif op == sre_parse.SUBPATTERN:
+            _check_repeated(pattern, av[-1], item_follow)
+        elif op == sre_parse.BRANCH:
+            matched = set()
+            for branch in av[1]:
+                chars, nullable = _get_first(branch)
+                if nullable:
+                    chars |= item_follow
+                if chars & matched:
+                    raise UnsafeRegex(
+                        pattern,
+                        "the alternatives inside a repeat can match the same text",
+                    )
+                matched |= chars
+                _check_repeated(pattern, branch, item_follow)
+
+
+_CHARACTERS = (
+    sre_parse.LITERAL,
+    sre_parse.NOT_LITERAL,
+    sre_parse.ANY,
+    sre_parse.IN,
+)
+
+
+def _get_repeated_chars(op, av):
+    """Return the characters of an unbounded repeat of a single character."""
+    if (
+        op in _REPEATS
+        and av[1] == sre_parse.MAXREPEAT
+        and len(av[2]) == 1
+        and av[2][0][0] in _CHARACTERS
+    ):
+        return _get_first(av[2])[0]
+
+
+def _check_sequence(pattern, items):
+    """Check unbounded repeats of a character that follow each other."""
+    for i, (op, av) in enumerate(items):
+        chars = _get_repeated_chars(op, av)
+        if not chars:
+            continue
+        for next_op, next_av in items[i + 1 :]:
+            next_chars = _get_repeated_chars(next_op, next_av)
+            if next_chars and chars & next_chars:
+                raise UnsafeRegex(
+                    pattern, "repeats that follow each other can match the same text",
+                )
+            # NOTE(sileht): Only what can be skipped separates the repeats
+            if not _get_first([(next_op, next_av)])[1]:
+                break
+
+
+def _check(pattern, items):
+    _check_sequence(pattern, items)
+    for op, av in items:
+        if op in _REPEATS:
+            if av[1] > 1:
+                first, _ = _get_first(av[2])
+                _check_repeated(pattern, av[2], first)
+            _check(pattern, av[2])
+        elif op == sre_parse.SUBPATTERN:
+            _check(pattern, av[-1])
+        elif op == sre_parse.BRANCH:
+            for branch in av[1]:
+                _check(pattern, branch)
+        elif op in (sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+            _check(pattern, av[1])
+        elif op == _POSSESSIVE_REPEAT:
+            _check(pattern, av[2])
+        elif op == _ATOMIC_GROUP:
+            _check(pattern, av)
+
+
+@functools.lru_cache(maxsize=1024)
+def check(pattern):
+    """Check that a regex can't backtrack exponentially or polynomially because
+    of repeats that follow each other.
+
+    :raise UnsafeRegex: if it can.
+    """
+    _check(pattern, sre_parse.parse(pattern))
+
+
+_budget = threading.local()
+
+
+def _on_timer(signum, frame):
+    pattern = getattr(_budget, "searching", None)
+    if pattern is not None:
+        raise RegexTimeout(pattern)
+
+
+@contextlib.contextmanager
+def cpu_budget(seconds):
+    """Limit the CPU time the regexes searches of the current thread can use.
+
+    :raise RegexTimeout: when a search uses more than the budget left.
+    """
+    previous = getattr(_budget, "deadline", None)
+    deadline = time.thread_time() + seconds
+    if previous is not None:
+        deadline = min(deadline, previous)
+    _budget.deadline = deadline
+    try:
+        yield
+    finally:
+        _budget.deadline = previous
+
+
+@attr.s(frozen=True, slots=True)
+class SafePattern:
+    """A compiled regex whose searches use the CPU budget of the thread."""
+
+    regex = attr.ib()
+
+    @property
+    def pattern(self):
+        return self.regex.pattern
+
+    def _call(self, method, string):
+        deadline = getattr(_budget, "deadline", None)
+        if deadline is None:
+            return method(string)
+        remaining = deadline - time.thread_time()
+        if remaining <= 0:
+            raise RegexTimeout(self.regex.pattern)
+
+        if threading.current_thread() is not threading.main_thread():
+            if len(string) > MAX_UNINTERRUPTIBLE_LENGTH:
+                raise RegexTimeout(self.regex.pattern)
+            return method(string)
+
+        if signal.getsignal(signal.SIGVTALRM) is not _on_timer:
+            signal.signal(signal.SIGVTALRM, _on_timer)
+        _budget.searching = self.regex.pattern
+        signal.setitimer(signal.ITIMER_VIRTUAL, remaining)
+        try:
+            return method(string)
+        except RegexTimeout:
+            # NOTE(sileht): The timer counts the CPU time of all the threads,
+            # so it may fire before the thread exhausted its budget
+            _budget.deadline = 0
+            raise
+        finally:
+            signal.setitimer(signal.ITIMER_VIRTUAL, 0)
+            _budget.searching = None
+
+    def search(self, string):
+        return self._call(self.regex.search, string)
+
+    def match(self, string):
+        return self._call(self.regex.match, string)
+
+
+def compile(pattern):
+    """Compile a regex after checking it's safe.
+
+    :raise re.error: if the regex is invalid.
+    :raise UnsafeRegex: if the regex can backtrack exponentially or repeats
+                        the same text.
+    """
+    regex = re.compile(pattern)
+    check(pattern)
+    return SafePattern(regex)
@@ -24,9 +24,8 @@ from cryptography.hazmat.primitives import hashes
 
 import daiquiri
 
-import requests
-
 from mergify_engine import config
+from mergify_engine import http_pool
 
 
 LOG = daiquiri.getLogger(__name__)
@@ -95,7 +94,7 @@ def _decrypt(value):
 
 def _retrieve_subscription_from_db(installation_id):
     LOG.debug("Subscription not cached, retrieving it...", install_id=installation_id)
-    resp = requests.get(
+    resp = http_pool.get_session().get(
         config.SUBSCRIPTION_URL % installation_id,
         auth=(config.OAUTH_CLIENT_ID, config.OAUTH_CLIENT_SECRET),
     )
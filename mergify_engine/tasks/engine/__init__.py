@@ -11,12 +11,20 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import datetime
+
 import daiquiri
 
+from datadog import statsd
+
 import github
 
 from mergify_engine import check_api
 from mergify_engine import config
+from mergify_engine import github_app
+from mergify_engine import hydration
+from mergify_engine import pull_index
+from mergify_engine import ratelimit
 from mergify_engine import rules
 from mergify_engine import sub_utils
 from mergify_engine import utils
@@ -28,8 +36,16 @@ LOG = daiquiri.getLogger(__name__)
 
 
 def get_github_pull_from_sha(repo, sha):
-    for pull in repo.get_pulls():
-        if pull.head.sha == sha:
+    numbers = pull_index.get_open_pull_numbers(repo, head_sha=sha)
+    if numbers is None:
+        for pull in repo.get_pulls():
+            if pull.head.sha == sha:
+                return pull
+        return
+
+    for number in numbers:
+        pull = hydration.get_pull(repo, number, head_sha=sha)
+        if pull.state == "open" and pull.head.sha == sha:
             return pull
 
 
@@ -41,7 +57,9 @@ def get_github_pull_from_event(repo, event_type, data):
 
     elif event_type == "issue_comment":
         try:
-            return repo.get_pull(data["issue"]["number"])
+            return hydration.get_pull(
+                repo, data["issue"]["number"], updated_at=data["issue"]["updated_at"]
+            )
         except github.UnknownObjectException:  # pragma: no cover
             pass
 
@@ -63,7 +81,7 @@ def get_github_pull_from_event(repo, event_type, data):
 
         for p in pulls:
             try:
-                pull = repo.get_pull(p["number"])
+                pull = hydration.get_pull(repo, p["number"], head_sha=sha)
             except github.UnknownObjectException:  # pragma: no cover
                 continue
 
@@ -137,11 +155,82 @@ def copy_summary_from_previous_head_sha(g_pull, sha):
     )
 
 
+PULL_REQUEST_ACTION_ATTRIBUTES = {
+    "labeled": "label",
+    "unlabeled": "label",
+    "locked": "locked",
+    "unlocked": "locked",
+}
+REVIEW_ATTRIBUTES = (
+    "approved-reviews-by",
+    "dismissed-reviews-by",
+    "changes-requested-reviews-by",
+    "commented-reviews-by",
+    # NOTE(sileht): Reviewing removes the reviewer from the requested ones
+    "review-requested",
+)
+
+
+def get_irrelevant_reason(repo, event_type, data):
+    """Return why an event can't change the outcome of any rule, if so."""
+    if not config.SKIP_IRRELEVANT_EVENTS:
+        return
+
+    if event_type not in [
+        "pull_request",
+        "pull_request_review",
+        "status",
+        "check_run",
+    ] or (
+        event_type == "pull_request"
+        and data["action"] not in PULL_REQUEST_ACTION_ATTRIBUTES
+    ):
+        return
+
+    try:
+        pull_request_rules = rules.get_mergify_config(repo)["pull_request_rules"]
+    except (rules.NoRules, rules.InvalidRules):
+        return
+
+    # NOTE(sileht): The mandatory Mergify rules only depend on attributes of
+    # pull_request events that are never skipped
+    if event_type == "pull_request":
+        attribute = PULL_REQUEST_ACTION_ATTRIBUTES.get(data["action"])
+        if attribute is not None and attribute not in pull_request_rules.attributes:
+            return "no rule depends on %s" % attribute
+
+    elif event_type == "pull_request_review":
+        if not pull_request_rules.depends_on_mergeable_state and not (
+            pull_request_rules.attributes & set(REVIEW_ATTRIBUTES)
+        ):
+            return "no rule depends on reviews"
+
+    elif event_type in ["status", "check_run"]:
+        if event_type == "status":
+            context = data["context"]
+            # Pending statuses are already filtered out
+            completed = True
+        elif data["check_run"]["app"]["id"] == config.INTEGRATION_ID:
+            return
+        else:
+            context = data["check_run"]["name"]
+            completed = data["check_run"]["status"] == "completed"
+
+        # NOTE(sileht): A completed status may unblock branch protection, so
+        # the pull request may become mergeable
+        if (
+            pull_request_rules.status_contexts is not None
+            and context not in pull_request_rules.status_contexts
+            and (not completed or not pull_request_rules.depends_on_mergeable_state)
+        ):
+            return "no rule depends on %s status" % context
+
+
 @app.task
 def run(event_type, data):
     """Everything starts here."""
     installation_id = data["installation"]["id"]
-    installation_token = utils.get_installation_token(installation_id)
+    installation_token = github_app.get_installation_token(installation_id)
     if not installation_token:
         return
 
@@ -150,21 +239,27 @@ def run(event_type, data):
     )
 
     if config.LOG_RATELIMIT:  # pragma: no cover
-        rate = g.get_rate_limit().rate
-        LOG.info(
-            "ratelimit: %s/%s, reset at %s",
-            rate.remaining,
-            rate.limit,
-            rate.reset,
-            repository=data["repository"]["name"],
-        )
+        rate = ratelimit.get(installation_id)
+        if rate:
+            LOG.info(
+                "ratelimit: %s/%s, reset at %s",
+                rate["remaining"],
+                rate["limit"],
+                datetime.datetime.utcfromtimestamp(rate["reset"]),
+                repository=data["repository"]["name"],
+            )
 
-    try:
-        repo = g.get_repo(
-            data["repository"]["owner"]["login"] + "/" + data["repository"]["name"]
+    repo = hydration.get_repository(g, data["repository"])
+
+    irrelevant_reason = get_irrelevant_reason(repo, event_type, data)
+    if irrelevant_reason:
+        statsd.increment("engine.events.skipped", tags=[f"event_type:{event_type}"])
+        LOG.info(
+            "No need to proceed queue (%s)",
+            irrelevant_reason,
+            event_type=event_type,
+            repo=repo.full_name,
         )
-    except github.UnknownObjectException:  # pragma: no cover
-        LOG.info("Repository not found in the event %s, ignoring", event_type)
         return
 
     event_pull = get_github_pull_from_event(repo, event_type, data)
@@ -237,7 +332,8 @@ def run(event_type, data):
 
     # BRANCH CONFIGURATION CHECKING
     try:
-        mergify_config = rules.get_mergify_config(repo)
+        mergify_config_content = rules.get_mergify_config_content(repo)
+        rules.load_mergify_config(mergify_config_content)
     except rules.NoRules:  # pragma: no cover
         LOG.info(
             "No need to proceed queue (.mergify.yml is missing)",
@@ -294,7 +390,7 @@ def run(event_type, data):
     else:
         actions_runner.handle.s(
             installation_id,
-            mergify_config["pull_request_rules"].as_dict(),
+            rules.store_mergify_config_content(mergify_config_content),
             event_type,
             data,
         ).apply_async()
@@ -13,6 +13,7 @@
 # under the License.
 
 import base64
+import functools
 
 import daiquiri
 from datadog import statsd
@@ -22,10 +23,11 @@ import pkg_resources
 import yaml
 
 from mergify_engine import check_api
+from mergify_engine import config
 from mergify_engine import doc
+from mergify_engine import github_app
 from mergify_engine import mergify_pull
 from mergify_engine import rules
-from mergify_engine import utils
 from mergify_engine.worker import app
 
 LOG = daiquiri.getLogger(__name__)
@@ -40,6 +42,8 @@ with open(mergify_rule_path, "r") as f:
 
 PULL_REQUEST_EMBEDDED_CHECK_BACKLOG = 10
 
+PULL_REQUEST_RULES_CACHE_SIZE = 512
+
 SUMMARY_NAME = "Summary"
 
 NOT_APPLICABLE_TEMPLATE = """<details>
@@ -114,11 +118,45 @@ def gen_summary_rules(rules):
     return summary
 
 
+def gen_summary_not_applicable_rules(rules):
+    summary = ""
+    for rule, failing_conditions in rules:
+        if rule["hidden"]:
+            continue
+        summary += "#### Rule: %s" % rule["name"]
+        summary += " (%s)" % ", ".join(rule["actions"])
+        for cond in failing_conditions:
+            summary += "\n- [ ] `%s`" % cond
+        summary += "\n\n"
+    return summary
+
+
+def gen_summary_failed_rules(rules):
+    summary = ""
+    for rule, pattern in rules:
+        if rule["hidden"]:
+            continue
+        summary += "#### Rule: %s" % rule["name"]
+        summary += " (%s)" % ", ".join(rule["actions"])
+        summary += (
+            "\n⚠️ The evaluation of this rule has been cancelled, "
+            "the regex `%s` took too long to evaluate\n\n" % pattern
+        )
+    return summary
+
+
 def gen_summary(event_type, data, pull, match):
     summary = ""
     summary += get_already_merged_summary(event_type, data, pull, match)
     summary += gen_summary_rules(match.matching_rules)
-    ignored_rules = len(list(filter(lambda x: not x[0]["hidden"], match.ignored_rules)))
+    summary += gen_summary_failed_rules(match.failed_rules)
+    if config.SUMMARY_BASE_CONDITIONS:
+        not_applicable_rules = match.not_applicable_rules
+    else:
+        not_applicable_rules = match.ignored_rules
+    ignored_rules = len(
+        list(filter(lambda x: not x[0]["hidden"], not_applicable_rules))
+    )
 
     commit_message = pull.get_merge_commit_message()
     if commit_message:
@@ -136,7 +174,10 @@ def gen_summary(event_type, data, pull, match):
             summary += "<summary>%d not applicable rule</summary>\n\n" % ignored_rules
         else:
             summary += "<summary>%d not applicable rules</summary>\n\n" % ignored_rules
-        summary += gen_summary_rules(match.ignored_rules)
+        if config.SUMMARY_BASE_CONDITIONS:
+            summary += gen_summary_not_applicable_rules(not_applicable_rules)
+        else:
+            summary += gen_summary_rules(not_applicable_rules)
         summary += "</details>\n"
 
     completed_rules = len(list(filter(lambda x: not x[1], match.matching_rules)))
@@ -153,6 +194,11 @@ def gen_summary(event_type, data, pull, match):
     elif potential_rules > 1:
         summary_title.append("%s potential rules" % potential_rules)
 
+    if len(match.failed_rules) == 1:
+        summary_title.append("1 rule failed")
+    elif len(match.failed_rules) > 1:
+        summary_title.append("%d rules failed" % len(match.failed_rules))
+
     if completed_rules == 0 and potential_rules == 0:
         summary_title.append("no rules match, no planned actions")
 
@@ -277,8 +323,11 @@ def run_actions(
 
     actions_ran = set()
     conclusions = {}
+    # NOTE(sileht): We don't know if a failed rule still matches, so its
+    # actions are cancelled like if none of its conditions were validated
+    failed_rules = [(rule, list(rule["conditions"])) for rule, _ in match.failed_rules]
     # Run actions
-    for rule, missing_conditions in match.matching_rules:
+    for rule, missing_conditions in match.matching_rules + failed_rules:
         for action in rule["actions"]:
             check_name = "Rule: %s (%s)" % (rule["name"], action)
 
@@ -345,7 +394,10 @@ def run_actions(
             if report and report[0] is not None and method_name == "run":
                 statsd.increment("engine.actions.count", tags=["name:%s" % action])
 
-            if report:
+            if report and pull.head_sha_outdated:
+                # NOTE(sileht): The engine runs again for the new head sha
+                conclusions[check_name] = report[0]
+            elif report:
                 conclusion, title, summary = report
                 status = "completed" if conclusion else "in_progress"
                 try:
@@ -379,19 +431,45 @@ def run_actions(
     return conclusions
 
 
+@functools.lru_cache(maxsize=PULL_REQUEST_RULES_CACHE_SIZE)
+def get_pull_request_rules(config_hash):
+    """Return the compiled pull request rules of a configuration hash.
+
+    The result is shared by all tasks of the process and must not be modified.
+    """
+    content = rules.get_stored_mergify_config_content(config_hash)
+    pull_request_rules_raw = rules.load_mergify_config(content)[
+        "pull_request_rules"
+    ].as_dict()
+    # Some mandatory rules
+    pull_request_rules_raw["rules"].extend(MERGIFY_RULE["rules"])
+    return rules.PullRequestRules(**pull_request_rules_raw)
+
+
 @app.task
-def handle(installation_id, pull_request_rules_raw, event_type, data):
+def handle(installation_id, config_hash, event_type, data):
 
-    installation_token = utils.get_installation_token(installation_id)
+    installation_token = github_app.get_installation_token(installation_id)
     if not installation_token:
         return
 
-    # Some mandatory rules
-    pull_request_rules_raw["rules"].extend(MERGIFY_RULE["rules"])
+    # NOTE(sileht): Tasks queued before the upgrade carry the rules themselves
+    if isinstance(config_hash, dict):  # pragma: no cover
+        config_hash["rules"].extend(MERGIFY_RULE["rules"])
+        pull_request_rules = rules.PullRequestRules(**config_hash)
+    else:
+        try:
+            pull_request_rules = get_pull_request_rules(config_hash)
+        except rules.NoRules:  # pragma: no cover
+            LOG.error(
+                "configuration expired before the task run",
+                config_hash=config_hash,
+                pull_request=data["pull_request"]["number"],
+            )
+            return
 
-    pull_request_rules = rules.PullRequestRules(**pull_request_rules_raw)
     pull = mergify_pull.MergifyPull.from_raw(
-        installation_id, installation_token, data["pull_request"]
+        installation_id, installation_token, data["pull_request"], defer_waits=True
     )
     match = pull_request_rules.get_pull_request_rule(pull)
     checks = dict(
@@ -412,4 +490,10 @@ def handle(installation_id, pull_request_rules_raw, event_type, data):
         previous_conclusions,
     )
 
+    if pull.head_sha_outdated:
+        LOG.info(
+            "summary not posted, the head sha is outdated", pull_request=pull,
+        )
+        return
+
     post_summary(event_type, data, pull, match, summary_check, conclusions)
@@ -23,8 +23,9 @@ import voluptuous
 
 from mergify_engine import actions
 from mergify_engine import config
+from mergify_engine import github_app
 from mergify_engine import mergify_pull
-from mergify_engine import utils
+from mergify_engine import permissions
 from mergify_engine.worker import app
 
 LOG = daiquiri.getLogger(__name__)
@@ -69,20 +70,20 @@ def spawn_pending_commands_tasks(installation_id, event_type, data, g_pull):
 
 @app.task
 def run_command(installation_id, event_type, data, comment, rerun=False):
-    installation_token = utils.get_installation_token(installation_id)
+    installation_token = github_app.get_installation_token(installation_id)
     if not installation_token:
         return
 
     pull = mergify_pull.MergifyPull.from_raw(
-        installation_id, installation_token, data["pull_request"]
+        installation_id, installation_token, data["pull_request"], defer_waits=True
     )
 
     # Run command only if this is a pending task or if user have permission to do it.
     if (
         rerun
         or data["comment"]["user"]["id"] == config.BOT_USER_ID
-        or pull.g_pull.base.repo.get_collaborator_permission(
-            data["comment"]["user"]["login"]
+        or permissions.get_collaborator_permission(
+            pull.g_pull.base.repo, data["comment"]["user"]["login"]
         )
         in ["admin", "write"]
     ):
@@ -12,11 +12,10 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
-import requests
-
+from mergify_engine import http_pool
 from mergify_engine.worker import app
 
 
 @app.task
 def post(url, data, headers):
-    requests.post(url, data=data.encode(), headers=headers)
+    http_pool.get_session().post(url, data=data.encode(), headers=headers)
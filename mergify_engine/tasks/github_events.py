@@ -20,7 +20,13 @@ import github
 
 
 from mergify_engine import config
+from mergify_engine import github_app
+from mergify_engine import hydration
+from mergify_engine import permissions
+from mergify_engine import pull_index
+from mergify_engine import rules
 from mergify_engine import sub_utils
+from mergify_engine import teams
 from mergify_engine import utils
 from mergify_engine.tasks import engine
 from mergify_engine.tasks import mergify_events
@@ -34,10 +40,9 @@ def job_marketplace(event_type, event_id, data):
 
     owner = data["marketplace_purchase"]["account"]["login"]
     account_type = data["marketplace_purchase"]["account"]["type"]
-    integration = github.GithubIntegration(config.INTEGRATION_ID, config.PRIVATE_KEY)
     try:
-        installation_id = utils.get_installation_id(
-            integration, owner, account_type=account_type
+        installation_id = github_app.get_installation_id(
+            owner, account_type=account_type
         )
     except github.GithubException as e:
         LOG.warning("%s: mergify not installed", owner, error=str(e))
@@ -177,6 +182,12 @@ def meter_event(event_type, data):
 @app.task
 def job_filter_and_dispatch(event_type, event_id, data):
     meter_event(event_type, data)
+    github_app.update_caches_from_event(event_type, data)
+    hydration.update_caches_from_event(event_type, data)
+    pull_index.update_caches_from_event(event_type, data)
+    permissions.update_caches_from_event(event_type, data)
+    teams.update_caches_from_event(event_type, data)
+    rules.update_caches_from_event(event_type, data)
 
     if "installation" in data:
         installation_id = data["installation"]["id"]
@@ -20,7 +20,8 @@ import github
 
 
 from mergify_engine import config
-from mergify_engine import utils
+from mergify_engine import github_app
+from mergify_engine import ratelimit
 from mergify_engine.tasks import github_events
 from mergify_engine.worker import app
 
@@ -31,16 +32,24 @@ LOG = daiquiri.getLogger(__name__)
 def job_refresh(owner, repo, kind, ref=None):
     LOG.info("%s/%s/%s/%s: refreshing", owner, repo, kind, ref)
 
-    integration = github.GithubIntegration(config.INTEGRATION_ID, config.PRIVATE_KEY)
     try:
-        installation_id = utils.get_installation_id(integration, owner, repo)
+        installation_id = github_app.get_installation_id(owner, repo)
     except github.GithubException as e:
         LOG.warning(
             "%s/%s/%s/%s: mergify not installed", owner, repo, kind, ref, error=str(e)
         )
         return
 
-    token = integration.get_access_token(installation_id).token
+    delay = ratelimit.defer_if_budget_low(
+        installation_id, "refresh", repository="%s/%s" % (owner, repo)
+    )
+    if delay:
+        job_refresh.s(owner, repo, kind, ref).apply_async(countdown=delay)
+        return
+
+    token = github_app.get_installation_token(installation_id)
+    if not token:  # pragma: no cover
+        return
     g = github.Github(token, base_url="https://api.%s" % config.GITHUB_DOMAIN)
     r = g.get_repo("%s/%s" % (owner, repo))
 
@@ -0,0 +1,75 @@
+# -*- encoding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import json
+
+import daiquiri
+
+from datadog import statsd
+
+from mergify_engine import utils
+
+LOG = daiquiri.getLogger(__name__)
+
+# NOTE(sileht): Members of the teams of an organization, the hash fields are
+# the team slugs and the values the members logins, or null when the
+# organization has no such team. Teams changes (team event) invalidate the
+# whole organization, members changes (membership event) only the team.
+TEAM_MEMBERS_CACHE_KEY = "team-members~%s"
+TEAM_MEMBERS_CACHE_TTL = 3600
+
+
+def _get_key(organization):
+    return TEAM_MEMBERS_CACHE_KEY % organization.lower()
+
+
+def get_team_members(g, organization, team_slug):
+    """Return the members logins of a team, from the cache if possible.
+
+    :return: a list of logins or None if the organization has no such team.
+    """
+    key = _get_key(organization)
+    r = utils.get_redis_for_cache()
+    cached = r.hget(key, team_slug)
+    if cached is not None:
+        statsd.increment("engine.team_members_cache.hit")
+        return json.loads(cached)
+
+    statsd.increment("engine.team_members_cache.miss")
+    members = None
+    for team in g.get_organization(organization).get_teams():
+        if team.slug == team_slug:
+            members = [m.login for m in team.get_members()]
+            break
+
+    pipe = r.pipeline()
+    pipe.hset(key, team_slug, json.dumps(members))
+    # NOTE(sileht): The ttl is not renewed, the organization entries expire
+    # together
+    if not r.exists(key):
+        pipe.expire(key, TEAM_MEMBERS_CACHE_TTL)
+    pipe.execute()
+    return members
+
+
+def update_caches_from_event(event_type, data):
+    if "organization" not in data:
+        return
+
+    r = utils.get_redis_for_cache()
+    key = _get_key(data["organization"]["login"])
+    if event_type == "team":
+        r.delete(key)
+    elif event_type == "membership" and data.get("scope") == "team":
+        r.hdel(key, data["team"]["slug"])
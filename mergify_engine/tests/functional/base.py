@@ -39,6 +39,7 @@ import vcr
 from mergify_engine import branch_updater
 from mergify_engine import config
 from mergify_engine import duplicate_pull
+from mergify_engine import http_pool
 from mergify_engine import sub_utils
 from mergify_engine import utils
 from mergify_engine import web
@@ -312,6 +313,31 @@ class FunctionalTestBase(testtools.TestCase):
             )
         )
 
+        # NOTE(sileht): Cassettes replay the responses of an url in the order
+        # they have been recorded, the index and the lazy loading of pull
+        # requests attributes would shift them. And they have been recorded
+        # with the REST API only, listing all statuses and check runs, and
+        # the commits of pull requests to know if they are behind.
+        self.useFixture(fixtures.MockPatchObject(config, "PULL_REQUEST_INDEX", False))
+        self.useFixture(fixtures.MockPatchObject(config, "LAZY_PULL_ATTRIBUTES", False))
+        self.useFixture(
+            fixtures.MockPatchObject(config, "GRAPHQL_PULL_ATTRIBUTES", False)
+        )
+        self.useFixture(
+            fixtures.MockPatchObject(config, "LATEST_STATUSES_AND_CHECKS", False)
+        )
+        self.useFixture(fixtures.MockPatchObject(config, "COMPARE_IS_BEHIND", False))
+        # NOTE(sileht): The Summaries have been recorded with all the conditions
+        # of the not applicable rules
+        self.useFixture(
+            fixtures.MockPatchObject(config, "SUMMARY_BASE_CONDITIONS", False)
+        )
+        # NOTE(sileht): The cassettes have been recorded with GitHub waits done
+        # in the tasks
+        self.useFixture(fixtures.MockPatchObject(config, "DEFER_GITHUB_WAITS", False))
+        # NOTE(sileht): vcr is not thread safe
+        self.useFixture(fixtures.MockPatchObject(config, "PULL_FETCH_CONCURRENCY", 1))
+
         # Web authentification always pass
         self.useFixture(fixtures.MockPatch("hmac.compare_digest", return_value=True))
 
@@ -354,6 +380,10 @@ class FunctionalTestBase(testtools.TestCase):
         cassette = self.recorder.use_cassette("http.json")
         cassette.__enter__()
         self.addCleanup(cassette.__exit__)
+        # NOTE(sileht): pooled connections are bound to the cassette that
+        # created them, so they must not outlive it
+        http_pool.reset()
+        self.addCleanup(http_pool.reset)
 
         integration = github.GithubIntegration(
             config.INTEGRATION_ID, config.PRIVATE_KEY
@@ -413,6 +413,9 @@ class TestEngineV2Scenario(base.FunctionalTestBase):
         self.assertEqual("closed", p.state)
         self.assertEqual("WTF?", list(p.get_issue_comments())[-1].body)
 
+    # NOTE(sileht): The reviews events are not relevant for these rules, but the
+    # cassette has been recorded while they were processed
+    @mock.patch.object(config, "SKIP_IRRELEVANT_EVENTS", False)
     def test_dismiss_reviews(self):
         rules = {
             "pull_request_rules": [
@@ -63,6 +63,7 @@ class TestEngineV2Scenario(base.FunctionalTestBase):
         assert r.json["summary"].startswith(
             "#### Rule: assign (assign)\n- [X] `base=master`\n\n<hr />"
         )
+        assert r.json["failed_rules"] == []
 
         r = self.app.post(
             "/simulator",
@@ -0,0 +1,191 @@
+# -*- encoding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+from unittest import mock
+
+import pytest
+
+from mergify_engine import config
+from mergify_engine import rules
+from mergify_engine.rules import batch
+from mergify_engine.rules import filter
+
+
+TEAMS = {"@mergifyio/devs": ["sileht", "jd"]}
+
+
+def _resolve_teams(value):
+    return TEAMS.get(value, [value])
+
+
+PULL_REQUEST_RULES = rules.PullRequestRules(
+    [
+        {
+            "name": "merge",
+            "conditions": [
+                "base=master",
+                "label=ready",
+                "-label~=^wip",
+                "#approved-reviews-by>=2",
+                "status-success=ci",
+            ],
+            "actions": {},
+        },
+        {
+            "name": "devs",
+            "conditions": ["base=master", "author=@mergifyio/devs"],
+            "actions": {},
+        },
+        {
+            "name": "stable",
+            "conditions": ["base~=^stable/", "#files<3", "files!=setup.py"],
+            "actions": {},
+        },
+        {
+            "name": "docs",
+            "conditions": ["files~=^docs/", "-closed", "head~=^doc"],
+            "actions": {},
+        },
+        {"name": "default", "conditions": [], "actions": {}},
+    ]
+)
+
+
+def _pull(**values):
+    defaults = {
+        "base": "master",
+        "head": "feature",
+        "author": "someone",
+        "label": [],
+        "approved-reviews-by": [],
+        "status-success": [],
+        "files": ["setup.py"],
+        "closed": False,
+    }
+    defaults.update(values)
+    return defaults
+
+
+PULLS = [
+    _pull(),
+    _pull(
+        author="jd",
+        label=["ready"],
+        **{"approved-reviews-by": ["sileht", "jd"], "status-success": ["ci"]},
+    ),
+    _pull(label=["ready", "wip-foo"], **{"approved-reviews-by": ["sileht"]}),
+    _pull(base="stable/3.0", files=["README.rst", "docs/index.rst"]),
+    _pull(base="stable/3.0", head="doc-fix", files=["docs/index.rst"], closed=True),
+    _pull(base="other", head="doc-fix", files=["docs/index.rst"]),
+]
+
+
+def _get_pull_request_rule(values):
+    pull_request = mock.Mock()
+    pull_request.to_dict.return_value = values
+    pull_request.resolve_teams.side_effect = _resolve_teams
+    return PULL_REQUEST_RULES.PullRequestRuleForPR(
+        PULL_REQUEST_RULES.rules, pull_request, PULL_REQUEST_RULES.conditions_index
+    )
+
+
+def _get_pull_requests_rules():
+    return batch.get_pull_requests_rules(
+        PULL_REQUEST_RULES,
+        batch.get_columns(PULLS, PULL_REQUEST_RULES.read_attributes),
+        len(PULLS),
+        dict(
+            (attribute, _resolve_teams)
+            for attribute in PULL_REQUEST_RULES.PullRequestRuleForPR.TEAM_ATTRIBUTES
+        ),
+    )
+
+
+def _assert_same_matches(matches):
+    assert len(matches) == len(PULLS)
+    for values, match in zip(PULLS, matches):
+        expected = _get_pull_request_rule(values)
+        assert match.matching_rules == expected.matching_rules
+        assert match.failed_rules == expected.failed_rules
+        assert match.ignored_rules == expected.ignored_rules
+        assert match.not_applicable_rules == expected.not_applicable_rules
+
+
+def test_same_matches():
+    columns = batch.get_columns(PULLS, PULL_REQUEST_RULES.read_attributes)
+    assert columns["#approved-reviews-by"] == [0, 2, 1, 0, 0, 0]
+
+    matches = _get_pull_requests_rules()
+    _assert_same_matches(matches)
+    assert all(not m.failed_rules for m in matches)
+
+    assert [[r["name"] for r, c in m.matching_rules if not c] for m in matches] == [
+        ["default"],
+        ["merge", "devs", "default"],
+        ["default"],
+        ["stable", "default"],
+        ["stable", "default"],
+        ["docs", "default"],
+    ]
+
+
+@mock.patch.object(config, "REGEX_CPU_BUDGET", -1)
+def test_regex_timeout():
+    matches = _get_pull_requests_rules()
+    _assert_same_matches(matches)
+    # NOTE(sileht): The rules failing on a base condition come first, the
+    # first pull request has no labels to search
+    base_failed = [("stable", "^stable/"), ("docs", "^docs/")]
+    assert [[(r["name"], p) for r, p in m.failed_rules] for m in matches] == [
+        base_failed,
+        base_failed + [("merge", "^wip")],
+        base_failed + [("merge", "^wip")],
+        base_failed,
+        base_failed,
+        base_failed,
+    ]
+
+
+def test_prefetch():
+    values = mock.MagicMock()
+    values.__getitem__.return_value = "master"
+    batch.get_columns([values], ["base"])
+    values.prefetch.assert_called_once_with(["base"])
+
+
+def test_distinct_values_are_compared_once():
+    pull_request_rules = rules.PullRequestRules(
+        [{"name": "docs", "conditions": ["files~=^docs/"], "actions": {}}]
+    )
+    pulls = [_pull(files=["docs/index.rst", "setup.py"]) for _ in range(10)]
+    columns = batch.get_columns(pulls, pull_request_rules.read_attributes)
+
+    regex = mock.Mock()
+    regex.search.side_effect = lambda value: value.startswith("docs/")
+    with mock.patch.dict(
+        filter.Filter.binary_operators,
+        {"~=": (lambda a, b: b.search(a), any, lambda value: regex)},
+    ):
+        matches = batch.get_pull_requests_rules(pull_request_rules, columns, len(pulls))
+    assert regex.search.call_count == 1
+    assert all(m.matching_rules[0][1] == [] for m in matches)
+
+
+def test_unknown_attribute():
+    pull_request_rules = rules.PullRequestRules(
+        [{"name": "foo", "conditions": ["milestone=v1"], "actions": {}}]
+    )
+    with pytest.raises(filter.UnknownAttribute):
+        batch.get_columns(PULLS, pull_request_rules.read_attributes)
+    with pytest.raises(filter.UnknownAttribute):
+        batch.get_pull_requests_rules(pull_request_rules, {}, len(PULLS))
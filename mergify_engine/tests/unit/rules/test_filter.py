@@ -81,6 +81,30 @@ def test_set_value_expanders():
     assert not f(foo="x")
 
 
+def test_evaluate_with_expanders():
+    f = filter.Filter.parse("approved-reviews-by=@team")
+    assert f.attribute_name == "approved-reviews-by"
+    expanders = {"approved-reviews-by": lambda x: ["sileht", "jd"]}
+    assert f.evaluate({"approved-reviews-by": ["jd"]}, expanders)
+    assert not f.evaluate({"approved-reviews-by": ["foo"]}, expanders)
+    assert not f.evaluate({"approved-reviews-by": ["jd"]})
+    assert f._value_expanders == {}
+
+    f = filter.Filter.parse("approved-reviews-by!=@team")
+    expanders = {"approved-reviews-by": lambda x: ["jd"]}
+    assert f.evaluate({"approved-reviews-by": ["foo"]}, expanders)
+    assert not f.evaluate({"approved-reviews-by": ["foo", "jd"]}, expanders)
+
+
+def test_nested_attribute():
+    f = filter.Filter({"=": ("foo.bar", 1)})
+    assert f.attribute_name == "foo.bar"
+    assert f(foo={"bar": 1})
+    assert not f(foo={"bar": 2})
+    with pytest.raises(filter.UnknownAttribute):
+        f(foo={"baz": 1})
+
+
 def test_does_not_contain():
     f = filter.Filter({"!=": ("foo", 1)})
     assert f(foo=[])
@@ -131,3 +155,29 @@ def test_str():
 def test_parser():
     for string in ("head=foobar", "-base=master", "#files>3"):
         assert string == str(filter.Filter.parse(string))
+
+
+def test_dependencies():
+    assert filter.Filter.parse("status-success=ci").get_dependencies() == {
+        ("status-success", "ci")
+    }
+    assert filter.Filter.parse("-status-failure!=ci").get_dependencies() == {
+        ("status-failure", "ci")
+    }
+    assert filter.Filter.parse("status-success~=^ci").get_dependencies() == {
+        ("status-success", None)
+    }
+    assert filter.Filter.parse("#approved-reviews-by>=2").get_dependencies() == {
+        ("approved-reviews-by", None)
+    }
+    assert filter.Filter.parse("closed").get_dependencies() == {("closed", None)}
+    assert filter.Filter.parse("#approved-reviews-by>=2").get_read_attributes() == {
+        "#approved-reviews-by"
+    }
+
+
+def test_length_from_values():
+    f = filter.Filter({">": ("#files", 50)})
+    assert f(**{"#files": 51})
+    assert not f(**{"#files": 50, "files": ["foo"] * 51})
+    assert f(files=["foo"] * 51)
@@ -13,6 +13,8 @@
 # WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
 # License for the specific language governing permissions and limitations
 # under the License.
+from unittest import mock
+
 import pyparsing
 
 import pytest
@@ -36,6 +38,10 @@ def test_search():
         ("#assignee>1", {">": ("#assignee", 1)}),
         ("#assignee>=2", {">=": ("#assignee", 2)}),
         ("assignee=@org/team", {"=": ("assignee", "@org/team")}),
+        ("commits>3", {">": ("commits", 3)}),
+        ("additions>=100", {">=": ("additions", 100)}),
+        ("deletions=0", {"=": ("deletions", 0)}),
+        ("changed-files<=50", {"<=": ("changed-files", 50)}),
         (
             "status-success=my ci has spaces",
             {"=": ("status-success", "my ci has spaces")},
@@ -50,6 +56,94 @@ def test_search():
 
 
 def test_invalid():
-    for line in ("arf", "-heyo", "locked=1", "++head=master", "foo=bar", "#foo=bar"):
+    for line in (
+        "arf",
+        "-heyo",
+        "locked=1",
+        "++head=master",
+        "foo=bar",
+        "#foo=bar",
+        "commits=foo",
+    ):
         with pytest.raises(pyparsing.ParseException):
             parser.search.parseString(line, parseAll=True)
+
+
+def test_parse_same_as_search():
+    for line in (
+        "base:master",
+        "base==master",
+        "+base=master",
+        "-base~=^stable/",
+        "¬head!=feature/foo",
+        "head=feature:foo",
+        "author=@org",
+        "author=@org/team",
+        "author=@org/team/foo",
+        "author=jd@org",
+        "-merged-by≠sileht",
+        "merged",
+        "merged-by",
+        "#closed",
+        "-conflict",
+        "label=foo bar",
+        "label= foo",
+        "label='quoted'",
+        'label= "WIP"',
+        "status-success= 'ci'",
+        "title=  'a b'",
+        'label= "foo',
+        'label="foo',
+        'label="a\\tb"',
+        "label=a\tb",
+        "title=   ",
+        " base=master",
+        "- base=master",
+        "base =master",
+        "base= master",
+        "milestone=v1.0",
+        "milestone=v 1",
+        "#files>=3",
+        "#files≥3",
+        "#label~=3",
+        "#approved-reviews-by<2",
+        "status-success=ci/my ci",
+        "status-failure~=^ci",
+        "commits>3",
+        "commits> 3",
+        "commits~=3",
+        "changed-files≤50",
+        "files=",
+        "files~=",
+    ):
+        try:
+            expected = parser.search.parseString(line, parseAll=True)[0]
+        except pyparsing.ParseException as e:
+            with pytest.raises(pyparsing.ParseException) as excinfo:
+                parser.parse(line)
+            assert str(excinfo.value) == str(e)
+        else:
+            assert parser.parse(line) == expected, line
+
+    # NOTE(sileht): pyparsing doesn't convert the errors of parse actions
+    with pytest.raises(ValueError):
+        parser.search.parseString("#files=foo", parseAll=True)
+    with pytest.raises(ValueError):
+        parser.parse("#files=foo")
+
+
+def test_parse_without_pyparsing():
+    parser.parse.cache_clear()
+    with mock.patch.object(parser.search, "parseString") as parse_string:
+        assert parser.parse("base=master") == {"=": ("base", "master")}
+        assert parser.parse("-#label>=2") == {"-": {">=": ("#label", 2)}}
+        assert parser.parse("author=@org/devs") == {"=": ("author", "@org/devs")}
+        assert parser.parse("status-success=my ci") == {
+            "=": ("status-success", "my ci")
+        }
+        assert not parse_string.called
+
+        parse_string.return_value = [{"=": ("label", "quoted")}]
+        assert parser.parse("label='quoted'") == {"=": ("label", "quoted")}
+        assert parser.parse("label='quoted'") == {"=": ("label", "quoted")}
+        assert parse_string.call_count == 1
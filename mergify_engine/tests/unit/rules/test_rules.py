@@ -13,12 +13,19 @@
 # WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
 # License for the specific language governing permissions and limitations
 # under the License.
+from unittest import mock
+
+import github
+
 import pytest
 
 import voluptuous
 
 
 from mergify_engine import rules
+from mergify_engine import utils
+from mergify_engine.tasks import engine
+from mergify_engine.tasks.engine import actions_runner
 
 
 def test_valid_condition():
@@ -29,3 +36,166 @@ def test_valid_condition():
 def test_invalid_condition_re():
     with pytest.raises(voluptuous.Invalid):
         rules.PullRequestRuleCondition("head~=(bar")
+
+
+def test_unsafe_condition_re():
+    with pytest.raises(voluptuous.Invalid):
+        rules.PullRequestRuleCondition("head~=^(a+)+$")
+
+
+def _push_event(files, ref="refs/heads/master"):
+    return {
+        "ref": ref,
+        "created": False,
+        "deleted": False,
+        "forced": False,
+        "commits": [{"added": [], "modified": files, "removed": []}],
+        "repository": {"id": 123456, "default_branch": "master"},
+    }
+
+
+def test_config_cache():
+    r = utils.get_redis_for_cache()
+    r.delete(
+        rules.CONFIG_CACHE_KEY % (123456, "master"),
+        rules.CONFIG_CACHE_KEY % (123456, "main"),
+        rules.CONFIG_FILENAME_KEY % 123456,
+    )
+
+    def get_contents(filename, ref):
+        if filename == ".mergify.yml":
+            raise github.GithubException(404, "Not found")
+        return mock.Mock(sha="blobsha", decoded_content=b"pull_request_rules: []")
+
+    repo = mock.Mock(id=123456, default_branch="master")
+    repo.get_contents.side_effect = get_contents
+
+    assert rules.get_mergify_config_content(repo) == b"pull_request_rules: []"
+    assert repo.get_contents.call_count == 2
+    assert rules.get_mergify_config_content(repo) == b"pull_request_rules: []"
+    assert repo.get_contents.call_count == 2
+
+    for event in (
+        _push_event(["README"]),
+        _push_event([".mergify/config.yml"], ref="refs/heads/stable"),
+    ):
+        rules.update_caches_from_event("push", event)
+        rules.get_mergify_config_content(repo)
+        assert repo.get_contents.call_count == 2
+
+    # The filename is remembered, no more 404
+    rules.update_caches_from_event("push", _push_event([".mergify/config.yml"]))
+    rules.get_mergify_config_content(repo)
+    assert repo.get_contents.call_count == 3
+    repo.get_contents.assert_called_with(
+        ".mergify/config.yml", ref=github.GithubObject.NotSet
+    )
+
+    # Other refs are never cached
+    rules.get_mergify_config_content(repo, ref="foobar")
+    assert repo.get_contents.call_count == 5
+
+    # A renamed default branch doesn't get the old configuration
+    repo.default_branch = "main"
+    rules.get_mergify_config_content(repo)
+    assert repo.get_contents.call_count == 6
+
+
+def test_config_cache_not_utf8():
+    r = utils.get_redis_for_cache()
+    r.delete(
+        rules.CONFIG_CACHE_KEY % (123457, "master"), rules.CONFIG_FILENAME_KEY % 123457
+    )
+
+    content = b"pull_request_rules: \xff\xfe"
+    repo = mock.Mock(id=123457, default_branch="master")
+    repo.get_contents.return_value = mock.Mock(sha="blobsha", decoded_content=content)
+
+    assert rules.get_mergify_config_content(repo) == content
+    assert rules.get_mergify_config_content(repo) == content
+    assert repo.get_contents.call_count == 1
+    with pytest.raises(rules.InvalidRules):
+        rules.load_mergify_config(content)
+
+
+def test_compiled_config_cache():
+    content = b"""pull_request_rules:
+  - name: hello
+    conditions:
+      - base=master
+    actions:
+      comment:
+        message: hello
+"""
+    config_hash = rules.store_mergify_config_content(content)
+    assert rules.get_stored_mergify_config_content(config_hash) == content
+
+    pull_request_rules = actions_runner.get_pull_request_rules(config_hash)
+    assert actions_runner.get_pull_request_rules(config_hash) is pull_request_rules
+    assert [r["name"] for r in pull_request_rules.rules] == ["hello",] + [
+        r["name"] for r in actions_runner.MERGIFY_RULE["rules"]
+    ]
+
+    assert rules.load_mergify_config(content) is rules.load_mergify_config(content)
+    with pytest.raises(rules.InvalidRules):
+        rules.load_mergify_config(b"pull_request_rules: []")
+
+    with pytest.raises(rules.NoRules):
+        rules.get_stored_mergify_config_content("unknown")
+
+
+def test_irrelevant_events():
+    content = b"""pull_request_rules:
+  - name: hello
+    conditions:
+      - label=foo
+      - status-success=ci
+    actions:
+      comment:
+        message: hello
+"""
+    repo = mock.Mock()
+    with mock.patch.object(rules, "get_mergify_config_content", return_value=content):
+        pull_request_rules = rules.get_mergify_config(repo)["pull_request_rules"]
+        assert pull_request_rules.attributes == {"label", "status-success"}
+        assert pull_request_rules.status_contexts == {"ci"}
+        assert not pull_request_rules.depends_on_mergeable_state
+
+        def reason(event_type, data):
+            return engine.get_irrelevant_reason(repo, event_type, data)
+
+        assert reason("pull_request", {"action": "labeled"}) is None
+        assert reason("pull_request", {"action": "locked"}) == (
+            "no rule depends on locked"
+        )
+        assert reason("pull_request_review", {}) == "no rule depends on reviews"
+        assert reason("status", {"context": "ci"}) is None
+        assert reason("status", {"context": "other"}) == (
+            "no rule depends on other status"
+        )
+        check_run = {"app": {"id": 0}, "name": "other", "status": "completed"}
+        assert reason("check_run", {"check_run": check_run}) == (
+            "no rule depends on other status"
+        )
+
+    with mock.patch.object(
+        rules,
+        "get_mergify_config_content",
+        return_value=content.replace(b"comment:\n        message: hello", b"merge: {}"),
+    ):
+        assert rules.get_mergify_config(repo)[
+            "pull_request_rules"
+        ].depends_on_mergeable_state
+        assert reason("pull_request_review", {}) is None
+        assert reason("status", {"context": "other"}) is None
+        check_run["status"] = "in_progress"
+        assert reason("check_run", {"check_run": check_run}) == (
+            "no rule depends on other status"
+        )
+
+    with mock.patch.object(
+        rules,
+        "get_mergify_config_content",
+        return_value=content.replace(b"label=foo", b"review-requested=foo"),
+    ):
+        assert reason("pull_request_review", {}) is None
@@ -19,7 +19,18 @@ from unittest import mock
 import pytest
 
 from mergify_engine import config
+from mergify_engine import hydration
 from mergify_engine import mergify_pull
+from mergify_engine import utils
+
+
+REPO_ID = 123456
+
+
+def setup_function(function):
+    r = utils.get_redis_for_cache()
+    r.delete(hydration.BRANCH_HEAD_CACHE_KEY % REPO_ID)
+    r.delete(hydration.MERGE_BASE_CACHE_KEY % REPO_ID)
 
 
 def create_commit(sha=None):
@@ -54,6 +65,7 @@ def commits_tree_generator(request):
     return behind, commits
 
 
+@mock.patch.object(config, "COMPARE_IS_BEHIND", False)
 def test_pull_behind(commits_tree_generator):
     expected, commits = commits_tree_generator
     g = mock.Mock()
@@ -66,3 +78,76 @@ def test_pull_behind(commits_tree_generator):
     )
     behind = pull.is_behind()
     assert expected == behind
+
+
+def _pull(head_sha="head"):
+    g_pull = mock.Mock()
+    g_pull.base.ref = "#foo"
+    g_pull.head.sha = head_sha
+    g_pull.base.repo.id = REPO_ID
+    g_pull.base.repo.get_branch.return_value = mock.Mock(commit=mock.Mock(sha="base"))
+    g_pull.base.repo.compare.return_value = mock.Mock(
+        behind_by=0, merge_base_commit=mock.Mock(sha="base")
+    )
+    return mergify_pull.MergifyPull(
+        g=mock.Mock(), g_pull=g_pull, installation_id=config.INSTALLATION_ID
+    )
+
+
+def test_pull_behind_compare():
+    pull = _pull()
+    repo = pull.g_pull.base.repo
+    assert not pull.is_behind()
+    repo.get_branch.assert_called_once_with("%23foo")
+    repo.compare.assert_called_once_with("base", "head")
+
+    # The merge base of the head is the base branch head
+    assert not pull.is_behind()
+    assert repo.get_branch.call_count == 2
+    assert repo.compare.call_count == 1
+
+    # A late push event doesn't change the result
+    hydration.update_caches_from_event(
+        "push",
+        {"ref": "refs/heads/#foo", "after": "old-base", "repository": {"id": REPO_ID}},
+    )
+    assert not pull.is_behind()
+    assert repo.get_branch.call_count == 3
+    assert repo.compare.call_count == 1
+
+
+def test_pull_behind_compare_cached():
+    pull = _pull()
+    repo = pull.g_pull.base.repo
+    assert not pull.is_behind(fresh=False)
+    assert not pull.is_behind(fresh=False)
+    assert repo.get_branch.call_count == 1
+    assert repo.compare.call_count == 1
+
+    hydration.update_caches_from_event(
+        "push",
+        {"ref": "refs/heads/#foo", "after": "new-base", "repository": {"id": REPO_ID}},
+    )
+    repo.compare.return_value = mock.Mock(
+        behind_by=1, merge_base_commit=mock.Mock(sha="base")
+    )
+    assert pull.is_behind(fresh=False)
+    repo.compare.assert_called_with("new-base", "head")
+    assert repo.get_branch.call_count == 1
+    assert repo.compare.call_count == 2
+
+
+def test_branch_head_sha_miss_keeps_push_event_sha():
+    repo = mock.Mock(id=REPO_ID)
+
+    def get_branch(name):
+        # NOTE(sileht): A push event is processed while we ask GitHub
+        hydration.update_caches_from_event(
+            "push",
+            {"ref": "refs/heads/foo", "after": "new", "repository": {"id": REPO_ID}},
+        )
+        return mock.Mock(commit=mock.Mock(sha="old"))
+
+    repo.get_branch.side_effect = get_branch
+    assert hydration.get_branch_head_sha(repo, "foo") == "old"
+    assert hydration.get_branch_head_sha(repo, "foo") == "new"
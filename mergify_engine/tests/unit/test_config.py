@@ -15,14 +15,23 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import threading
 from unittest import mock
 
 import pytest
 
 import voluptuous
 
+from mergify_engine import config
 from mergify_engine import mergify_pull
 from mergify_engine import rules
+from mergify_engine import teams
+from mergify_engine import utils
+from mergify_engine.tasks.engine import actions_runner
+
+
+def setup_function(function):
+    utils.get_redis_for_cache().delete(teams.TEAM_MEMBERS_CACHE_KEY % "orgs")
 
 
 def test_pull_request_rule():
@@ -133,6 +142,7 @@ def test_pull_request_rule_schema_invalid():
             rules.PullRequestRules([invalid])
 
 
+@mock.patch.object(config, "GRAPHQL_PULL_ATTRIBUTES", False)
 def test_get_pull_request_rule():
     g = mock.Mock()
 
@@ -160,6 +170,7 @@ def test_get_pull_request_rule():
     file2 = mock.Mock()
     file2.filename = "setup.py"
     g_pull.get_files.return_value = [file1, file2]
+    g_pull.changed_files = 2
 
     review = mock.Mock()
     review.user.login = "sileht"
@@ -462,3 +473,357 @@ def test_get_pull_request_rule():
     assert [r["name"] for r, _ in match.matching_rules] == ["default"]
     assert match.matching_rules[0][0]["name"] == "default"
     assert len(match.matching_rules[0][1]) == 0
+
+
+@mock.patch.object(config, "GRAPHQL_PULL_ATTRIBUTES", False)
+def test_consolidated_data_is_lazy():
+    g_pull = mock.Mock()
+    g_pull.assignees = []
+    g_pull.labels = []
+    g_pull._rawData = {"locked": False}
+    g_pull.get_reviews.return_value = []
+    g_pull.base.ref = "master"
+    file1 = mock.Mock()
+    file1.filename = "README.rst"
+    g_pull.get_files.return_value = [file1]
+
+    pull_request = mergify_pull.MergifyPull(
+        g=mock.Mock(), g_pull=g_pull, installation_id=123
+    )
+    pull_request._get_checks = mock.Mock(return_value=[])
+
+    pull_request_rules = rules.PullRequestRules(
+        [
+            {"name": "hello", "conditions": ["base=master"], "actions": {}},
+            {"name": "files", "conditions": ["files=README.rst"], "actions": {}},
+        ]
+    )
+    match = pull_request_rules.get_pull_request_rule(pull_request)
+    assert [r["name"] for r, _ in match.matching_rules] == ["hello", "files"]
+
+    assert g_pull.get_files.call_count == 1
+    assert not g_pull.get_reviews.called
+    assert not g_pull.get_review_requests.called
+    assert not pull_request._get_checks.called
+
+    assert pull_request.to_dict()["files"] == ["README.rst"]
+    assert g_pull.get_files.call_count == 1
+    assert "status-success" in pull_request.to_dict()
+    assert not pull_request._get_checks.called
+
+
+@mock.patch.object(config, "GRAPHQL_PULL_ATTRIBUTES", False)
+def test_payload_attributes():
+    g_pull = mock.Mock()
+    g_pull.assignees = []
+    g_pull.labels = []
+    g_pull._rawData = {"locked": False}
+    g_pull.get_reviews.return_value = []
+    g_pull.commits = 3
+    g_pull.additions = 120
+    g_pull.deletions = 4
+    g_pull.changed_files = 51
+
+    pull_request = mergify_pull.MergifyPull(
+        g=mock.Mock(), g_pull=g_pull, installation_id=123
+    )
+    pull_request_rules = rules.PullRequestRules(
+        [
+            {"name": "big", "conditions": ["#files>50"], "actions": {}},
+            {"name": "commits", "conditions": ["commits<=3"], "actions": {}},
+            {
+                "name": "lines",
+                "conditions": ["additions>=100", "deletions<5", "changed-files=51"],
+                "actions": {},
+            },
+            {"name": "small", "conditions": ["additions<100"], "actions": {}},
+        ]
+    )
+    match = pull_request_rules.get_pull_request_rule(pull_request)
+    assert [r["name"] for r, c in match.matching_rules if not c] == [
+        "big",
+        "commits",
+        "lines",
+    ]
+    assert not g_pull.get_files.called
+
+
+@mock.patch.object(config, "GRAPHQL_PULL_ATTRIBUTES", False)
+def test_base_conditions_evaluated_first():
+    g_pull = mock.Mock(mergeable_state="clean", changed_files=0)
+    g_pull.base.ref = "master"
+    g_pull.assignees = []
+    g_pull.labels = []
+    g_pull._rawData = {"locked": False}
+    g_pull.get_reviews.return_value = []
+    pull_request = mergify_pull.MergifyPull(
+        g=mock.Mock(), g_pull=g_pull, installation_id=123
+    )
+
+    pull_request_rules = rules.PullRequestRules(
+        [
+            {
+                "name": "stable",
+                "conditions": ["base=stable", "approved-reviews-by=sileht"],
+                "actions": {},
+            },
+            {"name": "master", "conditions": ["base=master", "-locked"], "actions": {}},
+        ]
+    )
+    match = pull_request_rules.get_pull_request_rule(pull_request)
+    assert [r["name"] for r, c in match.matching_rules] == ["master"]
+    # NOTE(sileht): The reviews are only read by an ignored rule
+    assert not g_pull.get_reviews.called
+
+    assert [(r["name"], [str(c) for c in c]) for r, c in match.ignored_rules] == [
+        ("stable", ["base=stable", "approved-reviews-by=sileht"])
+    ]
+    assert g_pull.get_reviews.called
+
+
+@mock.patch.object(config, "GRAPHQL_PULL_ATTRIBUTES", False)
+@mock.patch.object(mergify_pull.MergifyPull, "get_merge_commit_message")
+def test_summary_not_applicable_rules(get_merge_commit_message):
+    get_merge_commit_message.return_value = None
+    g_pull = mock.Mock(mergeable_state="clean", changed_files=0)
+    g_pull.base.ref = "master"
+    g_pull.head.ref = "feature"
+    g_pull.assignees = []
+    g_pull.labels = []
+    g_pull._rawData = {"locked": False}
+    pull_request = mergify_pull.MergifyPull(
+        g=mock.Mock(), g_pull=g_pull, installation_id=123
+    )
+
+    pull_request_rules = rules.PullRequestRules(
+        [
+            {
+                "name": "stable",
+                "conditions": [
+                    "base=stable",
+                    "approved-reviews-by=sileht",
+                    "head=feature",
+                ],
+                "actions": {},
+            },
+            {"name": "master", "conditions": ["base=master", "-locked"], "actions": {}},
+        ]
+    )
+    match = pull_request_rules.get_pull_request_rule(pull_request)
+    title, summary = actions_runner.gen_summary("refresh", {}, pull_request, match)
+    assert title == "1 rule matches"
+    assert (
+        "<summary>1 not applicable rule</summary>\n\n"
+        "#### Rule: stable ()\n- [ ] `base=stable`\n\n</details>\n"
+    ) in summary
+    assert not g_pull.get_reviews.called
+
+    g_pull.get_reviews.return_value = []
+    assert [(r["name"], [str(c) for c in c]) for r, c in match.ignored_rules] == [
+        ("stable", ["base=stable", "approved-reviews-by=sileht"])
+    ]
+    assert g_pull.get_reviews.called
+    assert [
+        (r["name"], [str(c) for c in c]) for r, c in match.not_applicable_rules
+    ] == [("stable", ["base=stable"])]
+
+
+@mock.patch.object(config, "PULL_FETCH_CONCURRENCY", 4)
+def test_consolidated_data_prefetch():
+    barrier = threading.Barrier(2, timeout=5)
+
+    def loader(name):
+        def load():
+            # NOTE(sileht): Blocks until both groups are loaded at the same time
+            barrier.wait()
+            return {name: threading.current_thread().name}
+
+        return mock.Mock(side_effect=load)
+
+    loaders = {"foo": loader("foo"), "bar": loader("bar"), "baz": loader("baz")}
+    data = mergify_pull.ConsolidatedData(
+        dict((name, ((name,), loader)) for name, loader in loaders.items())
+    )
+
+    data.prefetch(["foo", "bar", "unknown"])
+    assert loaders["foo"].call_count == 1
+    assert loaders["bar"].call_count == 1
+    assert not loaders["baz"].called
+    assert data["foo"] != data["bar"]
+
+    data.prefetch(["foo", "bar"])
+    assert loaders["foo"].call_count == 1
+    assert loaders["bar"].call_count == 1
+
+
+@mock.patch.object(config, "GRAPHQL_PULL_ATTRIBUTES", False)
+def test_lazy_files_short_circuit():
+    read = []
+
+    def get_files():
+        for i in range(1000):
+            f = mock.Mock()
+            f.filename = "docs/%d.rst" % i if i < 10 else "src/%d.py" % i
+            read.append(f.filename)
+            yield f
+
+    g_pull = mock.Mock()
+    g_pull.get_files.side_effect = get_files
+    pull_request = mergify_pull.MergifyPull(
+        g=mock.Mock(), g_pull=g_pull, installation_id=123
+    )
+    d = pull_request.to_dict()
+
+    assert rules.filter.Filter.parse("files~=^docs/").evaluate(d)
+    assert len(read) == 1
+    assert not rules.filter.Filter.parse("files!=docs/5.rst").evaluate(d)
+    assert len(read) == 6
+    assert rules.filter.Filter.parse("files=src/20.py").evaluate(d)
+    assert len(read) == 21
+    assert d["files"][:2] == ["docs/0.rst", "docs/1.rst"]
+    assert len(d["files"]) == 1000
+    assert len(read) == 1000
+    assert g_pull.get_files.call_count == 1
+
+
+def test_conditions_index():
+    pull_request = mock.Mock()
+    pull_request.to_dict.return_value = {
+        "base": "master",
+        "head": "feature",
+        "author": "jd",
+        "label": ["ready"],
+        "status-success": ["ci"],
+        "files": ["README.rst"],
+    }
+    pull_request.resolve_teams.side_effect = lambda values: values
+
+    pull_request_rules = rules.PullRequestRules(
+        [
+            {
+                "name": "merge",
+                "conditions": ["base=master", "label=ready"],
+                "actions": {},
+            },
+            {
+                "name": "stable",
+                "conditions": ["base=stable", "label=ready"],
+                "actions": {},
+            },
+            {
+                "name": "ci",
+                "conditions": ["base=master", "status-success=ci"],
+                "actions": {},
+            },
+            {
+                "name": "ci-stable",
+                "conditions": ["base:stable", "status-success=ci"],
+                "actions": {},
+            },
+            {
+                "name": "files",
+                "conditions": ["files=setup.py", "author=jd"],
+                "actions": {},
+            },
+            {
+                "name": "other",
+                "conditions": ["-base=master", "label=wip"],
+                "actions": {},
+            },
+        ]
+    )
+    evaluate = rules.filter.Filter.evaluate
+    with mock.patch.object(
+        rules.filter.Filter, "evaluate", autospec=True, side_effect=evaluate
+    ) as evaluate_mock:
+        match = pull_request_rules.PullRequestRuleForPR(
+            pull_request_rules.rules, pull_request, pull_request_rules.conditions_index
+        )
+        # NOTE(sileht): base=master, base=stable and author=jd are indexed,
+        # label=ready, status-success=ci, files=setup.py and -base=master
+        # are evaluated
+        assert evaluate_mock.call_count == 4
+        assert [r["name"] for r, c in match.matching_rules] == ["merge", "ci"]
+        assert [[str(c) for c in c] for r, c in match.matching_rules] == [[], []]
+
+        assert [(r["name"], [str(c) for c in c]) for r, c in match.ignored_rules] == [
+            ("stable", ["base=stable"]),
+            ("ci-stable", ["base=stable"]),
+            ("files", ["files=setup.py"]),
+            ("other", ["-base=master", "label=wip"]),
+        ]
+        # NOTE(sileht): Only label=wip wasn't evaluated yet
+        assert evaluate_mock.call_count == 5
+        match.ignored_rules
+        assert evaluate_mock.call_count == 5
+
+
+@mock.patch.object(config, "REGEX_CPU_BUDGET", -1)
+def test_regex_timeout():
+    pull_request = mock.Mock()
+    pull_request.to_dict.return_value = {
+        "base": "master",
+        "head": "feature/foo",
+        "label": ["ready"],
+    }
+    pull_request.get_merge_commit_message.return_value = None
+
+    pull_request_rules = rules.PullRequestRules(
+        [
+            {
+                "name": "merge",
+                "conditions": ["base=master", "label=ready"],
+                "actions": {},
+            },
+            {
+                "name": "feature",
+                "conditions": ["head~=^feature/", "label=ready"],
+                "actions": {},
+            },
+            {
+                "name": "stable",
+                "conditions": ["base=stable", "label~=^wip"],
+                "actions": {},
+            },
+            {"name": "labels", "conditions": ["label~=^wip"], "actions": {}},
+        ]
+    )
+    match = pull_request_rules.PullRequestRuleForPR(
+        pull_request_rules.rules, pull_request
+    )
+    assert [r["name"] for r, c in match.matching_rules] == ["merge"]
+    assert [(r["name"], p) for r, p in match.failed_rules] == [
+        ("feature", "^feature/"),
+        ("labels", "^wip"),
+    ]
+    assert [(r["name"], [str(c) for c in c]) for r, c in match.ignored_rules] == [
+        ("stable", ["base=stable", "label~=^wip"])
+    ]
+
+    title, summary = actions_runner.gen_summary("refresh", {}, pull_request, match)
+    assert title == "1 rule matches and 2 rules failed"
+    assert "the regex `^feature/` took too long to evaluate" in summary
+
+
+@mock.patch.object(actions_runner.check_api, "set_check_run")
+def test_failed_rules_actions_cancelled(set_check_run):
+    action = mock.Mock(always_run=False, only_once=False)
+    action.cancel.return_value = ("neutral", "cancelled", "")
+    rule = {"name": "feature", "conditions": ["head~=^feature/"], "actions": {}}
+    rule["actions"]["merge"] = action
+    match = mock.Mock(matching_rules=[], failed_rules=[(rule, "^feature/")])
+
+    conclusions = actions_runner.run_actions(
+        123,
+        "token",
+        "refresh",
+        {},
+        mock.Mock(head_sha_outdated=False),
+        match,
+        {},
+        {"Rule: feature (merge)": None},
+    )
+    assert not action.run.called
+    assert action.cancel.call_args[0][-1] == ["head~=^feature/"]
+    assert conclusions == {"Rule: feature (merge)": "neutral"}
+    assert set_check_run.called
@@ -0,0 +1,53 @@
+# -*- encoding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+from unittest import mock
+
+from mergify_engine import debug
+from mergify_engine import mergify_pull
+from mergify_engine import rules
+
+
+def _g_pull(number, base):
+    g_pull = mock.Mock(number=number, title="pull %d" % number)
+    g_pull.mergeable_state = "clean"
+    g_pull.base.ref = base
+    return g_pull
+
+
+@mock.patch.object(mergify_pull.MergifyPull, "get_merge_commit_message")
+@mock.patch.object(mergify_pull.MergifyPull, "to_dict")
+def test_report_pulls(to_dict, get_merge_commit_message, capsys):
+    get_merge_commit_message.return_value = None
+    to_dict.side_effect = [
+        {"base": "master", "label": ["ready"]},
+        {"base": "stable", "label": []},
+    ]
+    repo = mock.Mock()
+    repo.get_pulls.return_value = [_g_pull(1, "master"), _g_pull(2, "stable")]
+    pull_request_rules = rules.PullRequestRules(
+        [
+            {
+                "name": "merge",
+                "conditions": ["base=master", "label=ready"],
+                "actions": {},
+            }
+        ]
+    )
+
+    debug.report_pulls(None, repo, 123, pull_request_rules)
+    output = capsys.readouterr().out
+    assert "* OPEN PULL REQUESTS: 2\n" in output
+    assert "> #1 pull 1: 1 rule matches\n" in output
+    assert "> #2 pull 2: no rules match, no planned actions\n" in output
+    assert "- [ ] `base=master`" in output
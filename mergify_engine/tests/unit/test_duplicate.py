@@ -15,9 +15,12 @@
 # under the License.
 from unittest import mock
 
+import voluptuous
+
 from mergify_engine import duplicate_pull
 from mergify_engine import config
 from mergify_engine import mergify_pull
+from mergify_engine.actions import copy
 
 
 def fake_get_github_pulls_from_sha(repo, sha):
@@ -98,3 +101,23 @@ def test_get_commits_to_cherry_pick_merge():
     merge_commit.parents = [base_branch, c2]
 
     assert duplicate_pull._get_commits_to_cherrypick(pull, merge_commit) == [c1, c2]
+
+
+@mock.patch.object(copy.CopyAction, "get_existing_duplicate_pull")
+def test_copy_does_not_alter_shared_config(get_existing_duplicate_pull):
+    get_existing_duplicate_pull.return_value = mock.Mock(
+        number=2, title="copy", html_url="https://example.com/2"
+    )
+    action = voluptuous.Schema(copy.CopyAction.get_schema())(
+        {"branches": ["stable"], "regexes": ["^release/"]}
+    )
+    release = mock.Mock()
+    release.name = "release/1"
+    pull = mock.Mock()
+    pull.g_pull.base.repo.get_branches.return_value = [release]
+
+    for _ in range(3):
+        action.run(None, None, None, None, pull, [])
+
+    assert action.config["branches"] == ["stable"]
+    assert pull.g_pull.base.repo.get_branch.call_count == 6
@@ -0,0 +1,161 @@
+# -*- encoding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import datetime
+from unittest import mock
+
+from mergify_engine import github_app
+from mergify_engine import utils
+
+
+INSTALLATION_ID = 123456
+
+
+def _fake_auth(token, expires_in):
+    expires_at = datetime.datetime.utcnow() + expires_in
+    return mock.Mock(token=token, expires_at=expires_at.replace(microsecond=0))
+
+
+def setup_function(function):
+    github_app.invalidate_installation_token(INSTALLATION_ID)
+
+
+def test_jwt_reused_in_process():
+    integration = github_app.CachedJWTGithubIntegration(1, "key")
+    with mock.patch("github.GithubIntegration.create_jwt", side_effect=["a", "b"]):
+        assert integration.create_jwt() == "a"
+        assert integration.create_jwt() == "a"
+        integration._jwt_expires_at -= github_app.JWT_EXPIRATION
+        assert integration.create_jwt() == "b"
+
+
+@mock.patch.object(github_app.CachedJWTGithubIntegration, "get_access_token")
+def test_installation_token_cached(get_access_token):
+    get_access_token.side_effect = [
+        _fake_auth("token-1", datetime.timedelta(hours=1)),
+        _fake_auth("token-2", datetime.timedelta(hours=1)),
+    ]
+    assert github_app.get_installation_token(INSTALLATION_ID) == "token-1"
+    assert github_app.get_installation_token(INSTALLATION_ID) == "token-1"
+    assert get_access_token.call_count == 1
+
+    github_app.invalidate_installation_token(INSTALLATION_ID)
+    assert github_app.get_installation_token(INSTALLATION_ID) == "token-2"
+    assert get_access_token.call_count == 2
+
+
+@mock.patch.object(github_app.CachedJWTGithubIntegration, "get_access_token")
+def test_installation_token_refreshed_ahead_of_expiration(get_access_token):
+    get_access_token.side_effect = [
+        _fake_auth("token-1", datetime.timedelta(minutes=5)),
+        _fake_auth("token-2", datetime.timedelta(hours=1)),
+    ]
+    assert github_app.get_installation_token(INSTALLATION_ID) == "token-1"
+    assert github_app.get_installation_token(INSTALLATION_ID) == "token-2"
+    assert github_app.get_installation_token(INSTALLATION_ID) == "token-2"
+    assert get_access_token.call_count == 2
+
+
+@mock.patch.object(github_app.CachedJWTGithubIntegration, "get_access_token")
+def test_installation_token_refresh_single_flight(get_access_token):
+    get_access_token.side_effect = [
+        _fake_auth("token-1", datetime.timedelta(minutes=5)),
+    ]
+    assert github_app.get_installation_token(INSTALLATION_ID) == "token-1"
+
+    # Another worker is refreshing the token, the current one is still valid
+    lock = utils.get_redis_for_cache().lock(
+        github_app.TOKEN_LOCK_KEY % INSTALLATION_ID, timeout=5
+    )
+    assert lock.acquire(blocking=False)
+    try:
+        assert github_app.get_installation_token(INSTALLATION_ID) == "token-1"
+    finally:
+        lock.release()
+    assert get_access_token.call_count == 1
+
+
+@mock.patch("mergify_engine.utils.get_installation_id", return_value=INSTALLATION_ID)
+def test_installation_id_cached(get_installation_id):
+    github_app.update_caches_from_event(
+        "installation",
+        {
+            "action": "deleted",
+            "installation": {"id": INSTALLATION_ID, "account": {"login": "Owner"}},
+            "repositories": [{"full_name": "Owner/repo"}],
+        },
+    )
+    assert github_app.get_installation_id("owner", "repo") == INSTALLATION_ID
+    assert github_app.get_installation_id("Owner", "Repo") == INSTALLATION_ID
+    assert get_installation_id.call_count == 1
+
+
+@mock.patch("mergify_engine.utils.get_installation_id")
+def test_installation_id_from_events(get_installation_id):
+    installation = {"id": INSTALLATION_ID, "account": {"login": "owner"}}
+    github_app.update_caches_from_event(
+        "installation",
+        {
+            "action": "created",
+            "installation": installation,
+            "repositories": [{"full_name": "owner/repo"}],
+        },
+    )
+    github_app.update_caches_from_event(
+        "installation_repositories",
+        {
+            "action": "added",
+            "installation": installation,
+            "repositories_added": [{"full_name": "owner/other"}],
+            "repositories_removed": [],
+        },
+    )
+    assert github_app.get_installation_id("owner", "repo") == INSTALLATION_ID
+    assert github_app.get_installation_id("owner", "other") == INSTALLATION_ID
+    assert (
+        github_app.get_installation_id("owner", account_type="Organization")
+        == INSTALLATION_ID
+    )
+    assert get_installation_id.call_count == 0
+
+    github_app.update_caches_from_event(
+        "installation_repositories",
+        {
+            "action": "removed",
+            "installation": installation,
+            "repositories_added": [],
+            "repositories_removed": [{"full_name": "owner/other"}],
+        },
+    )
+    get_installation_id.return_value = 42
+    assert github_app.get_installation_id("owner", "other") == 42
+    assert github_app.get_installation_id("owner", "repo") == INSTALLATION_ID
+
+
+@mock.patch.object(github_app.CachedJWTGithubIntegration, "get_access_token")
+def test_installation_token_new_permissions(get_access_token):
+    get_access_token.side_effect = [
+        _fake_auth("token-1", datetime.timedelta(hours=1)),
+        _fake_auth("token-2", datetime.timedelta(hours=1)),
+    ]
+    assert github_app.get_installation_token(INSTALLATION_ID) == "token-1"
+    github_app.update_caches_from_event(
+        "installation",
+        {
+            "action": "new_permissions_accepted",
+            "installation": {"id": INSTALLATION_ID, "account": {"login": "owner"}},
+        },
+    )
+    assert github_app.get_installation_token(INSTALLATION_ID) == "token-2"
+    assert get_access_token.call_count == 2
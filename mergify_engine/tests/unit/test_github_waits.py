@@ -0,0 +1,115 @@
+# -*- encoding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+from unittest import mock
+
+import pytest
+
+from mergify_engine import exceptions
+from mergify_engine import hydration
+from mergify_engine import mergify_pull
+from mergify_engine import utils
+
+
+REPO_ID = 123456
+
+
+def setup_function(function):
+    r = utils.get_redis_for_cache()
+    r.delete(hydration.PULL_CACHE_KEY % REPO_ID)
+    r.delete(mergify_pull.MergifyPull.WAIT_KEY % (REPO_ID, 1))
+
+
+def _g_pull(mergeable_state, sha="azertyuiop", updated_at="2020-01-01T00:00:00Z"):
+    g_pull = mock.Mock(number=1, state="open", mergeable_state=mergeable_state)
+    g_pull.head.sha = sha
+    g_pull.raw_data = {
+        "number": 1,
+        "state": "open",
+        "updated_at": updated_at,
+        "mergeable_state": mergeable_state,
+        "head": {"sha": sha},
+        "base": {"repo": {"id": REPO_ID}},
+    }
+    g_pull.base.repo.id = REPO_ID
+    g_pull.base.repo.get_pull.return_value = g_pull
+    return g_pull
+
+
+# NOTE(sileht): tenacity binds time.sleep when it's imported, so mock the sleep
+# of the retry itself
+def _mock_retry_sleep(method):
+    return mock.patch.object(method.retry, "sleep")
+
+
+def _pull(g_pull, defer_waits=True):
+    return mergify_pull.MergifyPull(
+        g=None, g_pull=g_pull, installation_id=1, defer_waits=defer_waits
+    )
+
+
+@_mock_retry_sleep(mergify_pull.MergifyPull._wait_for_mergeable_state)
+@mock.patch("mergify_engine.mergify_pull.statsd")
+def test_mergeable_state_deferred(statsd, sleep):
+    with pytest.raises(exceptions.MergeableStateUnknown):
+        _pull(_g_pull(None))
+    assert not sleep.called
+    assert not statsd.timing.called
+
+    g_pull = _g_pull(None)
+    g_pull.base.repo.get_pull.return_value = _g_pull("clean")
+    _pull(g_pull)
+    statsd.timing.assert_called_once_with(
+        "engine.github_wait", mock.ANY, tags=["reason:mergeable_state"]
+    )
+
+    _pull(g_pull)
+    assert statsd.timing.call_count == 1
+
+
+@_mock_retry_sleep(mergify_pull.MergifyPull._wait_for_mergeable_state)
+@mock.patch("mergify_engine.mergify_pull.statsd")
+def test_mergeable_state_not_deferred(statsd, sleep):
+    with pytest.raises(exceptions.MergeableStateUnknown):
+        _pull(_g_pull(None), defer_waits=False)
+    assert sleep.call_count == 4
+
+    # The waits are not looked for
+    with mock.patch.object(mergify_pull.MergifyPull, "_report_waits") as report_waits:
+        _pull(_g_pull("clean"))
+        assert not report_waits.called
+
+
+@_mock_retry_sleep(mergify_pull.MergifyPull._wait_for_sha_change)
+@mock.patch("mergify_engine.mergify_pull.statsd")
+def test_sha_change_deferred(statsd, sleep):
+    pull = _pull(_g_pull("clean"))
+    pull.wait_for_sha_change()
+    assert pull.g_pull.base.repo.get_pull.call_count == 1
+    assert pull.head_sha_outdated
+    assert not sleep.called
+
+    g_pull = _g_pull(None)
+    g_pull.base.repo.get_pull.return_value = _g_pull("clean")
+    _pull(g_pull)
+    assert not statsd.timing.called
+
+    g_pull = _g_pull(None, sha="new-sha", updated_at="2020-01-02T00:00:00Z")
+    g_pull.base.repo.get_pull.return_value = _g_pull(
+        "clean", sha="new-sha", updated_at="2020-01-02T00:00:00Z"
+    )
+    _pull(g_pull)
+    statsd.timing.assert_called_once_with(
+        "engine.github_wait", mock.ANY, tags=["reason:head_sha"]
+    )
@@ -0,0 +1,190 @@
+# -*- encoding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+from unittest import mock
+
+from mergify_engine import mergify_pull
+from mergify_engine import permissions
+from mergify_engine import utils
+
+
+OWNER_ID = 123
+REPO_ID = 456
+
+
+def setup_function(function):
+    utils.get_redis_for_cache().delete(permissions.PERMISSION_CACHE_KEY % OWNER_ID)
+
+
+def _page(nodes, cursor=None):
+    return {
+        "pageInfo": {"hasNextPage": cursor is not None, "endCursor": cursor},
+        "nodes": nodes,
+    }
+
+
+PULL_REQUEST = {
+    "reviews": _page(
+        [
+            {
+                "databaseId": 1,
+                "state": "CHANGES_REQUESTED",
+                "author": {"__typename": "User", "login": "sileht"},
+            },
+            {
+                "databaseId": 2,
+                "state": "COMMENTED",
+                "author": {"__typename": "Bot", "login": "mergify"},
+            },
+            {
+                "databaseId": 3,
+                "state": "APPROVED",
+                "author": {"__typename": "User", "login": "jd"},
+            },
+        ],
+        cursor="reviews-cursor",
+    ),
+    "reviewRequests": _page(
+        [
+            {"requestedReviewer": {"__typename": "User", "login": "foo"}},
+            {"requestedReviewer": {"__typename": "Team", "slug": "bar"}},
+        ]
+    ),
+    "files": _page([{"path": "README.rst"}]),
+    "commits": {
+        "nodes": [
+            {
+                "commit": {
+                    "oid": "azertyuiop",
+                    "status": {
+                        "contexts": [
+                            {"context": "ci/a", "state": "SUCCESS"},
+                            {"context": "ci/b", "state": "PENDING"},
+                        ]
+                    },
+                    "checkSuites": _page(
+                        [
+                            {
+                                "checkRuns": _page(
+                                    [
+                                        {
+                                            "name": "check/c",
+                                            "status": "COMPLETED",
+                                            "conclusion": "FAILURE",
+                                        },
+                                        {
+                                            "name": "check/d",
+                                            "status": "IN_PROGRESS",
+                                            "conclusion": None,
+                                        },
+                                    ]
+                                )
+                            }
+                        ]
+                    ),
+                }
+            }
+        ]
+    },
+}
+
+NEXT_REVIEWS = {
+    "reviews": _page(
+        [
+            {
+                "databaseId": 4,
+                "state": "APPROVED",
+                "author": {"__typename": "User", "login": "sileht"},
+            }
+        ]
+    )
+}
+
+
+def _request(verb, url, input):
+    variables = input["variables"]
+    for name in ("reviews", "reviewRequests", "files", "commits"):
+        if "%s(" % name in input["query"]:
+            if name == "reviews" and variables.get("after") == "reviews-cursor":
+                pull_request = NEXT_REVIEWS
+            else:
+                pull_request = {name: PULL_REQUEST[name]}
+            return {}, {"data": {"repository": {"pullRequest": pull_request}}}
+
+
+def _pull_request(request=_request):
+    g_pull = mock.Mock()
+    g_pull.head.sha = "azertyuiop"
+    g_pull.base.repo.id = REPO_ID
+    g_pull.base.repo.owner.id = OWNER_ID
+    g_pull.base.repo.get_collaborator_permission.return_value = "write"
+    g_pull._requester.requestJsonAndCheck.side_effect = request
+    return mergify_pull.MergifyPull(g=mock.Mock(), g_pull=g_pull, installation_id=123)
+
+
+def _get_queried_connections(pull_request):
+    return [
+        c[1]["input"]["query"]
+        .split("pullRequest(number: $number) {")[1]
+        .split("(")[0]
+        .strip()
+        for c in pull_request.g_pull._requester.requestJsonAndCheck.call_args_list
+    ]
+
+
+def test_consolidated_data_from_graphql():
+    pull_request = _pull_request()
+
+    d = pull_request.to_dict()
+    assert sorted(d["approved-reviews-by"]) == ["jd", "sileht"]
+    assert d["changes-requested-reviews-by"] == []
+    assert d["commented-reviews-by"] == ["mergify[bot]"]
+    # Only the reviews are retrieved, with their second page
+    assert _get_queried_connections(pull_request) == [
+        "reviews",
+        "reviews",
+    ]
+    # Only the human reviewers permission is checked
+    assert pull_request.g_pull.base.repo.get_collaborator_permission.call_count == 2
+
+    assert d["review-requested"] == ["foo", "@bar"]
+    assert d["files"] == ["README.rst"]
+    assert d["status-success"] == ["ci/a"]
+    assert d["status-failure"] == ["check/c"]
+    assert _get_queried_connections(pull_request) == [
+        "reviews",
+        "reviews",
+        "reviewRequests",
+        "files",
+        "commits",
+    ]
+    assert not pull_request.g_pull.get_reviews.called
+    assert not pull_request.g_pull.get_files.called
+
+
+def test_consolidated_data_graphql_fallback():
+    pull_request = _pull_request(
+        lambda verb, url, input: ({}, {"errors": [{"message": "Boom"}]})
+    )
+    pull_request.g_pull.get_review_requests.return_value = ([], [])
+    pull_request.g_pull.get_files.return_value = []
+    pull_request.g_pull.get_reviews.return_value = []
+    pull_request._get_checks = mock.Mock(return_value=[])
+
+    assert pull_request.to_dict()["files"] == []
+    assert pull_request.g_pull.get_files.called
+    assert not pull_request.g_pull.get_reviews.called
+
+    assert pull_request.to_dict()["status-success"] == []
+    assert pull_request._get_checks.called
@@ -0,0 +1,97 @@
+# -*- encoding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import uuid
+from unittest import mock
+
+import github
+
+from mergify_engine import http_cache
+from mergify_engine import http_pool
+
+
+def _response(status_code, headers, text=""):
+    return mock.Mock(status_code=status_code, headers=headers, text=text)
+
+
+def test_is_cacheable():
+    assert http_cache.is_cacheable("GET", "/repos/foo/bar/pulls/1/files?page=2")
+    assert http_cache.is_cacheable("GET", "/repos/foo/bar/pulls?state=open")
+    assert not http_cache.is_cacheable("GET", "/repos/foo/bar/pulls/1")
+    assert not http_cache.is_cacheable("POST", "/repos/foo/bar/issues/1/labels")
+
+
+def test_conditional_request_replayed():
+    scope = str(uuid.uuid4())
+    url = "https://api.github.com/repos/foo/bar/pulls/1/files"
+    do_request = mock.Mock(
+        side_effect=[
+            _response(200, {"ETag": '"abc"', "Link": "next"}, "[1, 2]"),
+            _response(304, {"ETag": '"abc"', "X-RateLimit-Remaining": "42"}),
+            _response(200, {"ETag": '"def"'}, "[3]"),
+        ]
+    )
+
+    r = http_cache.get(scope, 1, url, {"Accept": "foo"}, do_request)
+    assert (r.status, r.text) == (200, "[1, 2]")
+    assert do_request.call_args[0][0] == {"Accept": "foo"}
+
+    r = http_cache.get(scope, 1, url, {"Accept": "foo"}, do_request)
+    assert (r.status, r.text) == (200, "[1, 2]")
+    assert r.headers["Link"] == "next"
+    assert r.headers["X-RateLimit-Remaining"] == "42"
+    assert do_request.call_args[0][0] == {"Accept": "foo", "If-None-Match": '"abc"'}
+
+    r = http_cache.get(scope, 1, url, {"Accept": "foo"}, do_request)
+    assert (r.status, r.text) == (200, "[3]")
+
+    # Another scope never sees the cached data
+    do_request = mock.Mock(return_value=_response(200, {}, "[]"))
+    http_cache.get(scope + "-other", 1, url, {"Accept": "foo"}, do_request)
+    assert do_request.call_args[0][0] == {"Accept": "foo"}
+
+
+def test_disk_tier(tmp_path):
+    scope = str(uuid.uuid4())
+    url = "https://api.github.com/repos/foo/bar/labels"
+    do_request = mock.Mock(
+        side_effect=[
+            _response(200, {"Last-Modified": "yesterday"}, "[1]"),
+            _response(304, {}),
+        ]
+    )
+    with mock.patch("mergify_engine.config.HTTP_CACHE_DIR", str(tmp_path)):
+        http_cache.get(scope, None, url, {}, do_request)
+        assert len(list(tmp_path.iterdir())) == 1
+        with mock.patch("mergify_engine.utils.get_redis_for_cache") as redis:
+            r = http_cache.get(scope, None, url, {}, do_request)
+            assert not redis.return_value.get.called
+    assert r.text == "[1]"
+    assert do_request.call_args[0][0] == {"If-Modified-Since": "yesterday"}
+
+
+def test_pygithub_through_cache():
+    token = str(uuid.uuid4())
+    http_pool.register_installation_token(token, 1234)
+    session = mock.Mock()
+    session.request.side_effect = [
+        _response(200, {"ETag": '"abc"'}, '{"login": "foo"}'),
+        _response(304, {}),
+    ]
+    with mock.patch.object(http_pool, "get_session", return_value=session):
+        g = github.Github(token)
+        assert g.get_user("foo").login == "foo"
+        g = github.Github(token)
+        assert g.get_user("foo").login == "foo"
+    assert session.request.call_args[1]["headers"]["If-None-Match"] == '"abc"'
@@ -0,0 +1,45 @@
+# -*- encoding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+from unittest import mock
+
+import github
+
+from mergify_engine import http_pool
+
+
+def test_session_per_process():
+    http_pool.reset()
+    session = http_pool.get_session()
+    assert http_pool.get_session() is session
+    with mock.patch("os.getpid", return_value=-1):
+        assert http_pool.get_session() is not session
+    http_pool.reset()
+
+
+def test_pygithub_uses_pooled_connections():
+    session = mock.Mock()
+    session.request.return_value = mock.Mock(
+        status_code=200, headers={}, text='{"login": "foo"}'
+    )
+    with mock.patch.object(http_pool, "get_session", return_value=session):
+        g = github.Github("token")
+        assert g.get_user("foo").login == "foo"
+        g = github.Github("token")
+        assert g.get_user("bar").login == "foo"
+    assert session.request.call_count == 2
+    assert session.request.call_args[0] == (
+        "GET",
+        "https://api.github.com:443/users/bar",
+    )
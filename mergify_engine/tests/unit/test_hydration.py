@@ -0,0 +1,168 @@
+# -*- encoding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+from unittest import mock
+
+import github
+
+from mergify_engine import config
+from mergify_engine import hydration
+from mergify_engine import pull_index
+from mergify_engine import utils
+
+
+REPO_ID = 123456
+
+
+def setup_function(function):
+    utils.get_redis_for_cache().delete(hydration.PULL_CACHE_KEY % REPO_ID)
+
+
+def _pull_raw(updated_at, mergeable_state=None, sha="azertyuiop"):
+    return {
+        "number": 1,
+        "state": "open",
+        "updated_at": updated_at,
+        "mergeable_state": mergeable_state,
+        "head": {"sha": sha},
+        "base": {"repo": {"id": REPO_ID}},
+    }
+
+
+def _repo(pull_raw):
+    repo = mock.Mock(id=REPO_ID)
+    repo.get_pull.return_value = github.PullRequest.PullRequest(
+        None, {}, pull_raw, completed=True
+    )
+    return repo
+
+
+def test_get_repository_from_payload():
+    g = github.Github()
+    repo = hydration.get_repository(
+        g, {"id": REPO_ID, "full_name": "foo/bar", "private": False}
+    )
+    with mock.patch.object(g._Github__requester, "requestJsonAndCheck") as request:
+        assert repo.full_name == "foo/bar"
+        assert repo.private is False
+        assert not request.called
+
+
+def test_get_pull_freshness():
+    repo = _repo(_pull_raw("2020-01-02T00:00:00Z", "clean"))
+
+    hydration.update_caches_from_event(
+        "pull_request", {"pull_request": _pull_raw("2020-01-01T00:00:00Z", "dirty")}
+    )
+    assert (
+        hydration.get_pull(repo, 1, updated_at="2020-01-01T00:00:00Z").mergeable_state
+        == "dirty"
+    )
+    assert hydration.get_pull(repo, 1, head_sha="azertyuiop").mergeable_state == "dirty"
+    assert repo.get_pull.call_count == 0
+
+    # Outdated
+    pull = hydration.get_pull(repo, 1, updated_at="2020-01-02T00:00:00Z")
+    assert pull.mergeable_state == "clean"
+    assert repo.get_pull.call_count == 1
+
+    # The fetched one has been cached and older payload doesn't replace it
+    hydration.store_pull(_pull_raw("2020-01-01T00:00:00Z"))
+    pull = hydration.get_pull(repo, 1, updated_at="2020-01-02T00:00:00Z")
+    assert pull.mergeable_state == "clean"
+    assert repo.get_pull.call_count == 1
+
+    # Another head sha
+    hydration.get_pull(repo, 1, head_sha="new-sha")
+    assert repo.get_pull.call_count == 2
+
+
+def test_get_pull_mergeable_state():
+    repo = _repo(_pull_raw("2020-01-01T00:00:00Z", "clean"))
+    hydration.store_pull(_pull_raw("2020-01-01T00:00:00Z", None))
+    pull = hydration.get_pull(
+        repo, 1, updated_at="2020-01-01T00:00:00Z", mergeable_state=True
+    )
+    assert pull.mergeable_state == "clean"
+    assert repo.get_pull.call_count == 1
+
+    pull = hydration.get_pull(
+        repo, 1, updated_at="2020-01-01T00:00:00Z", mergeable_state=True
+    )
+    assert pull.mergeable_state == "clean"
+    assert repo.get_pull.call_count == 1
+
+    # A push on the repository invalidates everything
+    hydration.update_caches_from_event(
+        "push",
+        {"ref": "refs/heads/master", "after": "sha", "repository": {"id": REPO_ID}},
+    )
+    hydration.get_pull(repo, 1, mergeable_state=True)
+    assert repo.get_pull.call_count == 2
+
+
+def test_get_pull_mergeable_state_invalidation():
+    repo = _repo(_pull_raw("2020-01-01T00:00:00Z", "clean"))
+    r = utils.get_redis_for_cache()
+    head_sha_key = pull_index.HEAD_SHA_KEY % (REPO_ID, "azertyuiop")
+    r.delete(head_sha_key)
+    r.sadd(head_sha_key, 1)
+
+    # Statuses, checks and reviews don't change updated_at
+    events = [
+        ("status", {"sha": "azertyuiop"}),
+        (
+            "check_run",
+            {
+                "check_run": {
+                    "head_sha": "azertyuiop",
+                    "check_suite": {"pull_requests": []},
+                }
+            },
+        ),
+        (
+            "check_suite",
+            {
+                "check_suite": {
+                    "head_sha": "azertyuiop",
+                    "pull_requests": [{"number": 1}],
+                }
+            },
+        ),
+        ("pull_request_review", {"pull_request": {"number": 1}}),
+    ]
+    for i, (event_type, data) in enumerate(events):
+        data["repository"] = {"id": REPO_ID}
+        hydration.store_pull(_pull_raw("2020-01-01T00:00:00Z", "blocked"))
+        hydration.update_caches_from_event(event_type, data)
+        pull = hydration.get_pull(
+            repo, 1, updated_at="2020-01-01T00:00:00Z", mergeable_state=True
+        )
+        assert pull.mergeable_state == "clean"
+        assert repo.get_pull.call_count == i + 1
+
+    # Statuses of other commits are ignored
+    hydration.update_caches_from_event(
+        "status", {"sha": "other", "repository": {"id": REPO_ID}}
+    )
+    hydration.get_pull(repo, 1, mergeable_state=True)
+    assert repo.get_pull.call_count == len(events)
+
+    # Without the pull request index the whole repository is dropped
+    with mock.patch.object(config, "PULL_REQUEST_INDEX", False):
+        hydration.update_caches_from_event(
+            "status", {"sha": "other", "repository": {"id": REPO_ID}}
+        )
+    hydration.get_pull(repo, 1, mergeable_state=True)
+    assert repo.get_pull.call_count == len(events) + 1
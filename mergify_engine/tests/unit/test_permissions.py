@@ -0,0 +1,90 @@
+# -*- encoding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+from unittest import mock
+
+from mergify_engine import permissions
+from mergify_engine import utils
+
+
+OWNER_ID = 123
+REPO_ID = 456
+
+
+def setup_function(function):
+    utils.get_redis_for_cache().delete(permissions.PERMISSION_CACHE_KEY % OWNER_ID)
+
+
+def _repo(repo_id=REPO_ID):
+    repo = mock.Mock(id=repo_id)
+    repo.owner.id = OWNER_ID
+    repo.get_collaborator_permission.return_value = "write"
+    return repo
+
+
+def test_get_collaborator_permission():
+    repo = _repo()
+    assert permissions.get_collaborator_permission(repo, "sileht") == "write"
+    assert permissions.get_collaborator_permission(repo, "sileht") == "write"
+    assert repo.get_collaborator_permission.call_count == 1
+
+    assert permissions.get_collaborator_permission(repo, "jd") == "write"
+    assert repo.get_collaborator_permission.call_count == 2
+
+    # Expired
+    with mock.patch("time.time", return_value=2 ** 32):
+        permissions.get_collaborator_permission(repo, "sileht")
+    assert repo.get_collaborator_permission.call_count == 3
+
+
+def test_invalidation():
+    repo = _repo()
+    other_repo = _repo(REPO_ID + 1)
+    for r in (repo, other_repo):
+        for login in ("sileht", "jd"):
+            permissions.get_collaborator_permission(r, login)
+
+    permissions.update_caches_from_event(
+        "member",
+        {
+            "action": "edited",
+            "member": {"login": "sileht"},
+            "repository": {"id": REPO_ID, "owner": {"id": OWNER_ID}},
+        },
+    )
+    permissions.get_collaborator_permission(repo, "sileht")
+    permissions.get_collaborator_permission(other_repo, "sileht")
+    permissions.get_collaborator_permission(repo, "jd")
+    assert repo.get_collaborator_permission.call_count == 3
+    assert other_repo.get_collaborator_permission.call_count == 2
+
+    permissions.update_caches_from_event(
+        "membership",
+        {
+            "action": "removed",
+            "member": {"login": "jd"},
+            "organization": {"id": OWNER_ID},
+        },
+    )
+    permissions.get_collaborator_permission(repo, "jd")
+    permissions.get_collaborator_permission(other_repo, "jd")
+    permissions.get_collaborator_permission(other_repo, "sileht")
+    assert repo.get_collaborator_permission.call_count == 4
+    assert other_repo.get_collaborator_permission.call_count == 3
+
+    permissions.update_caches_from_event(
+        "organization", {"action": "member_added", "organization": {"id": OWNER_ID}}
+    )
+    permissions.get_collaborator_permission(repo, "sileht")
+    assert repo.get_collaborator_permission.call_count == 5
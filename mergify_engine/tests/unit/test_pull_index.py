@@ -0,0 +1,103 @@
+# -*- encoding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+from unittest import mock
+
+from mergify_engine import pull_index
+from mergify_engine import utils
+
+
+REPO_ID = 123456
+
+
+def setup_function(function):
+    r = utils.get_redis_for_cache()
+    for pattern in ("open-pulls*~%s*", "pull-cache~%s"):
+        for key in r.keys(pattern % REPO_ID):
+            r.delete(key)
+
+
+def _pull_raw(number, sha, head_ref, updated_at="2020-01-01T00:00:00Z", fork=False):
+    return {
+        "number": number,
+        "state": "open",
+        "updated_at": updated_at,
+        "head": {
+            "sha": sha,
+            "ref": head_ref,
+            "repo": {"id": REPO_ID + 1 if fork else REPO_ID},
+        },
+        "base": {"ref": "master", "repo": {"id": REPO_ID}},
+    }
+
+
+def _repo(*pulls_raw):
+    repo = mock.Mock(id=REPO_ID)
+    repo.get_pulls.return_value = [
+        mock.Mock(number=p["number"], raw_data=p) for p in pulls_raw
+    ]
+    return repo
+
+
+def test_lookups():
+    repo = _repo(
+        _pull_raw(1, "sha1", "feature"), _pull_raw(2, "sha2", "feature", fork=True)
+    )
+    assert pull_index.get_open_pull_numbers(repo, head_sha="sha1") == [1]
+    assert pull_index.get_open_pull_numbers(repo, base_ref="master") == [1, 2]
+    assert pull_index.get_open_pull_numbers(repo, head_ref="feature") == [1]
+    assert repo.get_pulls.call_count == 1
+
+    # Misses don't rebuild the index
+    assert pull_index.get_open_pull_numbers(repo, head_sha="unknown") == []
+    assert repo.get_pulls.call_count == 1
+
+    # Until it's outdated
+    utils.get_redis_for_cache().delete(pull_index.RECONCILED_AT_KEY % REPO_ID)
+    assert pull_index.get_open_pull_numbers(repo, head_sha="unknown") == []
+    assert repo.get_pulls.call_count == 2
+
+
+def test_update_from_events():
+    repo = _repo(_pull_raw(1, "sha1", "feature"))
+    assert pull_index.get_open_pull_numbers(repo, head_sha="sha1") == [1]
+
+    pull_index.update_caches_from_event(
+        "push",
+        {"ref": "refs/heads/feature", "after": "sha2", "repository": {"id": REPO_ID}},
+    )
+    assert pull_index.get_open_pull_numbers(repo, head_sha="sha2") == [1]
+
+    pull_index.update_caches_from_event(
+        "pull_request",
+        {
+            "pull_request": _pull_raw(
+                3, "sha3", "other", updated_at="2020-01-02T00:00:00Z"
+            )
+        },
+    )
+    assert pull_index.get_open_pull_numbers(repo, base_ref="master") == [1, 3]
+
+    closed = _pull_raw(3, "sha3", "other", updated_at="2020-01-03T00:00:00Z")
+    closed["state"] = "closed"
+    pull_index.update_caches_from_event("pull_request", {"pull_request": closed})
+    assert pull_index.get_open_pull_numbers(repo, base_ref="master") == [1]
+    assert repo.get_pulls.call_count == 1
+
+
+@mock.patch("mergify_engine.config.PULL_REQUEST_INDEX", False)
+def test_disabled():
+    repo = _repo(_pull_raw(1, "sha1", "feature"))
+    assert pull_index.get_open_pull_numbers(repo, head_sha="sha1") is None
+    assert not repo.get_pulls.called
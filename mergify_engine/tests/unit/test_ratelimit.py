@@ -0,0 +1,71 @@
+# -*- encoding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import time
+from unittest import mock
+
+from mergify_engine import ratelimit
+from mergify_engine import utils
+from mergify_engine.tasks import mergify_events
+
+
+INSTALLATION_ID = 123456
+
+
+def setup_function(function):
+    utils.get_redis_for_cache().delete(ratelimit.RATELIMIT_KEY % INSTALLATION_ID)
+
+
+def _headers(remaining, reset):
+    return {
+        "X-RateLimit-Remaining": str(remaining),
+        "X-RateLimit-Limit": "5000",
+        "X-RateLimit-Reset": str(int(reset)),
+    }
+
+
+def test_record():
+    assert ratelimit.get(INSTALLATION_ID) is None
+    assert ratelimit.get_low_budget_delay(INSTALLATION_ID) == 0
+
+    reset = time.time() + 600
+    ratelimit.record(INSTALLATION_ID, _headers(4000, reset))
+    assert ratelimit.get(INSTALLATION_ID) == {
+        "remaining": 4000,
+        "limit": 5000,
+        "reset": int(reset),
+    }
+    assert ratelimit.get_low_budget_delay(INSTALLATION_ID) == 0
+
+    ratelimit.record(INSTALLATION_ID, _headers(10, reset))
+    assert 590 <= ratelimit.get_low_budget_delay(INSTALLATION_ID) <= 600
+
+    # Missing headers or outdated reset are ignored
+    ratelimit.record(INSTALLATION_ID, {})
+    ratelimit.record(INSTALLATION_ID, _headers(5000, time.time() - 10))
+    assert ratelimit.get(INSTALLATION_ID)["remaining"] == 10
+
+
+@mock.patch("mergify_engine.github_app.get_installation_id")
+@mock.patch("mergify_engine.github_app.get_installation_token")
+@mock.patch.object(mergify_events.job_refresh, "s")
+def test_refresh_deferred(refresh_s, get_installation_token, get_installation_id):
+    get_installation_id.return_value = INSTALLATION_ID
+    ratelimit.record(INSTALLATION_ID, _headers(10, time.time() + 600))
+
+    mergify_events.job_refresh("owner", "repo", "branch", "master")
+
+    refresh_s.assert_called_once_with("owner", "repo", "branch", "master")
+    assert refresh_s.return_value.apply_async.call_args[1]["countdown"] > 500
+    assert not get_installation_token.called
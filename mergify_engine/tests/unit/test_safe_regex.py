@@ -0,0 +1,114 @@
+# -*- encoding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+import re
+import threading
+from unittest import mock
+
+import pytest
+
+import voluptuous
+
+from mergify_engine import safe_regex
+from mergify_engine.actions import copy
+
+
+def test_unsafe():
+    for pattern in (
+        r"(a+)+$",
+        r"(a*)*b",
+        r"(x+x+)+y",
+        r"(\w+\s?)+$",
+        r"(.*,)+x",
+        r"(a|a)+$",
+        r"(a|aa)+$",
+        r"(?:x|x?)+y",
+        r"^(([a-z])+.)+[A-Z]([a-z])+$",
+        r"^(a?){25}(a){25}$",
+        r"^foo/(?=(\d+)*$)",
+        r"\s*\s*\s*\s*\s*\s*x",
+        r".*.*.*=.*",
+        r"^\w+-?\w*_?[a-z]+$",
+    ):
+        with pytest.raises(safe_regex.UnsafeRegex):
+            safe_regex.compile(pattern)
+
+
+def test_safe():
+    for pattern in (
+        r"^docs/",
+        r"\.py$",
+        r"(?i)^\[wip\]",
+        r"^(foo|bar)/",
+        r"(ab)+",
+        r"(a?b)+",
+        r"(\d+\.)+\d+",
+        r"^v\d+(\.\d+){0,2}$",
+        r"^(release|hotfix)/[0-9]+(\.[0-9]+)*$",
+        r"[a-z]+(-[a-z]+)*",
+        r".*foo.*bar",
+        r".*=.*",
+        r"^\d+\s*[a-z]+$",
+    ):
+        assert safe_regex.compile(pattern).pattern == pattern
+
+
+def test_invalid():
+    with pytest.raises(re.error):
+        safe_regex.compile("(foo")
+
+
+def test_cpu_budget():
+    regex = safe_regex.compile("^foo")
+    with mock.patch("time.thread_time", side_effect=[0, 0.5, 2]):
+        with safe_regex.cpu_budget(1.5):
+            assert regex.search("foobar")
+            with pytest.raises(safe_regex.RegexTimeout):
+                regex.match("foobar")
+    assert regex.search("foobar")
+
+
+def test_cpu_budget_interrupts_search():
+    # NOTE(sileht): Accepted, but each .* backtracks over all the others
+    regex = safe_regex.compile(r".*a.*a.*a.*a.*a.*b")
+    with safe_regex.cpu_budget(0.1):
+        with pytest.raises(safe_regex.RegexTimeout):
+            regex.search("a" * 1000)
+        # The budget is exhausted
+        with pytest.raises(safe_regex.RegexTimeout):
+            regex.search("b")
+    assert regex.search("aaaaab")
+
+
+def test_cpu_budget_other_thread():
+    regex = safe_regex.compile("^foo")
+    results = []
+
+    def search(string):
+        try:
+            with safe_regex.cpu_budget(1):
+                results.append(bool(regex.search(string)))
+        except safe_regex.RegexTimeout:
+            results.append(None)
+
+    for string in ("foo", "foo" * safe_regex.MAX_UNINTERRUPTIBLE_LENGTH):
+        thread = threading.Thread(target=search, args=(string,))
+        thread.start()
+        thread.join()
+    assert results == [True, None]
+
+
+def test_copy_regexes():
+    with pytest.raises(voluptuous.Invalid):
+        copy.Regex("^(a+)+$")
+    assert copy.Regex("^stable/") == "^stable/"
@@ -0,0 +1,99 @@
+# -*- encoding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+from unittest import mock
+from urllib import parse
+
+from mergify_engine import check_api
+from mergify_engine import config
+from mergify_engine import mergify_pull
+
+REPO_URL = "https://api.github.com/repos/mergifyio/test"
+SHA = "azertyuiop"
+CONTEXTS = 10
+UPDATES = 500
+
+
+def _paginate(url, parameters, items, list_item=None):
+    query = dict(parse.parse_qsl(parse.urlparse(url).query))
+    query.update(parameters or {})
+    per_page = int(query.get("per_page", 30))
+    page = int(query.get("page", 1))
+
+    headers = {}
+    if page * per_page < len(items):
+        headers["link"] = '<%s?page=%d&per_page=%d>; rel="next"' % (
+            url.partition("?")[0],
+            page + 1,
+            per_page,
+        )
+    data = items[(page - 1) * per_page : page * per_page]
+    if list_item is not None:
+        data = {"total_count": len(items), list_item: data}
+    return headers, data
+
+
+def _pull_request():
+    # NOTE(sileht): Each context is updated 50 times, the newest status is
+    # returned first
+    statuses = [
+        {"context": "ci/%d" % (i % CONTEXTS), "state": "pending"}
+        for i in range(UPDATES)
+    ]
+    for status in statuses[:CONTEXTS]:
+        status["state"] = "success"
+
+    def request(verb, url, parameters=None, headers=None):
+        if url.startswith(REPO_URL + "/commits/%s/statuses" % SHA):
+            return _paginate(url, parameters, statuses)
+        elif url.startswith(REPO_URL + "/commits/%s/status" % SHA):
+            return _paginate(url, parameters, statuses[:CONTEXTS], "statuses")
+        elif url.startswith(REPO_URL + "/commits/%s/check-runs" % SHA):
+            return _paginate(url, parameters, [], "check_runs")
+        raise RuntimeError("unexpected url %s" % url)
+
+    g_pull = mock.Mock()
+    g_pull.base.repo.url = REPO_URL
+    g_pull.base.repo._requester = g_pull._requester
+    g_pull.head.sha = SHA
+    g_pull._requester.per_page = 30
+    g_pull._requester.requestJsonAndCheck.side_effect = request
+    return mergify_pull.MergifyPull(g=mock.Mock(), g_pull=g_pull, installation_id=123)
+
+
+def test_get_checks_api_calls():
+    calls = {}
+    for latest in (False, True):
+        with mock.patch.object(config, "LATEST_STATUSES_AND_CHECKS", latest):
+            pull_request = _pull_request()
+            checks = pull_request._get_checks()
+        assert sorted(checks) == sorted(
+            mergify_pull.GenericCheck("ci/%d" % i, "success") for i in range(CONTEXTS)
+        )
+        calls[latest] = pull_request.g_pull._requester.requestJsonAndCheck.call_count
+
+    # 17 pages of statuses + 1 of check runs versus 1 + 1
+    assert calls == {False: 18, True: 2}
+
+
+def test_get_checks_for_ref_parameters():
+    repo = mock.Mock(url=REPO_URL)
+    repo._requester.per_page = 30
+    repo._requester.requestJsonAndCheck.return_value = ({}, {"check_runs": []})
+    assert check_api.get_checks_for_ref(repo, SHA, {"check_name": "foo"}) == []
+    assert repo._requester.requestJsonAndCheck.call_args[1]["parameters"] == {
+        "check_name": "foo",
+        "filter": "latest",
+        "per_page": 100,
+    }
@@ -0,0 +1,74 @@
+# -*- encoding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+from unittest import mock
+
+from mergify_engine import mergify_pull
+from mergify_engine import teams
+from mergify_engine import utils
+
+
+def setup_function(function):
+    utils.get_redis_for_cache().delete(teams.TEAM_MEMBERS_CACHE_KEY % "mergifyio")
+
+
+def _g():
+    team = mock.Mock()
+    team.slug = "devs"
+    team.get_members.return_value = [mock.Mock(login="sileht"), mock.Mock(login="jd")]
+    g = mock.Mock()
+    g.get_organization.return_value.get_teams.return_value = [team]
+    return g, team
+
+
+def test_get_team_members():
+    g, team = _g()
+    assert teams.get_team_members(g, "Mergifyio", "devs") == ["sileht", "jd"]
+    assert teams.get_team_members(g, "mergifyio", "devs") == ["sileht", "jd"]
+    assert teams.get_team_members(g, "mergifyio", "unknown") is None
+    assert teams.get_team_members(g, "mergifyio", "unknown") is None
+    assert team.get_members.call_count == 1
+    assert g.get_organization.call_count == 2
+
+    teams.update_caches_from_event(
+        "membership",
+        {
+            "action": "removed",
+            "scope": "team",
+            "team": {"slug": "devs"},
+            "organization": {"login": "Mergifyio"},
+        },
+    )
+    teams.get_team_members(g, "mergifyio", "devs")
+    teams.get_team_members(g, "mergifyio", "unknown")
+    assert team.get_members.call_count == 2
+    assert g.get_organization.call_count == 3
+
+    teams.update_caches_from_event(
+        "team", {"action": "created", "organization": {"login": "mergifyio"}}
+    )
+    teams.get_team_members(g, "mergifyio", "unknown")
+    assert g.get_organization.call_count == 4
+
+
+def test_resolve_teams_is_memoized():
+    g, team = _g()
+    pull_request = mergify_pull.MergifyPull(
+        g=g, g_pull=mock.Mock(), installation_id=123
+    )
+    values = ["@mergifyio/devs", "foo", "@mergifyio/devs"]
+    assert pull_request.resolve_teams(values) == ["sileht", "jd", "foo", "sileht", "jd"]
+    with mock.patch.object(teams, "get_team_members") as get_team_members:
+        assert pull_request.resolve_teams("@mergifyio/devs") == ["sileht", "jd"]
+        assert not get_team_members.called
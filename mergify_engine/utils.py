@@ -33,9 +33,8 @@ import github
 import redis
 from billiard import current_process
 
-import requests
-
 from mergify_engine import config
+from mergify_engine import http_pool
 
 LOG = daiquiri.getLogger(__name__)
 
@@ -129,7 +128,7 @@ def get_installations(integration):  # pragma: no cover
     installs = []
     url = "https://api.%s/app/installations" % config.GITHUB_DOMAIN
     token = "Bearer {}".format(integration.create_jwt())
-    session = requests.Session()
+    session = http_pool.get_session()
     while True:
         response = session.get(
             url,
@@ -173,7 +172,7 @@ def get_installation_id(integration, owner, repo=None, account_type=None):
             owner,
         )
     token = "Bearer {}".format(integration.create_jwt())
-    response = requests.get(
+    response = http_pool.get_session().get(
         url,
         headers={
             "Authorization": token,
@@ -194,15 +193,6 @@ def get_installation_id(integration, owner, repo=None, account_type=None):
     raise github.GithubException(status=response.status_code, data=response.text)
 
 
-def get_installation_token(installation_id):
-    integration = github.GithubIntegration(config.INTEGRATION_ID, config.PRIVATE_KEY)
-    try:
-        return integration.get_access_token(installation_id).token
-    except github.UnknownObjectException:  # pragma: no cover
-        LOG.error("token for install %d does not exists anymore", installation_id)
-        return
-
-
 def get_github_pulls_from_sha(repo, sha):
     try:
         return list(
@@ -34,6 +34,7 @@ import github
 import voluptuous
 
 from mergify_engine import config
+from mergify_engine import github_app
 from mergify_engine import mergify_pull
 from mergify_engine import rules
 from mergify_engine import utils
@@ -145,15 +146,14 @@ def PullRequestUrl(v):
     _, owner, repo, _, pull_number = urlsplit(v).path.split("/")
     pull_number = int(pull_number)
 
-    integration = github.GithubIntegration(config.INTEGRATION_ID, config.PRIVATE_KEY)
     try:
-        installation_id = utils.get_installation_id(integration, owner, repo)
+        installation_id = github_app.get_installation_id(owner, repo)
     except github.GithubException:
         raise PullRequestUrlInvalid(
             message="Mergify not installed on repository '%s'" % owner
         )
 
-    token = integration.get_access_token(installation_id).token
+    token = github_app.get_installation_token(installation_id)
     try:
         return mergify_pull.MergifyPull.from_number(
             installation_id, token, owner, repo, pull_number
@@ -216,7 +216,17 @@ def simulator():
     title, summary = actions_runner.gen_summary(
         "refresh", raw_event, pull_request, match
     )
-    return flask.jsonify({"title": title, "summary": summary}), 200
+    failed_rules = [
+        {"name": rule["name"], "pattern": pattern}
+        for rule, pattern in match.failed_rules
+        if not rule["hidden"]
+    ]
+    return (
+        flask.jsonify(
+            {"title": title, "summary": summary, "failed_rules": failed_rules}
+        ),
+        200,
+    )
 
 
 @app.route("/marketplace", methods=["POST"])
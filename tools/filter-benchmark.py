@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+# Measure the evaluation of the conditions of a typical configuration
+# against the attributes of a pull request.
+#
+# Usage: MERGIFYENGINE_TEST_SETTINGS=fake.env python tools/filter-benchmark.py
+
+import timeit
+
+from mergify_engine import rules
+
+CONDITIONS = [
+    "base=master",
+    "-base~=^stable/",
+    "head~=^feature/",
+    "label=ready-to-merge",
+    "-label=WIP",
+    "#approved-reviews-by>=2",
+    "approved-reviews-by=@devs",
+    "#changes-requested-reviews-by=0",
+    "status-success=ci/travis",
+    "status-success=ci/circleci",
+    "-status-failure~=^ci/",
+    "files~=^docs/",
+    "-files~=\\.py$",
+    "author!=dependabot[bot]",
+    "-closed",
+    "-conflict",
+]
+
+VALUES = {
+    "base": "master",
+    "head": "feature/foobar",
+    "label": ["ready-to-merge", "enhancement"],
+    "approved-reviews-by": ["sileht", "jd"],
+    "changes-requested-reviews-by": [],
+    "status-success": ["ci/travis", "ci/circleci", "ci/other"],
+    "status-failure": [],
+    "files": ["mergify_engine/%d.py" % i for i in range(50)] + ["docs/index.rst"],
+    "author": "someone",
+    "closed": False,
+    "conflict": False,
+}
+
+
+def main():
+    conditions = rules.PullRequestRules(
+        [{"name": "bench", "conditions": CONDITIONS, "actions": {}}]
+    ).rules[0]["conditions"]
+    expanders = {"approved-reviews-by": lambda value: ["sileht", "jd"]}
+
+    def evaluate():
+        for condition in conditions:
+            condition.evaluate(VALUES, expanders)
+
+    number = 20000
+    duration = min(timeit.repeat(evaluate, number=number, repeat=5))
+    print(
+        "%d conditions: %.2f µs per evaluation of the configuration"
+        % (len(conditions), duration / number * 1e6)
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+# Measure the parsing of the conditions of a 1000 conditions configuration
+# with pyparsing, the hand-written parser and the parse cache.
+#
+# Usage: MERGIFYENGINE_TEST_SETTINGS=fake.env python tools/parser-benchmark.py
+
+import timeit
+
+from mergify_engine.rules import parser
+
+TEMPLATES = [
+    "base=branch-%d",
+    "-head~=^feature/%d",
+    "label=ready-%d",
+    "-label=WIP %d",
+    "#approved-reviews-by>=%d",
+    "approved-reviews-by=@org/team-%d",
+    "author!=user%d",
+    "status-success=ci/job-%d",
+    "-status-failure~=^ci/%d",
+    "files~=^docs/%d/",
+    "milestone=v%d",
+    "commits<=%d",
+    "title~=^\\[%d\\]",
+    "status-success='quoted ci %d'",
+    "-closed",
+    "-conflict",
+]
+
+
+def _get_condition(i):
+    template = TEMPLATES[i % len(TEMPLATES)]
+    # NOTE(sileht): Booleans are repeated as-is
+    return template % i if "%d" in template else template
+
+
+CONDITIONS = [_get_condition(i) for i in range(1000)]
+
+
+def main():
+    def with_pyparsing():
+        for condition in CONDITIONS:
+            parser.search.parseString(condition, parseAll=True)
+
+    def without_cache():
+        parser.parse.cache_clear()
+        for condition in CONDITIONS:
+            parser.parse(condition)
+
+    def with_cache():
+        for condition in CONDITIONS:
+            parser.parse(condition)
+
+    for name, func in (
+        ("pyparsing", with_pyparsing),
+        ("hand-written parser", without_cache),
+        ("parse cache", with_cache),
+    ):
+        duration = min(timeit.repeat(func, number=3, repeat=3)) / 3
+        print("%s: %.2f ms for %d conditions" % (name, duration * 1e3, len(CONDITIONS)))
+
+
+if __name__ == "__main__":
+    main()